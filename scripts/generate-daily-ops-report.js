@@ -12,6 +12,9 @@ const CONTACT_EVENT_TYPES = [
   'contact_booking_click',
 ];
 
+// outreach_runs scripts whose totals.sent are first-touch outreaches.
+const OUTREACH_SEND_SCRIPTS = ['daily_outreach_db', 'outreach_cities'];
+
 const parseArgs = () => {
   const args = process.argv.slice(2);
   const parsed = {};
@@ -172,6 +175,31 @@ const selectWithChunkedIn = async ({
   return rows;
 };
 
+const sumOutreachRuns = async ({ supabase, startIso, endIso }) => {
+  const { data, error } = await supabase
+    .from('outreach_runs')
+    .select('script, totals')
+    .gte('started_at', startIso)
+    .lt('started_at', endIso);
+
+  if (error) {
+    throw new Error(`Failed to load outreach runs: ${error.message}`);
+  }
+
+  let outreaches = 0;
+  let followUps = 0;
+  for (const run of data || []) {
+    const sent = toNumber(run.totals?.sent, 0);
+    if (OUTREACH_SEND_SCRIPTS.includes(run.script)) {
+      outreaches += sent;
+    } else if (run.script === 'followup_sequence') {
+      followUps += sent;
+    }
+  }
+
+  return { outreaches, followUps };
+};
+
 const loadPrimaryMetro = (rootDir) => {
   const configPath = path.resolve(rootDir, 'docs', 'ops', 'primary-metro.json');
   if (!fs.existsSync(configPath)) {
@@ -223,8 +251,8 @@ const main = async () => {
     throw new Error(`Invalid activity_date for timezone ${zone}: ${activityDate}`);
   }
 
-  const outreachCount = toNumber(args.outreaches || process.env.OPS_OUTREACHES, 0);
-  const followUpCount = toNumber(args.follow_ups || process.env.OPS_FOLLOW_UPS, 0);
+  const manualOutreaches = args.outreaches || process.env.OPS_OUTREACHES;
+  const manualFollowUps = args.follow_ups || process.env.OPS_FOLLOW_UPS;
 
   const start = activityStartInZone.toUTC();
   const end = start.plus({ days: 1 });
@@ -243,6 +271,14 @@ const main = async () => {
     },
   });
 
+  // Sent counts come from the outreach scripts' per-run rows unless given by hand.
+  const outreachRuns =
+    manualOutreaches && manualFollowUps
+      ? null
+      : await sumOutreachRuns({ supabase, startIso, endIso });
+  const outreachCount = manualOutreaches ? toNumber(manualOutreaches, 0) : outreachRuns.outreaches;
+  const followUpCount = manualFollowUps ? toNumber(manualFollowUps, 0) : outreachRuns.followUps;
+
   const { data: location, error: locationError } = await supabase
     .from('locations')
     .select('id, city, state, country')
@@ -494,7 +530,7 @@ const main = async () => {
     `- Contact actions (7d) target: ${contactActionsSevenDay}/10`,
     '',
     '## Notes',
-    '- Growth outreach counts are manual inputs (`--outreaches`, `--follow_ups`) until CRM integration exists.',
+    '- Growth outreach counts are the sends recorded in outreach_runs for the window; `--outreaches` / `--follow_ups` override them.',
     '- Onboarded provider count is based on unique profiles that created listings in the activity window.',
     '',
   ];
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Wire check for the forwarder's streamed forwards (large messages).
+
+Spools a synthetic original of each --sizes byte count (with lines that
+start with '.', long lines and binary bytes), sends it through
+forward_inbox.send_streamed_forward over real smtplib to a local SMTP sink,
+and checks what arrived:
+
+  - no bare LF anywhere in the DATA (strict MTAs reject those)
+  - the forward's MIME structure parses without defects
+  - the message/rfc822 attachment decodes to exactly the spooled original
+
+Usage:
+  python scripts/outreach/bench/bench_forward_stream.py
+  python scripts/outreach/bench/bench_forward_stream.py --sizes 57,58336,5000000
+"""
+
+import argparse
+import base64
+import os
+import random
+import re
+import smtplib
+import sys
+import tempfile
+import time
+from email import policy
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forward_inbox  # noqa: E402
+from fake_services import SmtpSink  # noqa: E402
+
+CFG = {
+    'sender_name': 'Bench Forwarder',
+    'reply_to': 'hello@dommedirectory.bench',
+    'forward_to': 'owner@inbox.bench',
+}
+
+BARE_LF = re.compile(rb'(?<!\r)\n')
+
+
+def make_original(size: int, rng: random.Random) -> bytes:
+    """A reply of exactly `size` bytes: headers, text with dot lines, binary tail."""
+    head = (b'From: Provider <provider@example.bench>\r\n'
+            b'To: hello@dommedirectory.bench\r\n'
+            b'Subject: Re: permission request\r\n'
+            b'MIME-Version: 1.0\r\n'
+            b'Content-Type: text/plain; charset=utf-8\r\n\r\n')
+    lines = []
+    while sum(map(len, lines)) < size:
+        kind = rng.randrange(4)
+        if kind == 0:
+            lines.append(b'.\r\n' if rng.random() < 0.5 else b'.. dot-led line\r\n')
+        elif kind == 1:
+            lines.append(b'x' * rng.randrange(1, 2000) + b'\n')
+        else:
+            lines.append(bytes(rng.randrange(256) for _ in range(rng.randrange(1, 200))))
+    return (head + b''.join(lines))[:size]
+
+
+def check(size: int, sink: SmtpSink, rng: random.Random) -> list:
+    """Send one streamed forward of a `size`-byte original; returns the problems found."""
+    original = make_original(size, rng)
+    with tempfile.TemporaryFile() as spool:
+        spool.write(original)
+        parsed, _ = forward_inbox.parse_prefix(original[:forward_inbox.CLASSIFY_PREFIX_BYTES])
+        fwd = forward_inbox.build_forward(CFG, parsed)
+        with smtplib.SMTP('127.0.0.1', sink.port, timeout=30) as smtp:
+            forward_inbox.send_streamed_forward(smtp, CFG, fwd, spool)
+    raw = sink.raw[-1]
+
+    problems = []
+    bare = len(BARE_LF.findall(raw))
+    if bare:
+        problems.append(f'{bare} bare LF')
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    # Only the forward's own structure: the parser reads the base64 text of
+    # the attachment as a nested message and flags that.
+    defects = message.defects + [d for part in message.iter_parts() for d in part.defects]
+    if defects:
+        problems.append(f'MIME defects {defects}')
+    attachments = [p for p in message.iter_attachments() if p.get_filename() == 'original.eml']
+    if len(attachments) != 1:
+        problems.append(f'{len(attachments)} original.eml attachments')
+    else:
+        # The parser keeps a base64 message/rfc822 body as undecoded text.
+        encoded = attachments[0].get_payload()[0].get_payload()
+        if base64.b64decode(encoded) != original:
+            problems.append('attachment differs from the spooled original')
+    print(f'bench_forward_stream: size={size} wire_bytes={len(raw)} '
+          f"result={'; '.join(problems) or 'ok'}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1,56,57,58,58368,1048577,3000000',
+                        help='comma-separated original sizes in bytes')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sink = SmtpSink(keep=True).start()
+    failed = 0
+    started = time.perf_counter()
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            failed += bool(check(size, sink, rng))
+    finally:
+        sink.shutdown()
+    print(f'bench_forward_stream: forwards={sink.messages} seconds={time.perf_counter() - started:.1f}')
+    if failed:
+        raise SystemExit(f'bench_forward_stream: {failed} forwards failed the wire check')
+    print('bench_forward_stream: ok')
+
+
+if __name__ == '__main__':
+    main()
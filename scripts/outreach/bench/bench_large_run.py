@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Memory check for build_delivery_queues.py on a very large tracker.
+
+Writes a synthetic tracker of --rows not_contacted rows (default 100,000)
+pointing at the fake_services.py provider sites, with some platform-only
+and website-less rows mixed in, then runs build_delivery_queues.py
+--large-run on it, with stage tracing on as in the daily workflow, and
+samples the process's RSS from /proc every --interval seconds. The run passes when RSS after the first tenth of the
+run stays within --max-growth-mb of the peak during that warm-up.
+
+--baseline runs the default (in-memory) mode on the same tracker first, for
+comparison. Linux only (reads /proc/<pid>/status).
+
+Usage:
+  python scripts/outreach/bench/bench_large_run.py
+  python scripts/outreach/bench/bench_large_run.py --rows 20000 --baseline
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_services import ProviderSites
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(os.path.dirname(HERE), 'build_delivery_queues.py')
+
+
+def write_tracker(path: str, sites: ProviderSites, rows: int):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['listing_id', 'title', 'listing_url', 'seed_contact_website', 'seed_source_url',
+                    'response_status'])
+        for n in range(rows):
+            if n % 10 == 0:
+                website = f'https://onlyfans.com/provider{n}'
+            elif n % 10 == 5:
+                website = ''
+            else:
+                website = sites.url(n)
+            # Titles in scrambled order, so the buckets really get sorted.
+            title = f'Provider {(n * 7919) % rows:07d}'
+            w.writerow([f'listing-{n}', title, f'https://dommedirectory.com/l/{n}', website,
+                        f'https://seeds.bench/{n}', 'not_contacted'])
+
+
+def rss_kb(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def run(label: str, tracker: str, out_dir: str, extra: list, interval: float):
+    """Run the script and return (seconds, [(elapsed, rss_kb), ...])."""
+    os.makedirs(out_dir, exist_ok=True)
+    env = dict(os.environ, NO_PROXY='*', OUTREACH_TRACE_DIR=os.path.join(out_dir, 'traces'),
+               OUTREACH_PROFILE_DIR='')
+    cmd = [sys.executable, SCRIPT, '--tracker', tracker, '--out-dir', out_dir] + extra
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    samples = []
+    while proc.poll() is None:
+        rss = rss_kb(proc.pid)
+        if rss:
+            samples.append((time.perf_counter() - started, rss))
+        time.sleep(interval)
+    out, err = proc.communicate()
+    seconds = time.perf_counter() - started
+    if proc.returncode != 0:
+        print(err[-4000:], file=sys.stderr)
+        raise SystemExit(f'bench_large_run: {label} failed with exit code {proc.returncode}')
+    print(f'bench_large_run: mode={label} {out.strip()}')
+    return seconds, samples
+
+
+def report(label: str, rows: int, seconds: float, samples: list) -> float:
+    """Print the RSS profile of one run; returns MB grown after warm-up."""
+    if not samples:
+        print(f'bench_large_run: mode={label} no RSS samples')
+        return 0.0
+    cut = seconds / 10
+    warm = max([rss for t, rss in samples if t <= cut] or [samples[0][1]])
+    rest = [rss for t, rss in samples if t > cut] or [warm]
+
+    def at(fraction):
+        t_mark = seconds * fraction
+        return min(samples, key=lambda s: abs(s[0] - t_mark))[1] / 1024
+
+    growth = (max(rest) - warm) / 1024
+    print(f'bench_large_run: mode={label} rows={rows} seconds={seconds:.1f} rows_per_min={rows / seconds * 60:,.0f} '
+          f'rss_mb_10%={at(0.1):.1f} rss_mb_50%={at(0.5):.1f} rss_mb_90%={at(0.9):.1f} '
+          f'peak_mb={max(s[1] for s in samples) / 1024:.1f} growth_after_warmup_mb={growth:.1f}')
+    return growth
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--interval', type=float, default=0.25, help='seconds between RSS samples')
+    parser.add_argument('--max-growth-mb', type=float, default=16.0)
+    parser.add_argument('--baseline', action='store_true', help='also run the in-memory mode')
+    parser.add_argument('--keep', action='store_true', help='keep the tracker and output directory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='outreach-large-run-')
+    sites = ProviderSites(slow_seconds=0).start()
+    try:
+        tracker = os.path.join(workdir, 'tracker.csv')
+        write_tracker(tracker, sites, args.rows)
+        print(f'bench_large_run: tracker={tracker} rows={args.rows} '
+              f'bytes={os.path.getsize(tracker):,}')
+
+        if args.baseline:
+            seconds, samples = run('default', tracker, os.path.join(workdir, 'default'), [], args.interval)
+            report('default', args.rows, seconds, samples)
+
+        seconds, samples = run('large-run', tracker, os.path.join(workdir, 'large'), ['--large-run'],
+                               args.interval)
+        growth = report('large-run', args.rows, seconds, samples)
+    finally:
+        sites.shutdown()
+        if args.keep:
+            print(f'bench_large_run: files in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if growth > args.max_growth_mb:
+        raise SystemExit(f'bench_large_run: RSS grew {growth:.1f} MB after warm-up '
+                         f'(limit {args.max_growth_mb} MB)')
+    print('bench_large_run: rss flat')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Parity and speed check for the page_analysis parse modes.
+
+Runs every page in bench/pages/ through analyze_page in full mode
+(html.parser, whole document) and in selective mode (SoupStrainer over
+<a>/<form>, with html.parser and, when installed, lxml). Prints any page
+whose result differs from full mode, then times each mode over the pages
+repeated --repeat times.
+
+The bundled pages are small hand-written fixtures of common provider
+layouts (WordPress + CF7, Wix, Squarespace, nested and malformed forms),
+not captured sites. They cover the parity edge cases, but they have none
+of the heavy scripts and deep nesting of real pages, so the timings they
+give say little about production. Parity and speed on real provider pages
+have not been checked yet. Capture a representative set with --fetch
+before switching OUTREACH_PARSE_MODE. Pages are written as-is, so remove
+names, emails and phone numbers before committing them.
+
+Usage:
+  python scripts/outreach/bench/bench_page_parse.py
+  python scripts/outreach/bench/bench_page_parse.py --repeat 200 --strict
+  python scripts/outreach/bench/bench_page_parse.py --fetch https://example.com/contact
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from page_analysis import FAST_PARSER, analyze_page  # noqa: E402
+
+DEFAULT_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+BASE_URL = 'https://provider.example/'
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; DommeDirectoryOutreach/1.0; +https://dommedirectory.com)'
+}
+
+
+def load_pages(path: str):
+    pages = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(path, name), 'rb') as f:
+            pages.append((name, f.read()))
+    return pages
+
+
+def fetch_page(url: str, path: str) -> str:
+    resp = requests.get(url, headers=HEADERS, timeout=25, allow_redirects=True)
+    resp.raise_for_status()
+    u = urlparse(resp.url)
+    name = re.sub(r'[^a-z0-9]+', '_', (u.netloc + u.path).lower()).strip('_') + '.html'
+    with open(os.path.join(path, name), 'wb') as f:
+        f.write(resp.content)
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', default=DEFAULT_PAGES)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--fetch', action='append', default=[], help='save a live page into --pages first')
+    parser.add_argument('--strict', action='store_true', help='exit 1 if any mode disagrees with full mode')
+    args = parser.parse_args()
+
+    for url in args.fetch:
+        print(f'bench_page_parse: saved {fetch_page(url, args.pages)}')
+
+    pages = load_pages(args.pages)
+    modes = [('full', 'html.parser'), ('selective', 'html.parser')]
+    if FAST_PARSER != 'html.parser':
+        modes.append(('selective', FAST_PARSER))
+
+    baseline = {name: analyze_page(body, None, BASE_URL) for name, body in pages}
+
+    mismatches = 0
+    for mode, backend in modes[1:]:
+        for name, body in pages:
+            got = analyze_page(body, None, BASE_URL, mode=mode, parser=backend)
+            if got == baseline[name]:
+                continue
+            mismatches += 1
+            diff = [k for k in baseline[name] if got[k] != baseline[name][k]]
+            print(f'  mismatch: mode={mode} parser={backend} page={name} keys={",".join(diff)}')
+
+    total_bytes = sum(len(body) for _, body in pages)
+    timings = {}
+    for mode, backend in modes:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for _, body in pages:
+                analyze_page(body, None, BASE_URL, mode=mode, parser=backend)
+        timings[(mode, backend)] = time.perf_counter() - start
+
+    base_time = timings[modes[0]]
+    print(f'bench_page_parse: pages={len(pages)} bytes={total_bytes} repeat={args.repeat} mismatches={mismatches}')
+    for (mode, backend), elapsed in timings.items():
+        per_page = elapsed / (len(pages) * args.repeat) * 1000 if pages else 0.0
+        speedup = base_time / elapsed if elapsed else float('inf')
+        print(f'bench_page_parse: mode={mode} parser={backend} seconds={elapsed:.3f} '
+              f'ms_per_page={per_page:.2f} speedup={speedup:.2f}x')
+
+    if args.strict and mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
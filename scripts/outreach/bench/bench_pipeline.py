@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Offline throughput benchmark for the DB-backed outreach pipeline.
+
+Starts the stand-ins from fake_services.py (synthetic provider sites, an
+SMTP sink and an in-memory PostgREST), seeds outreach_contacts, then runs
+the real entry points against them, in the same order as the daily
+workflow:
+
+  build_delivery_queues_db.py   classify()
+  daily_outreach_db.py          probe/deliver (process_candidate)
+  followup_sequence.py          day-4 / day-10 sender
+
+Each script runs with OUTREACH_TRACE_DIR set, so the report combines wall
+time (candidates/minute) with the per-stage p50/p95/max from its trace
+rollup. Pacing sleeps are disabled; nothing leaves 127.0.0.1.
+
+With --cities N the sites are spread over N cities (half of them in one
+big metro) and outreach_cities.py replaces the first two scripts, so the
+report includes its per-city counts.
+
+--smtp-cap N sets OUTREACH_SMTP_DAILY_CAP, backed by Python stand-ins for
+the send-quota RPCs, and reports the ledger's committed/reserved counts.
+
+--db-latency-ms adds a round trip to every PostgREST request, so database
+writes cost about what they do against the hosted project.
+
+Usage:
+  python scripts/outreach/bench/bench_pipeline.py
+  python scripts/outreach/bench/bench_pipeline.py --sites 2000 --send 500 --parse-workers -1
+  python scripts/outreach/bench/bench_pipeline.py --cities 6 --send 120
+  python scripts/outreach/bench/bench_pipeline.py --send 100 --followups 100 --smtp-cap 120
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fake_services import SITE_KINDS, Postgrest, ProviderSites, SmtpSink, self_signed_cert
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.dirname(HERE)
+
+# create_client only checks that the key looks like a JWT.
+BENCH_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.YmVuY2g'
+
+
+def city_of(n: int, cities: int) -> str:
+    if cities <= 1:
+        return 'benchville'
+    # Half of the sites are in one big metro, the rest spread evenly.
+    return 'bigmetro' if n % 2 == 0 else f'city{(n // 2) % (cities - 1) + 1}'
+
+
+def city_backlog(tables: dict, args: dict):
+    """Stand-in for the outreach_city_backlog() RPC."""
+    now = datetime.now(timezone.utc).isoformat()
+    backlog = {}
+    for row in tables.get('outreach_contacts', []):
+        if row.get('status') != 'not_contacted':
+            continue
+        entry = backlog.setdefault(row.get('city'), {'city': row.get('city'), 'unclassified': 0, 'sendable': 0})
+        due = row.get('next_probe_at') is not None and row['next_probe_at'] <= now
+        if row.get('contact_method') is None or due:
+            entry['unclassified'] += 1
+        elif row['contact_method'] in ('email', 'contact_form'):
+            entry['sendable'] += 1
+    return [backlog[c] for c in sorted(backlog, key=str)]
+
+
+def refresh_priority_scores(tables: dict, args: dict):
+    """Stand-in for outreach_refresh_priority_scores(), without freshness."""
+    contacts = tables.get('outreach_contacts', [])
+    outcomes = {}
+    for row in contacts:
+        if row.get('status') != 'not_contacted' and row.get('classification_evidence'):
+            seen = outcomes.setdefault(row['classification_evidence'], [0, 0])
+            seen[0] += row['status'] in ('delivered_email', 'delivered_form', 'replied', 'claimed')
+            seen[1] += 1
+    total = [sum(v[0] for v in outcomes.values()), sum(v[1] for v in outcomes.values())]
+    overall = total[0] / total[1] if total[1] else 0.5
+    changed = 0
+    for row in contacts:
+        if row.get('status') != 'not_contacted':
+            continue
+        delivered, attempted = outcomes.get(row.get('classification_evidence'), (0, 0))
+        weight = {'email': 1.0, 'contact_form': 0.7}.get(row.get('contact_method'), 0.0)
+        score = round(100 * weight * (delivered + 10 * overall) / (attempted + 10), 3)
+        changed += row.get('priority_score') != score
+        row['priority_score'] = score
+    return changed
+
+
+def quota_reserve(tables: dict, args: dict):
+    """Stand-in for outreach_quota_reserve(), without expiry."""
+    day = datetime.now(timezone.utc).date().isoformat()
+    quotas = tables.setdefault('outreach_send_quota', [])
+    quota = next((q for q in quotas if q['account'] == args['p_account'] and q['day'] == day), None)
+    if quota is None:
+        quota = {'account': args['p_account'], 'day': day, 'reserved': 0, 'committed': 0}
+        quotas.append(quota)
+    quota['cap'] = args['p_cap']
+    if not args.get('p_force') and quota['committed'] + quota['reserved'] + 1 > args['p_cap']:
+        return None
+    reservation = {'id': str(uuid.uuid4()), 'account': quota['account'], 'day': day,
+                   'script': args['p_script'], 'state': 'reserved'}
+    tables.setdefault('outreach_send_reservations', []).append(reservation)
+    quota['reserved'] += 1
+    return reservation['id']
+
+
+def quota_settle(state: str):
+    """Stand-in for outreach_quota_commit() / outreach_quota_release()."""
+    def settle(tables: dict, args: dict):
+        reservation = next((r for r in tables.get('outreach_send_reservations', [])
+                            if r['id'] == args['p_reservation']), None)
+        if reservation is None or reservation['state'] != 'reserved':
+            return False
+        reservation['state'] = state
+        quota = next(q for q in tables['outreach_send_quota']
+                     if q['account'] == reservation['account'] and q['day'] == reservation['day'])
+        quota['reserved'] -= 1
+        quota['committed'] += state == 'committed'
+        return True
+    return settle
+
+
+def seed_contacts(sites: ProviderSites, count: int, followups: int, cities: int = 1):
+    rows = []
+    for n in range(count):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'listing_id': str(uuid.uuid4()),
+            'display_name': f'Provider {n}',
+            'city': city_of(n, cities),
+            'seed_contact_website': sites.url(n),
+            'seed_contact_email': None,
+            'contact_method': None,
+            'status': 'not_contacted',
+            'claimed': False,
+            'priority_score': 0,
+            'follow_up_count': 0,
+            'last_contacted_at': None,
+        })
+    contacted = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    for n in range(followups):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'listing_id': str(uuid.uuid4()),
+            'display_name': f'Followup {n}',
+            'city': 'benchville',
+            'seed_contact_website': None,
+            'seed_contact_email': f'followup{n}@inbox.bench',
+            'contact_method': 'email',
+            'status': 'delivered_email',
+            'claimed': False,
+            'follow_up_count': 1 + n % 2,
+            'last_contacted_at': contacted,
+        })
+    return rows
+
+
+def _count(values) -> dict:
+    counts = {}
+    for v in values:
+        counts[v] = counts.get(v, 0) + 1
+    return counts
+
+
+def run_script(name: str, env: dict, trace_dir: str):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPTS, name)], env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(proc.stdout[-2000:])
+        print(proc.stderr[-4000:], file=sys.stderr)
+        raise SystemExit(f'bench_pipeline: {name} exited {proc.returncode}')
+
+    script = name[:-3]
+    for line in proc.stdout.splitlines():
+        if line.startswith(f'{script}: city='):
+            print(f'bench_pipeline:   {line}')
+    rollup_path = os.path.join(trace_dir, f'{script}.rollup.json')
+    rollup = {}
+    if os.path.exists(rollup_path):
+        with open(rollup_path, encoding='utf-8') as f:
+            rollup = json.load(f)
+    return script, elapsed, rollup
+
+
+def report(script: str, elapsed: float, rollup: dict):
+    candidates = rollup.get('candidates', 0)
+    per_minute = candidates / elapsed * 60 if elapsed else 0.0
+    print(f'bench_pipeline: script={script} candidates={candidates} seconds={elapsed:.2f} '
+          f'candidates_per_min={per_minute:,.0f}')
+    for stage, stats in sorted(rollup.get('stages', {}).items()):
+        print(f"bench_pipeline:   stage={stage} n={stats['count']} p50_ms={stats['p50_ms']} "
+              f"p95_ms={stats['p95_ms']} max_ms={stats['max_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sites', type=int, default=1000, help='synthetic provider sites to classify')
+    parser.add_argument('--send', type=int, default=200, help='OUTREACH_DAILY_LIMIT for the outreach run')
+    parser.add_argument('--followups', type=int, default=200, help='contacts due a follow-up')
+    parser.add_argument('--slow-seconds', type=float, default=1.0, help='delay for the slow sites')
+    parser.add_argument('--parse-workers', default=os.getenv('OUTREACH_PARSE_WORKERS', '0'))
+    parser.add_argument('--io-workers', default=os.getenv('OUTREACH_IO_WORKERS', '8'))
+    parser.add_argument('--cities', type=int, default=0, help='spread sites over N cities and run outreach_cities.py')
+    parser.add_argument('--smtp-cap', type=int, default=0, help='OUTREACH_SMTP_DAILY_CAP (0 = ledger off)')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='delay added to every PostgREST request')
+    parser.add_argument('--keep', action='store_true', help='keep the trace directory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='outreach-bench-')
+    trace_dir = os.path.join(workdir, 'traces')
+    cert, key = self_signed_cert(workdir)
+
+    sites = ProviderSites(slow_seconds=args.slow_seconds).start()
+    smtp = SmtpSink(cert, key).start()
+    db = Postgrest({
+        'outreach_contacts': seed_contacts(sites, args.sites, args.followups, args.cities),
+        'outreach_attempts': [],
+    }, functions={
+        'outreach_city_backlog': city_backlog,
+        'outreach_refresh_priority_scores': refresh_priority_scores,
+        'outreach_quota_reserve': quota_reserve,
+        'outreach_quota_commit': quota_settle('committed'),
+        'outreach_quota_release': quota_settle('released'),
+    }, latency=args.db_latency_ms / 1000).start()
+
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_URL': db.url,
+        'SUPABASE_SERVICE_ROLE_KEY': BENCH_KEY,
+        'OUTREACH_REPLY_TO_EMAIL': 'bench@outreach.bench',
+        'OUTREACH_SMTP_PASSWORD': 'bench',
+        'OUTREACH_SMTP_HOST': 'localhost',
+        'OUTREACH_SMTP_PORT': str(smtp.port),
+        'SSL_CERT_FILE': cert,
+        'NO_PROXY': '*',
+        'OUTREACH_TRACE_DIR': trace_dir,
+        'OUTREACH_PACING_SECONDS': '0',
+        'OUTREACH_PARSE_WORKERS': str(args.parse_workers),
+        'OUTREACH_IO_WORKERS': str(args.io_workers),
+        'OUTREACH_CITY_WORKERS': str(args.io_workers),
+        'CLASSIFY_LIMIT': str(args.sites),
+        'OUTREACH_DAILY_LIMIT': str(args.send),
+        'FOLLOWUP_DAILY_LIMIT': str(args.followups),
+        'OUTREACH_CITY': '',
+        'CLASSIFY_CITY': '',
+        'OUTREACH_SMTP_DAILY_CAP': str(args.smtp_cap),
+    })
+
+    kinds = {}
+    for n in range(args.sites):
+        kinds[SITE_KINDS[n % len(SITE_KINDS)]] = kinds.get(SITE_KINDS[n % len(SITE_KINDS)], 0) + 1
+    print('bench_pipeline: sites ' + ' '.join(f'{k}={v}' for k, v in sorted(kinds.items())))
+
+    if args.cities:
+        scripts = ('outreach_cities.py', 'followup_sequence.py')
+    else:
+        scripts = ('build_delivery_queues_db.py', 'daily_outreach_db.py', 'followup_sequence.py')
+    try:
+        for name in scripts:
+            report(*run_script(name, env, trace_dir))
+    finally:
+        sites.shutdown()
+        smtp.shutdown()
+        db.shutdown()
+
+    attempts = db.tables['outreach_attempts']
+    by_status = {}
+    for a in attempts:
+        by_status[a.get('status')] = by_status.get(a.get('status'), 0) + 1
+    print(f"bench_pipeline: http_get={sites.counts['get']} http_post={sites.counts['post']} "
+          f"smtp_messages={smtp.messages} smtp_bytes={smtp.bytes} "
+          f"attempts={len(attempts)} " + ' '.join(f'{k}={v}' for k, v in sorted(by_status.items())))
+    evidence = _count(a.get('delivery_evidence') for a in attempts if a.get('channel') == 'contact_form')
+    print('bench_pipeline: form_evidence ' + ' '.join(f'{k}={v}' for k, v in sorted(evidence.items(), key=str)))
+    schemas = db.tables.get('outreach_form_schemas', [])
+    print(f"bench_pipeline: form_schemas={len(schemas)} "
+          f"verified={sum(1 for r in schemas if r.get('verified_at'))} "
+          + ' '.join(f'{k}={v}' for k, v in sorted(_count(r['framework'] for r in schemas).items())))
+    for quota in db.tables.get('outreach_send_quota', []):
+        print(f"bench_pipeline: send_quota account={quota['account']} cap={quota['cap']} "
+              f"committed={quota['committed']} reserved={quota['reserved']}")
+    for run in db.tables.get('outreach_runs', []):
+        print(f"bench_pipeline: run script={run['script']} candidates={run['candidates']} "
+              f"duration_ms={run['duration_ms']} errors={run['error_count']} "
+              + ' '.join(f'{k}={v}' for k, v in sorted(run['by_status'].items())))
+    print('bench_pipeline: postgrest ' + ' '.join(f'{k}={v}' for k, v in sorted(db.requests.items())))
+
+    if args.keep:
+        print(f'bench_pipeline: traces in {trace_dir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
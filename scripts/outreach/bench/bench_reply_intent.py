@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Accuracy and throughput check for the reply intent rules.
+
+Runs every reply in reply_intent_corpus.jsonl through the same normalization
+and classification the inbox forwarder uses, prints accuracy with each miss,
+then times classify_batch over the corpus repeated --repeat times.
+
+Usage:
+  python scripts/outreach/bench/bench_reply_intent.py
+  python scripts/outreach/bench/bench_reply_intent.py --repeat 2000 --min-accuracy 0.9
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_intent import classify_batch, normalize_body  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reply_intent_corpus.jsonl')
+
+
+def load_corpus(path: str):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--min-accuracy', type=float, default=0.0)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    messages = [
+        (row['subject'], normalize_body(row['body'], is_html=bool(row.get('html'))))
+        for row in corpus
+    ]
+
+    predicted = classify_batch(messages)
+    correct = 0
+    for row, got in zip(corpus, predicted):
+        if got == row['expected']:
+            correct += 1
+            continue
+        preview = row['body'].splitlines()[0][:70] if row['body'] else ''
+        print(f"  miss: expected={row['expected']} got={got} body={preview!r}")
+
+    accuracy = correct / len(corpus) if corpus else 0.0
+    by_label: dict = {}
+    for row, got in zip(corpus, predicted):
+        hits, total = by_label.get(row['expected'], (0, 0))
+        by_label[row['expected']] = (hits + (got == row['expected']), total + 1)
+    per_label = ' '.join(f'{label}={hits}/{total}' for label, (hits, total) in by_label.items())
+
+    workload = messages * args.repeat
+    start = time.perf_counter()
+    classify_batch(workload)
+    elapsed = time.perf_counter() - start
+    rate = len(workload) / elapsed if elapsed else float('inf')
+
+    print(f'bench_reply_intent: corpus={len(corpus)} accuracy={accuracy:.3f} {per_label}')
+    print(f'bench_reply_intent: classified={len(workload)} seconds={elapsed:.3f} msgs_per_sec={rate:,.0f}')
+
+    if accuracy < args.min_accuracy:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
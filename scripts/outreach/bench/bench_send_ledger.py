@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Crash and concurrency check for the send ledger (send_ledger.py).
+
+Runs daily_outreach_db.py and followup_sequence.py against the
+fake_services.py SMTP sink and in-memory PostgREST, with --contacts
+contacts that have an address to email and --followups contacts due a
+reminder, in three scenarios:
+
+  parallel   --workers copies of each script at once, all picking the same
+             candidates
+  crash      daily_outreach_db.py killed (SIGKILL) once --kill-after messages
+             are out, then run again after its lease has run out
+  reconcile  ledger entries left open by a dead run (settled, reserved) or
+             held by a live one, then one run of each script
+
+and checks that no address got the same message twice, that every message
+sent is recorded in outreach_contacts and outreach_attempts, and that
+entries held by a live run are left alone. Exits 1 if a check fails.
+Nothing leaves 127.0.0.1.
+
+Usage:
+  python scripts/outreach/bench/bench_send_ledger.py
+  python scripts/outreach/bench/bench_send_ledger.py --contacts 200 --workers 6 --db-latency-ms 20
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bench_pipeline import BENCH_KEY, SCRIPTS
+from fake_services import Postgrest, SmtpSink, self_signed_cert
+
+sys.path.insert(0, SCRIPTS)
+
+from send_ledger import IN_DOUBT, send_key  # noqa: E402
+
+
+def iso(delta_seconds: float = 0.0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=delta_seconds)).isoformat()
+
+
+def seed(contacts: int, followups: int) -> list:
+    rows = []
+    for n in range(contacts):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'listing_id': str(uuid.uuid4()),
+            'display_name': f'Provider {n}',
+            'city': 'benchville',
+            'seed_contact_website': None,
+            'seed_contact_email': f'provider{n}@inbox.bench',
+            'seed_contact_email_normalized': f'provider{n}@inbox.bench',
+            'contact_method': 'email',
+            # The classifier's artifact, so sending needs no provider site.
+            'classified_at': iso(-3600),
+            'probe_artifact': {'email': f'provider{n}@inbox.bench'},
+            'status': 'not_contacted',
+            'claimed': False,
+            'priority_score': float(contacts - n),
+            'follow_up_count': 0,
+            'last_contacted_at': None,
+        })
+    contacted = iso(-30 * 86400)
+    for n in range(followups):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'listing_id': str(uuid.uuid4()),
+            'display_name': f'Followup {n}',
+            'city': 'benchville',
+            'seed_contact_website': None,
+            'seed_contact_email': f'followup{n}@inbox.bench',
+            'seed_contact_email_normalized': f'followup{n}@inbox.bench',
+            'contact_method': 'email',
+            'status': 'delivered_email',
+            'claimed': False,
+            'follow_up_count': 1,
+            'last_contacted_at': contacted,
+        })
+    return rows
+
+
+def recorded(contact: dict) -> bool:
+    """Whether the contact's message is written to its row."""
+    if contact['seed_contact_email'].startswith('followup'):
+        return contact['follow_up_count'] == 2
+    return contact['status'] != 'not_contacted'
+
+
+class Scenario:
+    """Fresh stand-ins and environment for one scenario."""
+
+    def __init__(self, args, cert: str, key: str):
+        self.contacts = seed(args.contacts, args.followups)
+        self.smtp = SmtpSink(cert, key).start()
+        self.db = Postgrest({'outreach_contacts': self.contacts, 'outreach_attempts': []},
+                            latency=args.db_latency_ms / 1000).start()
+        self.env = dict(os.environ)
+        self.env.update({
+            'SUPABASE_URL': self.db.url,
+            'SUPABASE_SERVICE_ROLE_KEY': BENCH_KEY,
+            'OUTREACH_REPLY_TO_EMAIL': 'bench@outreach.bench',
+            'OUTREACH_SMTP_PASSWORD': 'bench',
+            'OUTREACH_SMTP_HOST': 'localhost',
+            'OUTREACH_SMTP_PORT': str(self.smtp.port),
+            'SSL_CERT_FILE': cert,
+            'NO_PROXY': '*',
+            'OUTREACH_PACING_SECONDS': '0',
+            'OUTREACH_DAILY_LIMIT': str(args.contacts),
+            'FOLLOWUP_DAILY_LIMIT': str(args.followups),
+            'OUTREACH_CITY': '',
+            'OUTREACH_SMTP_DAILY_CAP': '0',
+        })
+        self.failures = []
+
+    def start(self, name: str, **env) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, os.path.join(SCRIPTS, name)],
+                                env=dict(self.env, **env), stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True)
+
+    def run(self, name: str, **env) -> str:
+        proc = self.start(name, **env)
+        out, _ = proc.communicate()
+        if proc.returncode != 0:
+            print(out[-3000:])
+            raise SystemExit(f'bench_send_ledger: {name} exited {proc.returncode}')
+        return out
+
+    def check(self, ok: bool, what: str):
+        if not ok:
+            self.failures.append(what)
+
+    def ledger(self) -> list:
+        return self.db.tables.get('outreach_send_ledger', [])
+
+    def verify(self, name: str):
+        """Each address got at most one message, and each message is recorded once."""
+        twice = [a for a, n in self.smtp.recipients.items() if n > 1]
+        self.check(not twice, f'{len(twice)} addresses contacted twice')
+
+        by_address = {c['seed_contact_email']: c for c in self.contacts}
+        unrecorded = [a for a in self.smtp.recipients if not recorded(by_address[a])]
+        self.check(not unrecorded, f'{len(unrecorded)} messages sent but not recorded')
+
+        attempts = self.db.tables['outreach_attempts']
+        per_contact = {}
+        for a in attempts:
+            per_contact[a['contact_id']] = per_contact.get(a['contact_id'], 0) + 1
+        doubled = [c for c, n in per_contact.items() if n > 1]
+        self.check(not doubled, f'{len(doubled)} contacts recorded twice')
+
+        states = {}
+        for entry in self.ledger():
+            states[entry['state']] = states.get(entry['state'], 0) + 1
+        print(f"bench_send_ledger: scenario={name} smtp_messages={self.smtp.messages} "
+              f"recipients={len(self.smtp.recipients)} attempts={len(attempts)} "
+              + ' '.join(f'ledger_{k}={v}' for k, v in sorted(states.items()))
+              + f" postgrest={sum(self.db.requests.values())}")
+
+    def close(self):
+        self.smtp.shutdown()
+        self.db.shutdown()
+
+
+def parallel(s: Scenario, workers: int):
+    procs = [s.start(name) for name in ('daily_outreach_db.py', 'followup_sequence.py')
+             for _ in range(workers)]
+    outputs = [p.communicate()[0] for p in procs]
+    for p, out in zip(procs, outputs):
+        if p.returncode != 0:
+            print(out[-3000:])
+            raise SystemExit(f'bench_send_ledger: worker exited {p.returncode}')
+    skipped = sum(out.count('-> skipped') for out in outputs)
+    print(f'bench_send_ledger: scenario=parallel workers={workers} skipped={skipped}')
+    s.verify('parallel')
+    done = sum(1 for c in s.contacts if recorded(c))
+    s.check(done == s.smtp.messages, f'{done} contacts recorded for {s.smtp.messages} messages')
+
+
+def crash(s: Scenario, kill_after: int):
+    # A short lease, so the rerun may reconcile what the killed run left open.
+    proc = s.start('daily_outreach_db.py', OUTREACH_SEND_LEASE_SECONDS='1')
+    while s.smtp.messages < kill_after and proc.poll() is None:
+        time.sleep(0.005)
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+    killed_at = s.smtp.messages
+    open_entries = sum(1 for e in s.ledger() if e['state'] in ('reserved', 'settled'))
+    by_address = {c['seed_contact_email']: c for c in s.contacts}
+    unrecorded = sum(1 for a in s.smtp.recipients if not recorded(by_address[a]))
+    print(f'bench_send_ledger: scenario=crash killed_after={killed_at} open_entries={open_entries} '
+          f'sent_unrecorded={unrecorded}')
+    time.sleep(1.5)
+    out = s.run('daily_outreach_db.py')
+    reconciled = out.count('send_ledger: reconciled')
+    print(f'bench_send_ledger: scenario=crash rerun reconciled={reconciled} '
+          f'in_doubt={out.count(IN_DOUBT)}')
+    s.check(reconciled == open_entries, 'open entries left after the rerun')
+    s.verify('crash')
+    left = sum(1 for c in s.contacts if c['status'] == 'not_contacted')
+    s.check(left == 0, f'{left} contacts never contacted')
+
+
+def reconcile(s: Scenario):
+    providers = [c for c in s.contacts if c['status'] == 'not_contacted']
+    due = [c for c in s.contacts if c['follow_up_count'] == 1]
+    settled, in_doubt, live = providers[0], providers[1], providers[2]
+    reminder = due[0]
+
+    def entry(contact, step, template, state, expires, **outcome):
+        token = str(uuid.uuid4())
+        return dict({'key': send_key(contact['id'], step, template), 'contact_id': contact['id'],
+                     'listing_id': contact['listing_id'], 'step': step, 'template_version': template,
+                     'state': state, 'token': token, 'script': 'dead_run', 'expires_at': expires,
+                     'status': None, 'evidence': None, 'delivery_url': None}, **outcome)
+
+    mailto = f"mailto:{settled['seed_contact_email']}"
+    s.db.tables['outreach_send_ledger'] = [
+        entry(settled, 'initial', 'v1_permission_request', 'settled', iso(-60),
+              status='delivered_email', evidence='smtp_sent', delivery_url=mailto),
+        entry(in_doubt, 'initial', 'v1_permission_request', 'reserved', iso(-60)),
+        entry(live, 'initial', 'v1_permission_request', 'reserved', iso(600)),
+        entry(reminder, 'day4', 'v2_followup_day4', 'settled', iso(-60), status='sent',
+              evidence='day4_permission_followup', delivery_url=f"mailto:{reminder['seed_contact_email']}"),
+    ]
+    s.run('daily_outreach_db.py')
+    s.run('followup_sequence.py')
+
+    untouched = {settled['seed_contact_email'], in_doubt['seed_contact_email'],
+                 live['seed_contact_email'], reminder['seed_contact_email']}
+    resent = untouched & set(s.smtp.recipients)
+    s.check(not resent, f'{len(resent)} reconciled or held contacts were sent to')
+    s.check(settled['status'] == 'delivered_email', 'settled send not recorded')
+    s.check(in_doubt['status'] == 'needs_manual', 'send in doubt not set to needs_manual')
+    s.check(live['status'] == 'not_contacted', 'held send was recorded')
+    s.check(reminder['follow_up_count'] == 2, 'settled reminder not recorded')
+    states = {e['contact_id']: e['state'] for e in s.ledger()}
+    s.check(states[live['id']] == 'reserved', 'held entry was taken over')
+    s.check(all(states[c['id']] == 'recorded' for c in (settled, in_doubt, reminder)),
+            'reconciled entries not closed')
+    print(f"bench_send_ledger: scenario=reconcile settled={settled['status']} "
+          f"in_doubt={in_doubt['status']} held={live['status']} "
+          f"reminder_follow_up_count={reminder['follow_up_count']}")
+    s.verify('reconcile')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contacts', type=int, default=100, help='contacts with an address to email')
+    parser.add_argument('--followups', type=int, default=50, help='contacts due a day-4 reminder')
+    parser.add_argument('--workers', type=int, default=4, help='copies of each script in the parallel scenario')
+    parser.add_argument('--kill-after', type=int, default=20, help='messages before the crash scenario kills its run')
+    parser.add_argument('--db-latency-ms', type=float, default=5.0, help='delay added to every PostgREST request')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='outreach-ledger-')
+    cert, key = self_signed_cert(workdir)
+    failures = []
+    try:
+        for name, scenario in (('parallel', lambda s: parallel(s, args.workers)),
+                               ('crash', lambda s: crash(s, args.kill_after)),
+                               ('reconcile', reconcile)):
+            s = Scenario(args, cert, key)
+            try:
+                scenario(s)
+            finally:
+                s.close()
+            failures += [f'{name}: {f}' for f in s.failures]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'bench_send_ledger: FAIL {failure}')
+    print(f"bench_send_ledger: {'ok' if not failures else f'{len(failures)} checks failed'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
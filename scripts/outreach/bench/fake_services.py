@@ -0,0 +1,611 @@
+"""Local stand-ins for everything an outreach run talks to.
+
+- ProviderSites: one HTTP server that serves thousands of synthetic provider
+  sites under /s/<n>/, mixing mailto-only pages, forms with and without
+  captcha, Contact Form 7 and WPForms forms (answered like the plugins do),
+  contact subpages, slow responses, 5xx errors, huge pages and sites with
+  no contact method. Dead sites get a URL on a closed port.
+- SmtpSink: implicit-TLS SMTP server (like port 465) that accepts any login
+  and counts messages and recipients; with keep=True it also keeps each
+  message as received, dot-unstuffed, in .raw. Its certificate comes from
+  self_signed_cert(); point SSL_CERT_FILE at it so
+  ssl.create_default_context() trusts it. Without a certificate it speaks
+  plain SMTP (the shadow-mode sink).
+- FormSink: accepts any form submission, GET or POST, on any path and
+  answers with a success page (the shadow-mode form sink).
+- Postgrest: in-memory PostgREST for the filters the outreach scripts use
+  (eq, neq, is, in, gt/gte/lt/lte, like/ilike, or, select, limit, order).
+  RPCs are Python callables, functions={name: fn(tables, args)}.
+
+All servers run on daemon threads bound to 127.0.0.1 with a free port.
+"""
+
+import base64
+import json
+import os
+import re
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlparse
+
+# 16 slots; site n gets SITE_KINDS[n % 16].
+SITE_KINDS = (
+    'mailto', 'mailto', 'mailto',
+    'form', 'cf7', 'wpforms',
+    'form_captcha', 'form_captcha',
+    'subpage_form', 'subpage_form',
+    'subpage_mailto',
+    'slow',
+    'error',
+    'huge',
+    'dead',
+    'none',
+)
+
+HUGE_PAGE_BYTES = 3 * 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def self_signed_cert(directory: str):
+    """Write a localhost/127.0.0.1 certificate and key with the openssl CLI."""
+    cert = os.path.join(directory, 'bench-cert.pem')
+    key = os.path.join(directory, 'bench-key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=localhost',
+        '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        '-keyout', key, '-out', cert,
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+def _nodelay(sock):
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40 ms to every local round trip.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Synthetic provider sites
+# ---------------------------------------------------------------------------
+
+def _page(title: str, body: str) -> str:
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<title>{title}</title></head><body>'
+        '<nav><a href="/">Home</a> <a href="about">About</a> <a href="rates">Rates</a></nav>'
+        f'<main><h1>{title}</h1>{body}</main>'
+        '<footer><a href="https://twitter.com/example">Twitter</a></footer>'
+        '</body></html>'
+    )
+
+
+def _form(n: int, captcha: bool) -> str:
+    widget = '<div class="g-recaptcha" data-sitekey="bench"></div>' if captcha else ''
+    return (
+        f'<form action="/s/{n}/submit" method="post">'
+        '<input type="hidden" name="form_id" value="contact">'
+        '<input type="text" name="your-name" placeholder="Name">'
+        '<input type="email" name="your-email" placeholder="Email">'
+        '<input type="text" name="subject">'
+        '<textarea name="your-message" placeholder="Message"></textarea>'
+        f'{widget}<input type="submit" value="Send"></form>'
+    )
+
+
+def _cf7_form(n: int) -> str:
+    # Field names as the plugin generates them: no hint in text-/textarea-.
+    return (
+        f'<form action="/s/{n}/#wpcf7-f{n}-o1" method="post" class="wpcf7-form init">'
+        f'<input type="hidden" name="_wpcf7" value="{n}">'
+        '<input type="hidden" name="_wpcf7_version" value="5.9.3">'
+        f'<input type="hidden" name="_wpcf7_unit_tag" value="wpcf7-f{n}-o1">'
+        '<input type="text" name="text-417" placeholder="Your name">'
+        '<input type="email" name="email-212">'
+        '<textarea name="textarea-33"></textarea>'
+        '<input type="submit" value="Send"></form>'
+    )
+
+
+def _wpforms_form(n: int) -> str:
+    return (
+        f'<form action="/s/{n}/" method="post" id="wpforms-form-{n}" class="wpforms-validate wpforms-form">'
+        '<input type="text" name="wpforms[fields][0][first]">'
+        '<input type="text" name="wpforms[fields][0][last]">'
+        '<input type="email" name="wpforms[fields][1]">'
+        '<textarea name="wpforms[fields][2]"></textarea>'
+        f'<input type="hidden" name="wpforms[id]" value="{n}">'
+        '<button type="submit" name="wpforms[submit]" value="wpforms-submit">Submit</button></form>'
+    )
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        _nodelay(self.request)
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body, content_type='text/html; charset=utf-8'):
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self):
+        m = re.match(r'^/s/(\d+)(/.*)?$', urlparse(self.path).path)
+        if not m:
+            return None, None, ''
+        n = int(m.group(1))
+        return n, SITE_KINDS[n % len(SITE_KINDS)], (m.group(2) or '/').rstrip('/') or '/'
+
+    def do_GET(self):
+        self.server.count('get')
+        n, kind, sub = self._route()
+        if n is None:
+            return self._send(404, _page('Not found', ''))
+        title = f'Provider {n}'
+        email = f'provider{n}@sites.bench'
+
+        if kind == 'slow':
+            time.sleep(self.server.slow_seconds)
+        if kind == 'error':
+            return self._send(503, _page('Service Unavailable', ''))
+
+        if sub == '/':
+            if kind == 'mailto':
+                return self._send(200, _page(title, f'<p>Write to <a href="mailto:{email}">{email}</a></p>'))
+            if kind in ('form', 'slow'):
+                return self._send(200, _page(title, _form(n, captcha=False)))
+            if kind == 'cf7':
+                return self._send(200, _page(title, _cf7_form(n)))
+            if kind == 'wpforms':
+                return self._send(200, _page(title, _wpforms_form(n)))
+            if kind == 'form_captcha':
+                return self._send(200, _page(title, _form(n, captcha=True)))
+            if kind in ('subpage_form', 'subpage_mailto'):
+                return self._send(200, _page(title, f'<p><a href="/s/{n}/contact">Contact me</a></p>'))
+            if kind == 'huge':
+                return self._send(200, self.server.huge_page(n))
+            return self._send(200, _page(title, '<p>Sessions by appointment.</p>'))
+
+        if sub == '/contact' and kind == 'subpage_form':
+            return self._send(200, _page(f'{title} - Contact', _form(n, captcha=False)))
+        if sub == '/contact' and kind == 'subpage_mailto':
+            return self._send(200, _page(f'{title} - Contact', f'<a href="mailto:{email}">Email me</a>'))
+        return self._send(404, _page('Not found', ''))
+
+    def do_POST(self):
+        self.server.count('post')
+        length = int(self.headers.get('Content-Length') or 0)
+        posted = dict(parse_qsl(self.rfile.read(length).decode('utf-8', 'replace')))
+        n, kind, sub = self._route()
+        query = dict(parse_qsl(urlparse(self.path).query))
+        if kind == 'cf7' and sub == '/' and query.get('rest_route', '').endswith('/feedback'):
+            status = 'mail_sent' if posted.get('textarea-33') and posted.get('email-212') else 'validation_failed'
+            return self._send(200, json.dumps({'status': status}), 'application/json')
+        if kind == 'wpforms' and sub == '/':
+            if posted.get('wpforms[fields][2]') and posted.get('wpforms[submit]'):
+                return self._send(200, _page('Contact', '<div class="wpforms-confirmation-container-full">'
+                                                        '<p>Thanks for contacting us!</p></div>'))
+            return self._send(200, _page('Contact', '<label class="wpforms-error">This field is required.</label>'
+                                                    + _wpforms_form(n)))
+        if n is None or sub != '/submit':
+            return self._send(404, _page('Not found', ''))
+        return self._send(200, _page('Sent', '<p>Thank you! Your message was sent.</p>'))
+
+
+class ProviderSites(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, slow_seconds: float = 1.0):
+        super().__init__(('127.0.0.1', 0), _SiteHandler)
+        self.slow_seconds = slow_seconds
+        self.counts = {'get': 0, 'post': 0}
+        self._lock = threading.Lock()
+        self._huge = None
+        self._dead_port = free_port()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def huge_page(self, n: int) -> bytes:
+        if self._huge is None:
+            filler = '<p>' + ('Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20) + '</p>\n'
+            body = filler * (HUGE_PAGE_BYTES // len(filler))
+            self._huge = _page('Provider', body + '<a href="mailto:{email}">email</a>').encode('utf-8')
+        return self._huge.replace(b'{email}', f'provider{n}@sites.bench'.encode())
+
+    def start(self):
+        return _serve(self)
+
+    def url(self, n: int) -> str:
+        if SITE_KINDS[n % len(SITE_KINDS)] == 'dead':
+            return f'http://127.0.0.1:{self._dead_port}/s/{n}/'
+        return f'http://127.0.0.1:{self.server_address[1]}/s/{n}/'
+
+
+class _FormSinkHandler(_SiteHandler):
+    def do_GET(self):
+        self.server.received('get', 0)
+        return self._send(200, _page('Sent', '<p>Thank you! Your message was sent.</p>'))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.server.received('post', length)
+        return self._send(200, _page('Sent', '<p>Thank you! Your message was sent.</p>'))
+
+
+class FormSink(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(('127.0.0.1', port), _FormSinkHandler)
+        self.counts = {'get': 0, 'post': 0}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def received(self, method: str, size: int):
+        with self._lock:
+            self.counts[method] += 1
+            self.bytes += size
+
+    def start(self):
+        return _serve(self)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+# ---------------------------------------------------------------------------
+# SMTP sink
+# ---------------------------------------------------------------------------
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        _nodelay(self.request)
+        if self.server.tls:
+            self.request = self.server.tls.wrap_socket(self.request, server_side=True)
+        super().setup()
+
+    def reply(self, line: str):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+        self.wfile.flush()
+
+    def handle(self):
+        self.reply('220 bench.smtp ESMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode('ascii', 'replace').strip().split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-bench.smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+                self.wfile.flush()
+            elif verb == 'AUTH':
+                parts = line.decode('ascii', 'replace').split()
+                if len(parts) > 2:
+                    base64.b64decode(parts[2])
+                    self.reply('235 2.7.0 Authentication successful')
+                else:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                    self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'RCPT':
+                self.server.recipient(line.decode('ascii', 'replace').split(':', 1)[-1].strip(' <>\r\n'))
+                self.reply('250 2.1.5 Ok')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                lines = [] if self.server.keep else None
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(chunk)
+                    if lines is not None:
+                        lines.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                self.server.received(size, b''.join(lines) if lines is not None else None)
+                self.reply('250 2.0.0 Ok: queued')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('250 2.0.0 Ok')
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, cert: str = None, key: str = None, port: int = 0, keep: bool = False):
+        super().__init__(('127.0.0.1', port), _SmtpHandler)
+        self.keep = keep
+        self.raw = []
+        self.tls = None
+        if cert:
+            self.tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.tls.load_cert_chain(cert, key)
+        self.messages = 0
+        self.bytes = 0
+        self.recipients = {}
+        self._lock = threading.Lock()
+
+    def recipient(self, address: str):
+        with self._lock:
+            self.recipients[address] = self.recipients.get(address, 0) + 1
+
+    def received(self, size: int, raw: bytes = None):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+            if raw is not None:
+                self.raw.append(raw)
+
+    def start(self):
+        return _serve(self)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+# ---------------------------------------------------------------------------
+# PostgREST stand-in
+# ---------------------------------------------------------------------------
+
+def _text(value) -> str:
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'null'
+    return str(value)
+
+
+def _sort_key(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (value is None, 0, value, '')
+    return (value is None, 1, 0, _text(value))
+
+
+def _in_values(arg: str):
+    inner = arg[1:-1] if arg.startswith('(') and arg.endswith(')') else arg
+    return [v.strip().strip('"') for v in inner.split(',')] if inner else []
+
+
+def _compare(value, arg: str) -> int:
+    if value is None:
+        return -1
+    try:
+        a, b = float(value), float(arg)
+    except (TypeError, ValueError):
+        a, b = str(value), arg
+    return (a > b) - (a < b)
+
+
+def _like(value, pattern: str, fold: bool) -> bool:
+    if value is None:
+        return False
+    regex = '^' + '.*'.join(re.escape(p) for p in re.split(r'[%*]', pattern)) + '$'
+    return re.match(regex, str(value), re.IGNORECASE if fold else 0) is not None
+
+
+def _any_of(row: dict, expr: str) -> bool:
+    """An or=(col.op.arg,...) filter; values may be double-quoted."""
+    inner = expr[1:-1] if expr.startswith('(') and expr.endswith(')') else expr
+    for part in re.findall(r'(?:[^,"]|"[^"]*")+', inner):
+        column, _, rest = part.partition('.')
+        if _matches(row, column, rest.replace('"', '')):
+            return True
+    return False
+
+
+def _matches(row: dict, column: str, expr: str) -> bool:
+    if column == 'or':
+        return _any_of(row, expr)
+    negate = expr.startswith('not.')
+    if negate:
+        expr = expr[4:]
+    op, _, arg = expr.partition('.')
+    value = row.get(column)
+    if op == 'eq':
+        hit = _text(value) == arg
+    elif op == 'neq':
+        hit = _text(value) != arg
+    elif op == 'is':
+        hit = _text(value) == arg.lower()
+    elif op == 'in':
+        hit = _text(value) in _in_values(arg)
+    elif op in ('gt', 'gte', 'lt', 'lte'):
+        c = _compare(value, arg)
+        hit = value is not None and {'gt': c > 0, 'gte': c >= 0, 'lt': c < 0, 'lte': c <= 0}[op]
+    elif op in ('like', 'ilike'):
+        hit = _like(value, arg, op == 'ilike')
+    else:
+        raise ValueError(f'unsupported filter {op}')
+    return hit != negate
+
+
+class _PostgrestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        _nodelay(self.request)
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload=None, headers=None):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse(self):
+        u = urlparse(self.path)
+        m = re.match(r'^/rest/v1/([A-Za-z0-9_]+)$', u.path)
+        table = m.group(1) if m else None
+        select, limit, order, filters = None, None, None, []
+        for key, value in parse_qsl(u.query, keep_blank_values=True):
+            if key == 'select':
+                select = [c.strip() for c in value.split(',') if c.strip()]
+            elif key == 'limit':
+                limit = int(value)
+            elif key == 'order':
+                order = value
+            elif key in ('offset', 'on_conflict', 'columns'):
+                continue
+            else:
+                filters.append((key, unquote(value)))
+        return table, select, limit, order, filters
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw else None
+
+    def _rows(self, table, filters):
+        return [r for r in self.server.tables.setdefault(table, []) if all(_matches(r, c, e) for c, e in filters)]
+
+    def _project(self, rows, select):
+        if not select or select == ['*']:
+            return [dict(r) for r in rows]
+        return [{c: r.get(c) for c in select} for r in rows]
+
+    def _respond_rows(self, status, rows, select):
+        minimal = 'return=minimal' in (self.headers.get('Prefer') or '')
+        self._send(status, None if minimal else self._project(rows, select))
+
+    def do_GET(self):
+        self.server.count('GET')
+        table, select, limit, order, filters = self._parse()
+        with self.server.lock:
+            rows = self._rows(table, filters)
+            if order:
+                column, *modifiers = order.split(',')[0].split('.')
+                desc = 'desc' in modifiers
+                # PostgREST's default puts nulls last ascending, first descending.
+                nulls_first = 'nullsfirst' in modifiers or (desc and 'nullslast' not in modifiers)
+                rows.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+                if nulls_first != desc:
+                    rows.sort(key=lambda r: (r.get(column) is None) != nulls_first)
+            if limit is not None:
+                rows = rows[:limit]
+            payload = self._project(rows, select)
+        self._send(200, payload, {'Content-Range': f'0-{max(len(payload) - 1, 0)}/*'})
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_PATCH(self):
+        self.server.count('PATCH')
+        table, select, _, _, filters = self._parse()
+        changes = self._body() or {}
+        with self.server.lock:
+            rows = self._rows(table, filters)
+            for r in rows:
+                r.update(changes)
+            out = [dict(r) for r in rows]
+        self._respond_rows(200, out, select)
+
+    def do_POST(self):
+        self.server.count('POST')
+        m = re.match(r'^/rest/v1/rpc/([A-Za-z0-9_]+)$', urlparse(self.path).path)
+        if m:
+            fn = self.server.functions.get(m.group(1))
+            if fn is None:
+                return self._send(404, {'message': f'function {m.group(1)} not found'})
+            args = self._body() or {}
+            with self.server.lock:
+                result = fn(self.server.tables, args)
+            return self._send(200, result)
+        table, select, _, _, _ = self._parse()
+        body = self._body()
+        new = body if isinstance(body, list) else [body or {}]
+        prefer = self.headers.get('Prefer') or ''
+        merge = 'resolution=merge-duplicates' in prefer
+        ignore = 'resolution=ignore-duplicates' in prefer
+        key = dict(parse_qsl(urlparse(self.path).query)).get('on_conflict') or 'id'
+        with self.server.lock:
+            rows = self.server.tables.setdefault(table, [])
+            out = []
+            for item in new:
+                item = dict(item)
+                item.setdefault('id', str(uuid.uuid4()))
+                existing = None
+                if merge or ignore:
+                    existing = next((r for r in rows if r.get(key) == item.get(key)), None)
+                if existing is not None:
+                    if merge:
+                        existing.update(item)
+                        out.append(dict(existing))
+                else:
+                    rows.append(item)
+                    out.append(dict(item))
+        self._respond_rows(201, out, select)
+
+    def do_DELETE(self):
+        self.server.count('DELETE')
+        table, select, _, _, filters = self._parse()
+        self._body()  # drain it, or the next request on this connection breaks
+        with self.server.lock:
+            gone = self._rows(table, filters)
+            self.server.tables[table] = [r for r in self.server.tables.get(table, []) if r not in gone]
+        self._respond_rows(200, gone, select)
+
+
+class Postgrest(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tables=None, functions=None, latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), _PostgrestHandler)
+        self.tables = tables if tables is not None else {}
+        self.functions = functions or {}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, method: str):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+        # Round trip to a hosted database, per request.
+        time.sleep(self.latency)
+
+    def start(self):
+        return _serve(self)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
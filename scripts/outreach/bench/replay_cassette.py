@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Rerun a recorded outreach workload offline and compare runs.
+
+Record a cassette during a normal run:
+
+  OUTREACH_CASSETTE=cassettes/2026-10-19.jsonl.gz OUTREACH_CASSETTE_MODE=record \\
+    python scripts/outreach/build_delivery_queues_db.py
+
+Replay it: every noted classify() seed is classified again, and every
+probe_candidate() seed is probed and (for forms) submitted. All HTTP comes
+from the cassette, and emails are reported, not sent. Results and
+per-stage timings are written as a stage_trace JSONL file:
+
+  python scripts/outreach/bench/replay_cassette.py --cassette cassettes/2026-10-19.jsonl.gz --out before
+  (change the code)
+  python scripts/outreach/bench/replay_cassette.py --cassette cassettes/2026-10-19.jsonl.gz --out after
+  python scripts/outreach/bench/replay_cassette.py --compare before after
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stage_trace import Tracer, bind, rollup  # noqa: E402
+
+SCRIPT = 'replay_cassette'
+
+
+def replay(cassette: str, out_dir: str):
+    # The cassette module reads its mode at import time.
+    os.environ['OUTREACH_CASSETTE'] = cassette
+    os.environ['OUTREACH_CASSETTE_MODE'] = 'replay'
+    import http_cassette
+    from build_delivery_queues_db import classify
+    from daily_outreach_db import deliver_plan, probe_candidate
+
+    work = http_cassette.seeds(cassette)
+    previous = os.path.join(out_dir, f'{SCRIPT}.jsonl')
+    if os.path.exists(previous):
+        os.remove(previous)
+    tracer = Tracer(SCRIPT, out_dir)
+
+    counts = {}
+    for kind, url in work:
+        trace = tracer.start(url)
+        with bind(trace):
+            if kind == 'classify':
+                outcome = list(classify(url))
+            else:
+                plan = probe_candidate({'seed_contact_website': url})
+                if 'email' in plan:
+                    outcome = ['would_email', plan['email'], '']
+                else:
+                    outcome = list(deliver_plan(plan, 'Replay', 'replay@outreach.invalid',
+                                                '', '', 'localhost', 0))
+        tracer.finish(trace, kind=kind, outcome=outcome)
+        counts[kind] = counts.get(kind, 0) + 1
+
+    tracer.close()
+    http_cassette.close()
+    print(f'{SCRIPT}: seeds=' + ' '.join(f'{k}={v}' for k, v in sorted(counts.items())) +
+          f' results={tracer.path}')
+
+
+def load_results(path: str):
+    if os.path.isdir(path):
+        path = os.path.join(path, f'{SCRIPT}.jsonl')
+    with open(path, encoding='utf-8') as f:
+        return {(r['kind'], r['candidate']): r for r in (json.loads(line) for line in f if line.strip())}
+
+
+def compare(before_path: str, after_path: str):
+    before, after = load_results(before_path), load_results(after_path)
+    changed = 0
+    for key in sorted(before.keys() & after.keys()):
+        if before[key]['outcome'] != after[key]['outcome']:
+            changed += 1
+            print(f"  changed: {key[0]} {key[1]} {before[key]['outcome']} -> {after[key]['outcome']}")
+    only = len(before.keys() ^ after.keys())
+    print(f'{SCRIPT}: compared={len(before.keys() & after.keys())} changed={changed} unmatched={only}')
+
+    a, b = rollup(before.values()), rollup(after.values())
+    for stage in sorted(a.keys() | b.keys()):
+        p50a, p50b = a.get(stage, {}).get('p50_ms', 0.0), b.get(stage, {}).get('p50_ms', 0.0)
+        p95a, p95b = a.get(stage, {}).get('p95_ms', 0.0), b.get(stage, {}).get('p95_ms', 0.0)
+        print(f'{SCRIPT}: stage={stage} p50_ms={p50a}->{p50b} p95_ms={p95a}->{p95b}')
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cassette')
+    parser.add_argument('--out', default='replay-results', help='directory for the results JSONL and rollup')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--strict', action='store_true', help='with --compare, exit 1 if any outcome changed')
+    args = parser.parse_args()
+
+    if args.compare:
+        changed = compare(*args.compare)
+        if args.strict and changed:
+            sys.exit(1)
+        return
+    if not args.cassette:
+        parser.error('--cassette is required unless --compare is given')
+    replay(args.cassette, args.out)
+
+
+if __name__ == '__main__':
+    main()
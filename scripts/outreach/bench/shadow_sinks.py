@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Local form and SMTP sinks for shadow-mode runs (see shadow.py).
+
+Starts a FormSink and a plain SmtpSink from fake_services.py, prints the
+env vars that point the outreach scripts at them (and appends them to
+--env-file, e.g. $GITHUB_ENV), then serves until interrupted and reports
+what it received:
+
+  python scripts/outreach/bench/shadow_sinks.py --env-file sinks.env &
+  set -a; . ./sinks.env; set +a
+  OUTREACH_SHADOW=1 OUTREACH_DAILY_LIMIT=80 python scripts/outreach/daily_outreach_db.py
+  kill %1
+"""
+
+import argparse
+import signal
+import sys
+import threading
+
+from fake_services import FormSink, SmtpSink
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--form-port', type=int, default=0)
+    parser.add_argument('--smtp-port', type=int, default=0)
+    parser.add_argument('--env-file', help='append the OUTREACH_SHADOW_* settings to this file')
+    args = parser.parse_args()
+
+    forms = FormSink(args.form_port).start()
+    smtp = SmtpSink(port=args.smtp_port).start()
+
+    env = {
+        'OUTREACH_SHADOW_FORM_SINK': forms.url,
+        'OUTREACH_SHADOW_SMTP': f'127.0.0.1:{smtp.port}',
+    }
+    lines = ''.join(f'{k}={v}\n' for k, v in env.items())
+    if args.env_file:
+        with open(args.env_file, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    sys.stdout.write(lines)
+    sys.stdout.flush()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        forms.shutdown()
+        smtp.shutdown()
+    print(f"shadow_sinks: form_get={forms.counts['get']} form_post={forms.counts['post']} "
+          f"form_bytes={forms.bytes} smtp_messages={smtp.messages} smtp_bytes={smtp.bytes}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,31 @@
 #!/usr/bin/env python3
-"""Build outreach delivery queues from tracker rows not yet contacted."""
+"""Build outreach delivery queues from tracker rows not yet contacted.
+
+The tracker is streamed row by row and each classified row is kept as a
+compact QueueItem. With --large-run, each output bucket keeps at most
+LARGE_RUN_SPILL_ROWS items in memory: full batches are sorted and spilled
+to temporary files, then merged into the bucket's CSV at the end, so memory
+stays flat however large the tracker is (bench/bench_large_run.py checks
+this on 100k rows). Stage traces are then rolled up from a fixed-size
+sample per stage rather than from every row.
+"""
 
 import argparse
 import csv
-from urllib.parse import urljoin, urlparse
+import heapq
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup
+
+import profiling
+import tracker_journal
+from http_cassette import prepare_session
+from page_analysis import analyze_response, has_confirmable_form, parse_pool, probe_ahead
+from stage_trace import Tracer, bind
 
 PLATFORM = {
     'onlyfans.com', 'www.onlyfans.com',
@@ -16,221 +35,269 @@ PLATFORM = {
     't.me', 'telegram.me',
 }
 
-KEYWORDS = ('contact', 'booking', 'book', 'inquir', 'reach', 'get-in-touch')
-
 HEADERS = {
     'User-Agent': 'Mozilla/5.0',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
 }
 
 
-def read_csv(path: str):
-    with open(path, newline='', encoding='utf-8') as f:
-        return list(csv.DictReader(f))
+FIELDS = ('listing_id', 'title', 'listing_url', 'seed_contact_website', 'seed_source_url',
+          'reason', 'delivery_evidence', 'delivery_url')
 
+# Items per bucket held in memory with --large-run.
+LARGE_RUN_SPILL_ROWS = 5_000
 
-def write_csv(path: str, rows, fieldnames):
-    with open(path, 'w', newline='', encoding='utf-8') as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        w.writerows(rows)
+# Timings per stage kept for the trace rollup with --large-run, instead of
+# every finished trace.
+LARGE_RUN_TRACE_SAMPLE = 10_000
 
 
-def extract_mailto(soup: BeautifulSoup):
-    emails = []
-    seen = set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if href.lower().startswith('mailto:'):
-            addr = href.split(':', 1)[1].split('?', 1)[0].strip()
-            if addr and '@' in addr and addr.lower() not in seen:
-                seen.add(addr.lower())
-                emails.append(addr)
-    return emails
+class QueueItem:
+    """One classified tracker row; with __slots__ it costs a fraction of a dict."""
 
+    __slots__ = FIELDS
 
-def has_confirmable_form(soup: BeautifulSoup):
-    for form in soup.find_all('form'):
-        html = str(form).lower()
-        if 'captcha' in html or 'g-recaptcha' in html or 'hcaptcha' in html:
-            continue
-        for t in form.find_all(['input', 'textarea']):
-            typ = (t.get('type') or 'text').lower()
-            if typ in ('hidden', 'submit', 'button', 'checkbox', 'radio', 'file'):
-                continue
-            hay = ' '.join([
-                (t.get('name') or '').lower(),
-                (t.get('id') or '').lower(),
-                (t.get('placeholder') or '').lower(),
-                (t.get('aria-label') or '').lower(),
-            ])
-            if any(k in hay for k in ('message', 'inquir', 'enquir', 'comment')):
-                return True
-    return False
-
-
-def contact_pages(base_url: str, soup: BeautifulSoup):
-    out = []
-    seen = set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href or href.lower().startswith(('mailto:', 'tel:', 'javascript:')):
-            continue
-        full = urljoin(base_url, href)
-        try:
-            u = urlparse(full)
-        except Exception:
-            continue
-        if u.scheme not in ('http', 'https'):
-            continue
-        label = (u.path + ('?' + u.query if u.query else '')).lower()
-        if not any(k in label for k in KEYWORDS):
-            continue
-        norm = u._replace(fragment='').geturl()
-        if norm in seen:
-            continue
-        seen.add(norm)
-        out.append(norm)
-        if len(out) >= 5:
-            break
-    return out
+    def __init__(self, row: dict, website: str):
+        self.listing_id = row.get('listing_id', '')
+        self.title = row.get('title', '')
+        self.listing_url = row.get('listing_url', '')
+        self.seed_contact_website = website
+        self.seed_source_url = row.get('seed_source_url', '')
+        self.reason = ''
+        self.delivery_evidence = ''
+        self.delivery_url = ''
+
+    def values(self) -> list:
+        return [getattr(self, f) for f in FIELDS]
+
+
+def title_key(values) -> str:
+    return (values[1] or '').lower()
+
+
+class BucketWriter:
+    """One output bucket, written to `path` sorted by title.
+
+    Items are buffered; with spill_rows > 0 every full buffer is sorted and
+    written to a temporary run file, and close() merges the runs. Both the
+    sort and the merge are stable, so the output matches an in-memory sort.
+    """
+
+    def __init__(self, path: str, spill_rows: int = 0):
+        self.path = path
+        self.spill_rows = spill_rows
+        self.count = 0
+        self._buffer = []
+        self._runs = []
 
+    def add(self, item: QueueItem):
+        self._buffer.append(item)
+        self.count += 1
+        if self.spill_rows and len(self._buffer) >= self.spill_rows:
+            self._spill()
 
-def classify_row(session, row):
+    def _sorted_values(self):
+        self._buffer.sort(key=lambda item: (item.title or '').lower())
+        return (item.values() for item in self._buffer)
+
+    def _spill(self):
+        run = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+        csv.writer(run).writerows(self._sorted_values())
+        run.seek(0)
+        self._runs.append(run)
+        self._buffer = []
+
+    def close(self):
+        sources = [csv.reader(run) for run in self._runs] + [self._sorted_values()]
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            w.writerow(FIELDS)
+            w.writerows(heapq.merge(*sources, key=title_key))
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
+
+
+def read_head(path: str, limit: int) -> list:
+    """The first `limit` data rows of a CSV, as lists."""
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for values in reader:
+            if len(rows) >= limit:
+                break
+            rows.append(values)
+    return rows
+
+
+def classify_row(session, row, pool=None):
     website = (row.get('seed_contact_website') or '').strip()
-    item = {
-        'listing_id': row.get('listing_id', ''),
-        'title': row.get('title', ''),
-        'listing_url': row.get('listing_url', ''),
-        'seed_contact_website': website,
-        'seed_source_url': row.get('seed_source_url', ''),
-        'reason': '',
-        'delivery_evidence': '',
-        'delivery_url': '',
-    }
+    item = QueueItem(row, website)
 
     if not website:
-        item['reason'] = 'no_contact_method'
-        item['delivery_evidence'] = 'missing_seed_contact_website'
+        item.reason = 'no_contact_method'
+        item.delivery_evidence = 'missing_seed_contact_website'
         return 'no_contact', item
 
     if not website.startswith(('http://', 'https://')):
         website = f'https://{website}'
-        item['seed_contact_website'] = website
+        item.seed_contact_website = website
 
     try:
         host = urlparse(website).netloc.lower()
     except Exception:
-        item['reason'] = 'no_contact_method'
-        item['delivery_evidence'] = 'invalid_website_url'
+        item.reason = 'no_contact_method'
+        item.delivery_evidence = 'invalid_website_url'
         return 'no_contact', item
 
     if host in PLATFORM:
-        item['reason'] = 'platform_only'
-        item['delivery_evidence'] = f'platform_domain:{host}'
-        item['delivery_url'] = website
+        item.reason = 'platform_only'
+        item.delivery_evidence = f'platform_domain:{host}'
+        item.delivery_url = website
         return 'dm', item
 
     try:
         home = session.get(website, timeout=20, allow_redirects=True)
     except Exception:
-        item['reason'] = 'no_contact_method'
-        item['delivery_evidence'] = 'site_unreachable'
-        item['delivery_url'] = website
+        item.reason = 'no_contact_method'
+        item.delivery_evidence = 'site_unreachable'
+        item.delivery_url = website
         return 'no_contact', item
 
     if home.status_code >= 500:
-        item['reason'] = 'no_contact_method'
-        item['delivery_evidence'] = f'http_{home.status_code}'
-        item['delivery_url'] = home.url
+        item.reason = 'no_contact_method'
+        item.delivery_evidence = f'http_{home.status_code}'
+        item.delivery_url = home.url
         return 'no_contact', item
 
-    soup = BeautifulSoup(home.text or '', 'html.parser')
-    mails = extract_mailto(soup)
+    page = analyze_response(home, pool)
+    home_url = home.url
+    # Only the URL is needed from here on; let the body go while the
+    # contact pages are fetched.
+    del home
+    mails = page['emails']
     if mails:
-        item['reason'] = 'email_exposed'
-        item['delivery_evidence'] = 'mailto_found'
-        item['delivery_url'] = f'mailto:{mails[0]}'
+        item.reason = 'email_exposed'
+        item.delivery_evidence = 'mailto_found'
+        item.delivery_url = f'mailto:{mails[0]}'
         return 'email', item
 
-    if has_confirmable_form(soup):
-        item['reason'] = 'confirmable_form'
-        item['delivery_evidence'] = 'form_message_field_no_captcha'
-        item['delivery_url'] = home.url
+    if has_confirmable_form(page):
+        item.reason = 'confirmable_form'
+        item.delivery_evidence = 'form_message_field_no_captcha'
+        item.delivery_url = home_url
         return 'form', item
 
-    for page in contact_pages(home.url, soup):
+    for link in page['contact_links']:
         try:
-            resp = session.get(page, timeout=20, allow_redirects=True)
+            resp = session.get(link, timeout=20, allow_redirects=True)
         except Exception:
             continue
         if resp.status_code >= 400:
             continue
-        s2 = BeautifulSoup(resp.text or '', 'html.parser')
+        s2 = analyze_response(resp, pool)
 
-        mails = extract_mailto(s2)
+        mails = s2['emails']
         if mails:
-            item['reason'] = 'email_exposed'
-            item['delivery_evidence'] = 'mailto_found'
-            item['delivery_url'] = f'mailto:{mails[0]}'
+            item.reason = 'email_exposed'
+            item.delivery_evidence = 'mailto_found'
+            item.delivery_url = f'mailto:{mails[0]}'
             return 'email', item
 
         if has_confirmable_form(s2):
-            item['reason'] = 'confirmable_form'
-            item['delivery_evidence'] = 'form_message_field_no_captcha'
-            item['delivery_url'] = resp.url
+            item.reason = 'confirmable_form'
+            item.delivery_evidence = 'form_message_field_no_captcha'
+            item.delivery_url = resp.url
             return 'form', item
 
-    item['reason'] = 'no_contact_method'
-    item['delivery_evidence'] = 'form_or_email_not_found'
-    item['delivery_url'] = home.url
+    item.reason = 'no_contact_method'
+    item.delivery_evidence = 'form_or_email_not_found'
+    item.delivery_url = home_url
     return 'no_contact', item
 
 
+def traced_classify(tracer, session, row, pool=None):
+    trace = tracer.start(row.get('listing_id'))
+    with bind(trace):
+        bucket, item = classify_row(session, row, pool)
+    tracer.finish(trace, bucket=bucket, reason=item.reason)
+    return bucket, item
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--tracker', required=True)
     parser.add_argument('--out-dir', required=True)
     parser.add_argument('--deliverable-limit', type=int, default=30)
+    parser.add_argument('--parse-workers', type=int, default=int(os.getenv('OUTREACH_PARSE_WORKERS', '0')),
+                        help='processes for HTML parsing; 0 parses in-process, -1 uses every core')
+    parser.add_argument('--io-workers', type=int, default=int(os.getenv('OUTREACH_IO_WORKERS', '8')),
+                        help='fetch threads when --parse-workers is set')
+    parser.add_argument('--profile-dir', default=os.getenv('OUTREACH_PROFILE_DIR', ''),
+                        help='write cProfile/tracemalloc output here (see profiling.py)')
+    parser.add_argument('--large-run', action='store_true',
+                        help=f'spill each output bucket to disk every {LARGE_RUN_SPILL_ROWS} rows')
     args = parser.parse_args()
+    profiling.start('build_delivery_queues', args.profile_dir)
 
-    rows = read_csv(args.tracker)
-    pending = [r for r in rows if (r.get('response_status') or '').strip() == 'not_contacted']
+    rows = tracker_journal.iter_tracker(args.tracker)
+    pending = (r for r in rows if (r.get('response_status') or '').strip() == 'not_contacted')
 
-    session = requests.Session()
+    session = prepare_session(requests.Session())
     session.headers.update(HEADERS)
+    tracer = Tracer('build_delivery_queues', sample=LARGE_RUN_TRACE_SAMPLE if args.large_run else 0)
+
+    spill_rows = LARGE_RUN_SPILL_ROWS if args.large_run else 0
+    buckets = {
+        name: BucketWriter(os.path.join(args.out_dir, filename), spill_rows)
+        for name, filename in (
+            ('email', 'batch2_email_first.csv'),
+            ('form', 'batch2_forms_confirmable.csv'),
+            ('dm', 'dm_queue.csv'),
+            ('no_contact', 'no_contact_method.csv'),
+        )
+    }
 
-    email_first = []
-    forms = []
-    dm_queue = []
-    no_contact = []
-
-    for row in pending:
-        bucket, item = classify_row(session, row)
-        if bucket == 'email':
-            email_first.append(item)
-        elif bucket == 'form':
-            forms.append(item)
-        elif bucket == 'dm':
-            dm_queue.append(item)
-        else:
-            no_contact.append(item)
-
-    for lst in (email_first, forms, dm_queue, no_contact):
-        lst.sort(key=lambda x: (x.get('title') or '').lower())
-
-    fields = ['listing_id', 'title', 'listing_url', 'seed_contact_website', 'seed_source_url', 'reason', 'delivery_evidence', 'delivery_url']
-
-    write_csv(f"{args.out_dir}/batch2_email_first.csv", email_first, fields)
-    write_csv(f"{args.out_dir}/batch2_forms_confirmable.csv", forms, fields)
-    write_csv(f"{args.out_dir}/dm_queue.csv", dm_queue, fields)
-    write_csv(f"{args.out_dir}/no_contact_method.csv", no_contact, fields)
-
-    deliverable = (email_first + forms)[:args.deliverable_limit]
-    write_csv(f"{args.out_dir}/batch2_deliverable_30.csv", deliverable, fields)
-
-    print(f"email_first={len(email_first)} forms={len(forms)} dm_queue={len(dm_queue)} no_contact={len(no_contact)} deliverable={len(deliverable)}")
-
+    pool = parse_pool(args.parse_workers)
+    # Pipeline mode: I/O threads fetch pages while a process pool parses them,
+    # at most --io-workers rows ahead of the writers.
+    # requests.Session is not thread-safe, so each thread gets its own.
+    if pool:
+        local = threading.local()
+
+        def probe(row):
+            if not hasattr(local, 'session'):
+                local.session = prepare_session(requests.Session())
+                local.session.headers.update(HEADERS)
+            return traced_classify(tracer, local.session, row, pool)
+
+        io = ThreadPoolExecutor(max_workers=args.io_workers)
+        results = (result for _, result in probe_ahead(io, pending, probe, args.io_workers))
+    else:
+        results = (traced_classify(tracer, session, row) for row in pending)
+
+    for bucket, item in results:
+        buckets[bucket].add(item)
+
+    if pool:
+        io.shutdown()
+        pool.shutdown()
+    tracer.close()
+
+    for writer in buckets.values():
+        writer.close()
+
+    deliverable = read_head(buckets['email'].path, args.deliverable_limit)
+    deliverable += read_head(buckets['form'].path, args.deliverable_limit - len(deliverable))
+    with open(os.path.join(args.out_dir, 'batch2_deliverable_30.csv'), 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        w.writerows(deliverable)
+
+    print(f"email_first={buckets['email'].count} forms={buckets['form'].count} dm_queue={buckets['dm'].count} "
+          f"no_contact={buckets['no_contact'].count} deliverable={len(deliverable)}")
 
 if __name__ == '__main__':
     main()
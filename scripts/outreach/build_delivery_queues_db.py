@@ -3,7 +3,19 @@
 
 Replaces the CSV-based build_delivery_queues.py.
 Reads outreach_contacts where status='not_contacted' and contact_method IS NULL,
-probes each provider's website, then updates the row with the correct channel.
+then rows due for a reprobe (next_probe_at), probes each provider's website,
+and updates the row with the correct channel. A site that gives no contact
+method is scheduled for another probe with exponential backoff (see
+REPROBE_BACKOFF_HOURS).
+Finally rescores every not_contacted row's priority_score, which orders the
+senders' candidates (see outreach_refresh_priority_scores()).
+
+Each row also gets a probe_artifact: the address or the form (page,
+endpoint, field mapping) that was found, so the senders can act on it
+without crawling the site again. The page of each confirmable form is
+noted in form_cache as well.
+
+Each run writes its counts and stage timings to outreach_runs (see run_log.py).
 
 Required env vars:
   SUPABASE_URL
@@ -11,18 +23,34 @@ Required env vars:
 
 Optional:
   CLASSIFY_CITY    filter to a specific city
-  CLASSIFY_LIMIT   max rows to process (default: 100)
+  CLASSIFY_LIMIT   max rows to process, unclassified first, then due reprobes (default: 100)
+  OUTREACH_PARSE_WORKERS  processes for HTML parsing (default: 0 = in-process,
+                          -1 = one per CPU); enables the pipeline mode
+  OUTREACH_IO_WORKERS     fetch threads in pipeline mode (default: 8)
+  OUTREACH_TRACE_DIR      write per-contact stage timings here (see stage_trace.py)
+  OUTREACH_PACING_SECONDS pause after each site probe (default: 0.5)
+  OUTREACH_PROFILE_DIR    profile the run into this directory (see profiling.py)
 """
 
 import os
+import re
 import time
-from datetime import datetime, timezone
-from urllib.parse import urljoin, urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup
 from supabase import create_client, Client
 
+import form_cache
+import form_frameworks
+import profiling
+from http_cassette import note_seed, prepare_session
+from page_analysis import analyze_response, parse_pool
+from run_log import RunLog
+from stage_trace import Tracer, bind, span
+
 PLATFORM = {
     'onlyfans.com', 'www.onlyfans.com',
     'linktr.ee', 'www.linktr.ee',
@@ -31,13 +59,22 @@ PLATFORM = {
     't.me', 'telegram.me',
 }
 
-KEYWORDS = ('contact', 'booking', 'book', 'inquir', 'reach', 'get-in-touch')
-
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (compatible; DommeDirectoryBot/1.0)',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
 }
 
+# When to probe a 'none' site again, by evidence: (first, longest) delay in
+# hours, doubled for each further miss in a row. Transient failures come
+# back soon; a site without an address or form rarely changes. Anything
+# else (missing or invalid website) is never reprobed.
+REPROBE_BACKOFF_HOURS = {
+    'site_unreachable': (6, 7 * 24),
+    'http_5xx': (6, 7 * 24),
+    'form_or_email_not_found': (14 * 24, 90 * 24),
+    'form_builder': (14 * 24, 90 * 24),
+}
+
 
 def required_env(name: str) -> str:
     value = os.getenv(name, '').strip()
@@ -54,127 +91,170 @@ def supabase_client() -> Client:
     return create_client(required_env('SUPABASE_URL'), required_env('SUPABASE_SERVICE_ROLE_KEY'))
 
 
-def extract_mailto(soup: BeautifulSoup):
-    emails, seen = [], set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if href.lower().startswith('mailto:'):
-            addr = href.split(':', 1)[1].split('?', 1)[0].strip()
-            if addr and '@' in addr and addr.lower() not in seen:
-                seen.add(addr.lower())
-                emails.append(addr)
-    return emails
+def next_probe_at(evidence: str, failures: int) -> Optional[str]:
+    """When to reprobe after a 'none' outcome, given the misses before this one."""
+    kind = 'http_5xx' if re.fullmatch(r'http_5\d\d', evidence) else evidence.split(':')[0]
+    backoff = REPROBE_BACKOFF_HOURS.get(kind)
+    if backoff is None:
+        return None
+    first, longest = backoff
+    hours = min(first * 2 ** min(failures, 16), longest)
+    return (datetime.now(timezone.utc) + timedelta(hours=hours)).isoformat()
 
 
-def has_confirmable_form(soup: BeautifulSoup) -> bool:
-    for form in soup.find_all('form'):
-        html = str(form).lower()
-        if 'captcha' in html or 'g-recaptcha' in html or 'hcaptcha' in html:
-            continue
-        for t in form.find_all(['input', 'textarea']):
-            typ = (t.get('type') or 'text').lower()
-            if typ in ('hidden', 'submit', 'button', 'checkbox', 'radio', 'file'):
-                continue
-            hay = ' '.join([
-                (t.get('name') or '').lower(),
-                (t.get('id') or '').lower(),
-                (t.get('placeholder') or '').lower(),
-                (t.get('aria-label') or '').lower(),
-            ])
-            if any(k in hay for k in ('message', 'inquir', 'enquir', 'comment')):
-                return True
-    return False
-
-
-def contact_pages(base_url: str, soup: BeautifulSoup):
-    out, seen = [], set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href or href.lower().startswith(('mailto:', 'tel:', 'javascript:')):
-            continue
-        full = urljoin(base_url, href)
-        try:
-            u = urlparse(full)
-        except Exception:
-            continue
-        if u.scheme not in ('http', 'https'):
-            continue
-        label = (u.path + ('?' + u.query if u.query else '')).lower()
-        if not any(k in label for k in KEYWORDS):
-            continue
-        norm = u._replace(fragment='').geturl()
-        if norm in seen:
+def due_for_probe(query):
+    """Limit an outreach_contacts query to unclassified rows and due reprobes, in that order."""
+    return query \
+        .or_(f'contact_method.is.null,next_probe_at.lte."{now_iso()}"') \
+        .order('next_probe_at', nullsfirst=True)
+
+
+def form_outcome(website: str, page: dict):
+    """The contact_form outcome for a page with a confirmable form, or None.
+
+    The form is noted in form_cache. Forms built with a known plugin get
+    form_framework:<name> as evidence, so priority scores track each plugin.
+    """
+    for form in page['forms']:
+        if form['has_captcha']:
             continue
-        seen.add(norm)
-        out.append(norm)
-        if len(out) >= 5:
+        # Plugin fields (textarea-123) often carry no hint a generic check
+        # would recognize, so ask the detector for the message field.
+        schema = form_frameworks.detect(form, page['url'])
+        if 'message' in schema['fields']:
             break
-    return out
+    else:
+        return None
+    form_cache.note(form_cache.site_key(website), page['url'], schema)
+    if schema['framework'] == 'generic':
+        evidence = 'form_message_field_no_captcha'
+    else:
+        evidence = f"form_framework:{schema['framework']}"
+    artifact = {'page_url': page['url'], 'form': schema}
+    return 'contact_form', 'confirmable_form', evidence, page['url'], None, artifact
+
+
+def email_outcome(page: dict):
+    mail = page['emails'][0]
+    artifact = {'email': mail, 'page_url': page['url']}
+    return 'email', 'email_exposed', 'mailto_found', f'mailto:{mail}', mail, artifact
+
+
+def classify(website: str, pool: Optional[ProcessPoolExecutor] = None):
+    """Returns (contact_method, reason, evidence, delivery_url, email_found, probe_artifact).
 
+    probe_artifact is None unless an address or a confirmable form was found.
 
-def classify(website: str):
-    """Returns (contact_method, reason, evidence, delivery_url, email_found)."""
+    Pages are parsed by analyze_response, in `pool` when one is given.
+    """
     if not website:
-        return 'none', 'no_contact_method', 'missing_website', '', None
+        return 'none', 'no_contact_method', 'missing_website', '', None, None
 
+    note_seed('classify', website)
     if not website.startswith(('http://', 'https://')):
         website = f'https://{website}'
 
     try:
         host = urlparse(website).netloc.lower()
     except Exception:
-        return 'none', 'no_contact_method', 'invalid_url', '', None
+        return 'none', 'no_contact_method', 'invalid_url', '', None, None
 
     if host in PLATFORM:
-        return 'dm', 'platform_only', f'platform_domain:{host}', website, None
+        return 'dm', 'platform_only', f'platform_domain:{host}', website, None, None
 
-    session = requests.Session()
+    session = prepare_session(requests.Session())
     session.headers.update(HEADERS)
 
     try:
         home = session.get(website, timeout=20, allow_redirects=True)
     except Exception:
-        return 'none', 'no_contact_method', 'site_unreachable', website, None
+        return 'none', 'no_contact_method', 'site_unreachable', website, None, None
 
     if home.status_code >= 500:
-        return 'none', 'no_contact_method', f'http_{home.status_code}', home.url, None
+        return 'none', 'no_contact_method', f'http_{home.status_code}', home.url, None, None
 
-    soup = BeautifulSoup(home.text or '', 'html.parser')
-    mails = extract_mailto(soup)
-    if mails:
-        return 'email', 'email_exposed', 'mailto_found', f'mailto:{mails[0]}', mails[0]
+    page = analyze_response(home, pool)
+    if page['emails']:
+        return email_outcome(page)
 
-    if has_confirmable_form(soup):
-        return 'contact_form', 'confirmable_form', 'form_message_field_no_captcha', home.url, None
+    outcome = form_outcome(website, page)
+    if outcome:
+        return outcome
 
-    for page in contact_pages(home.url, soup):
+    for link in page['contact_links']:
         try:
-            resp = session.get(page, timeout=20, allow_redirects=True)
+            resp = session.get(link, timeout=20, allow_redirects=True)
         except Exception:
             continue
         if resp.status_code >= 400:
             continue
-        s2 = BeautifulSoup(resp.text or '', 'html.parser')
-        mails = extract_mailto(s2)
-        if mails:
-            return 'email', 'email_exposed', 'mailto_found', f'mailto:{mails[0]}', mails[0]
-        if has_confirmable_form(s2):
-            return 'contact_form', 'confirmable_form', 'form_message_field_no_captcha', resp.url, None
-
-    return 'none', 'no_contact_method', 'form_or_email_not_found', home.url, None
+        sub = analyze_response(resp, pool)
+        if sub['emails']:
+            return email_outcome(sub)
+        outcome = form_outcome(website, sub)
+        if outcome:
+            return outcome
+
+    if page['builder']:
+        # Wix/Squarespace forms are rendered from script; a person has to fill them in.
+        return 'none', 'no_contact_method', f"form_builder:{page['builder']}", home.url, None, None
+    return 'none', 'no_contact_method', 'form_or_email_not_found', home.url, None, None
+
+
+def save_classification(sb: Client, row: dict, outcome):
+    """Write a classify() outcome back to the contact row."""
+    method, reason, evidence, delivery_url, email_found, artifact = outcome
+
+    update = {
+        'contact_method': method,
+        'classification_reason': reason,
+        'classification_evidence': evidence,
+        'probe_artifact': artifact,
+        'classified_at': now_iso(),
+        'updated_at': now_iso(),
+    }
+
+    if method == 'none':
+        failures = row.get('probe_failures') or 0
+        update['probe_failures'] = failures + 1
+        update['next_probe_at'] = next_probe_at(evidence, failures)
+    else:
+        update['probe_failures'] = 0
+        update['next_probe_at'] = None
+
+    if email_found and not row.get('seed_contact_email'):
+        update['seed_contact_email'] = email_found
+
+    sb.table('outreach_contacts').update(update).eq('id', row['id']).execute()
+
+
+def refresh_priority_scores(sb: Client):
+    """Recompute priority_score for not_contacted rows; returns rows changed."""
+    try:
+        changed = sb.rpc('outreach_refresh_priority_scores').execute().data
+    except Exception as e:
+        print(f'  priority_score refresh failed: {e}')
+        return None
+    print(f'priority_scores_updated={changed}')
+    return changed
 
 
 def main():
+    profiling.start('build_delivery_queues_db')
     city_filter = os.getenv('CLASSIFY_CITY', '').strip().lower()
     limit = int(os.getenv('CLASSIFY_LIMIT', '100'))
+    parse_workers = int(os.getenv('OUTREACH_PARSE_WORKERS', '0'))
+    io_workers = int(os.getenv('OUTREACH_IO_WORKERS', '8'))
+    pacing = float(os.getenv('OUTREACH_PACING_SECONDS', '0.5'))
 
+    run = RunLog('build_delivery_queues_db')
     sb = supabase_client()
+    form_cache.configure(sb)
 
     query = sb.table('outreach_contacts') \
-        .select('id, seed_contact_website, display_name, city') \
-        .eq('status', 'not_contacted') \
-        .is_('contact_method', 'null') \
-        .limit(limit)
+        .select('id, seed_contact_website, display_name, city, probe_failures') \
+        .eq('status', 'not_contacted')
+    query = due_for_probe(query).limit(limit)
 
     if city_filter:
         query = query.ilike('city', f'%{city_filter}%')
@@ -185,29 +265,44 @@ def main():
 
     counts = {'email': 0, 'contact_form': 0, 'dm': 0, 'none': 0}
 
-    for row in rows:
-        method, reason, evidence, delivery_url, email_found = classify(
-            (row.get('seed_contact_website') or '').strip()
-        )
+    pool = parse_pool(parse_workers)
+
+    tracer = Tracer('build_delivery_queues_db', keep=True)
 
-        update = {
-            'contact_method': method,
-            'classification_reason': reason,
-            'classification_evidence': evidence,
-            'classified_at': now_iso(),
-            'updated_at': now_iso(),
-        }
+    def probe(row):
+        trace = tracer.start(row['id'])
+        with bind(trace):
+            outcome = classify((row.get('seed_contact_website') or '').strip(), pool)
+        time.sleep(pacing)
+        return outcome, trace
 
-        if email_found and not row.get('seed_contact_email'):
-            update['seed_contact_email'] = email_found
+    # Pipeline mode: I/O threads fetch pages while a process pool parses them.
+    # Results still come back, and are written, in row order.
+    io = ThreadPoolExecutor(max_workers=io_workers) if pool else None
+    outcomes = io.map(probe, rows) if io else map(probe, rows)
 
-        sb.table('outreach_contacts').update(update).eq('id', row['id']).execute()
+    for row, (outcome, trace) in zip(rows, outcomes):
+        method, reason = outcome[:2]
+
+        with bind(trace), span('db'):
+            save_classification(sb, row, outcome)
+        tracer.finish(trace, method=method, reason=reason)
         counts[method] = counts.get(method, 0) + 1
+        run.count(status='classified', channel=method, city=row.get('city'), evidence=outcome[2])
 
         print(f"  [{row.get('city','?')}] {row.get('display_name','?')} -> {method} ({reason})")
-        time.sleep(0.5)
+
+    if io:
+        io.shutdown()
+        pool.shutdown()
+    tracer.close()
+
+    changed = refresh_priority_scores(sb)
+    if changed is None:
+        run.error('priority_refresh')
 
     print(f"build_delivery_queues_db: email={counts['email']} form={counts['contact_form']} dm={counts['dm']} none={counts['none']}")
+    run.save(sb, tracer, priority_scores_updated=changed)
 
 
 if __name__ == '__main__':
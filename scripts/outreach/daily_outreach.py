@@ -7,17 +7,24 @@ Single source of truth for sender/reply email:
 
 import argparse
 import csv
+import itertools
 import os
-import re
 import smtplib
 import ssl
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from email.message import EmailMessage
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlencode, urlparse
 
 import requests
-from bs4 import BeautifulSoup
+
+import form_frameworks
+import profiling
+import tracker_journal
+from http_cassette import prepare_session
+from page_analysis import analyze_response, parse_pool, probe_ahead
+from stage_trace import Tracer, add_bytes, bind, span
 
 TAXONOMY = {
     'delivered_form',
@@ -76,13 +83,6 @@ def read_csv(path: str):
         return list(csv.DictReader(f))
 
 
-def write_csv(path: str, rows, fieldnames):
-    with open(path, 'w', newline='', encoding='utf-8') as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        w.writerows(rows)
-
-
 def ensure_tracker_columns(rows):
     if not rows:
         return []
@@ -110,87 +110,16 @@ def ensure_tracker_columns(rows):
     return fieldnames
 
 
-def extract_mailto(soup: BeautifulSoup):
-    out = []
-    seen = set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href.lower().startswith('mailto:'):
-            continue
-        email_addr = href.split(':', 1)[1].split('?', 1)[0].strip()
-        if not email_addr or '@' not in email_addr:
-            continue
-        key = email_addr.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(email_addr)
-    return out
-
-
-def contact_pages(base_url: str, soup: BeautifulSoup):
-    pages = []
-    seen = set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href or href.lower().startswith(('mailto:', 'tel:', 'javascript:')):
-            continue
-        full = urljoin(base_url, href)
-        try:
-            u = urlparse(full)
-        except Exception:
-            continue
-        if u.scheme not in ('http', 'https'):
-            continue
-        label = (u.path + ('?' + u.query if u.query else '')).lower()
-        if not any(k in label for k in KEYWORDS):
-            continue
-        norm = u._replace(fragment='').geturl()
-        if norm in seen:
-            continue
-        seen.add(norm)
-        pages.append(norm)
-        if len(pages) >= 5:
-            break
-    return pages
-
-
-def has_captcha(form_html: str) -> bool:
-    lower = form_html.lower()
-    return 'captcha' in lower or 'g-recaptcha' in lower or 'hcaptcha' in lower
-
-
-def pick_field(form, patterns, include_textarea=False):
-    tags = ['input'] + (['textarea'] if include_textarea else [])
-    for t in form.find_all(tags):
-        typ = (t.get('type') or 'text').lower()
-        if typ in ('hidden', 'submit', 'button', 'checkbox', 'radio', 'file'):
-            continue
-        hay = ' '.join([
-            (t.get('name') or '').lower(),
-            (t.get('id') or '').lower(),
-            (t.get('placeholder') or '').lower(),
-            (t.get('aria-label') or '').lower(),
-        ])
-        if any(p in hay for p in patterns):
-            return t
-    return None
-
-
-def submit_form(session: requests.Session, page_url: str, form, listing_url: str, sender_name: str, reply_to_email: str):
-    if has_captcha(str(form)):
+def submit_form(session: requests.Session, page_url: str, form: dict, listing_url: str, sender_name: str, reply_to_email: str):
+    """Fill and submit one form descriptor (see page_analysis.describe_form)."""
+    if form['has_captcha']:
         return 'needs_manual', 'captcha_present', page_url
 
-    method = (form.get('method') or 'post').lower()
-    action = form.get('action') or page_url
-    action_url = urljoin(page_url, action)
-
-    name_field = pick_field(form, ['name'])
-    email_field = pick_field(form, ['email'])
-    subject_field = pick_field(form, ['subject'])
-    message_field = pick_field(form, ['message', 'inquir', 'enquir', 'comment'], include_textarea=True)
+    schema = form_frameworks.detect(form, page_url)
+    method = schema['method']
+    action_url = schema['endpoint']
 
-    if message_field is None or not message_field.get('name'):
+    if 'message' not in schema['fields']:
         return 'needs_manual', 'form_no_message_field', page_url
 
     body = (
@@ -204,39 +133,24 @@ def submit_form(session: requests.Session, page_url: str, form, listing_url: str
         f'— {sender_name}\nDommeDirectory\n{reply_to_email}\n'
     )
 
-    data = {}
-    for inp in form.find_all(['input', 'textarea', 'select']):
-        n = inp.get('name')
-        if not n:
-            continue
-        typ = (inp.get('type') or 'text').lower()
-        if typ in ('submit', 'button', 'file'):
-            continue
-        if typ in ('checkbox', 'radio'):
-            if inp.has_attr('checked'):
-                data[n] = inp.get('value', 'on')
-            continue
-        if inp.name == 'textarea':
-            data[n] = inp.text or ''
-        else:
-            data[n] = inp.get('value', '')
-
-    data[message_field.get('name')] = body
-    if name_field is not None and name_field.get('name'):
-        data[name_field.get('name')] = sender_name
-    if email_field is not None and email_field.get('name'):
-        data[email_field.get('name')] = reply_to_email
-    if subject_field is not None and subject_field.get('name'):
-        data[subject_field.get('name')] = 'Your listing on DommeDirectory — quick note'
+    data = form_frameworks.form_data(schema, form, form_frameworks.contact_values(
+        sender_name, reply_to_email, 'Your listing on DommeDirectory — quick note', body))
 
+    add_bytes('form_submit', len(urlencode(data)))
     try:
-        if method == 'get':
-            resp = session.get(action_url, params=data, headers=HEADERS, timeout=25, allow_redirects=True)
-        else:
-            resp = session.post(action_url, data=data, headers=HEADERS, timeout=25, allow_redirects=True)
+        with span('form_submit'):
+            if method == 'get':
+                resp = session.get(action_url, params=data, headers=HEADERS, timeout=25, allow_redirects=True)
+            else:
+                resp = session.post(action_url, data=data, headers=HEADERS, timeout=25, allow_redirects=True)
     except Exception:
         return 'site_down', 'form_submit_request_failed', action_url
 
+    verdict = form_frameworks.read_response(schema, resp)
+    if verdict is not None:
+        delivered, evidence = verdict
+        return ('delivered_form' if delivered else 'needs_manual'), evidence, resp.url
+
     body_text = (resp.text or '').lower()
     if any(s in body_text for s in SUCCESS_HINTS):
         return 'delivered_form', 'success_hint', resp.url
@@ -265,8 +179,9 @@ def send_email(to_addr: str, listing_url: str, sender_name: str, reply_to_email:
     )
 
     ctx = ssl.create_default_context()
+    add_bytes('smtp', len(msg.as_bytes()))
     try:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=25) as server:
+        with span('smtp'), smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=25) as server:
             server.login(smtp_user, smtp_pass)
             server.send_message(msg)
         return 'delivered_email', 'smtp_sent', f'mailto:{to_addr}'
@@ -274,39 +189,83 @@ def send_email(to_addr: str, listing_url: str, sender_name: str, reply_to_email:
         return 'needs_manual', 'smtp_send_failed', f'mailto:{to_addr}'
 
 
-def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
+def form_pages(session, home, page_urls, pool=None):
+    """Yield (page_url, forms) for each reachable page that has forms, lazily."""
+    visited = set()
+    for page_url in page_urls:
+        if page_url in visited:
+            continue
+        visited.add(page_url)
+
+        try:
+            resp = home if page_url == home.url else session.get(page_url, timeout=25, allow_redirects=True)
+        except Exception:
+            continue
+
+        if resp.status_code >= 400:
+            continue
+
+        forms = analyze_response(resp, pool)['forms']
+        if forms:
+            yield resp.url, forms
+
+
+def probe_candidate(row, pool=None):
+    """Fetch and analyze a provider's site without contacting anyone.
+
+    Returns a plan for deliver_plan(): a final result, an address to email,
+    or the first page with forms (plus a generator over the remaining pages,
+    fetched only if every form there fails).
+    """
     website = clean_url(row.get('seed_contact_website', ''))
-    listing_url = (row.get('listing_url') or '').strip()
 
     if not website:
-        return 'no_contact_method', 'missing_seed_contact_website', ''
+        return {'result': ('no_contact_method', 'missing_seed_contact_website', '')}
 
     try:
         host = urlparse(website).netloc.lower()
     except Exception:
-        return 'no_contact_method', 'invalid_website_url', ''
+        return {'result': ('no_contact_method', 'invalid_website_url', '')}
 
     if host in PLATFORM_DOMAINS:
-        return 'platform_only', f'platform_domain:{host}', website
+        return {'result': ('platform_only', f'platform_domain:{host}', website)}
 
-    session = requests.Session()
+    session = prepare_session(requests.Session())
     session.headers.update(HEADERS)
 
     try:
         home = session.get(website, timeout=25, allow_redirects=True)
     except Exception:
-        return 'site_down', 'site_unreachable', website
+        return {'result': ('site_down', 'site_unreachable', website)}
 
     if home.status_code >= 500:
-        return 'site_down', f'http_{home.status_code}', home.url
+        return {'result': ('site_down', f'http_{home.status_code}', home.url)}
 
-    home_soup = BeautifulSoup(home.text or '', 'html.parser')
-    emails = extract_mailto(home_soup)
+    page = analyze_response(home, pool)
 
     # email first
-    if emails:
+    if page['emails']:
+        return {'email': page['emails'][0]}
+
+    pages = form_pages(session, home, [home.url] + page['contact_links'], pool)
+    return {
+        'session': session,
+        'home_url': home.url,
+        'first': next(pages, None),
+        'more': pages,
+    }
+
+
+def deliver_plan(plan, row, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
+    """Act on a probe_candidate() plan. Returns (status, evidence, delivery_url)."""
+    listing_url = (row.get('listing_url') or '').strip()
+
+    if 'result' in plan:
+        return plan['result']
+
+    if 'email' in plan:
         return send_email(
-            emails[0],
+            plan['email'],
             listing_url,
             sender_name,
             reply_to_email,
@@ -316,28 +275,12 @@ def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, sm
             smtp_port,
         )
 
-    pages = [home.url] + contact_pages(home.url, home_soup)
-    visited = set()
-
-    for page_url in pages:
-        if page_url in visited:
-            continue
-        visited.add(page_url)
-
-        try:
-            resp = home if page_url == home.url else session.get(page_url, timeout=25, allow_redirects=True)
-        except Exception:
-            continue
-
-        if resp.status_code >= 400:
-            continue
-
-        soup = BeautifulSoup(resp.text or '', 'html.parser')
-        forms = soup.find_all('form')
+    found = [plan['first']] if plan['first'] else []
+    for page_url, forms in itertools.chain(found, plan['more']):
         for form in forms:
             status, evidence, delivery_url = submit_form(
-                session,
-                resp.url,
+                plan['session'],
+                page_url,
                 form,
                 listing_url,
                 sender_name,
@@ -346,7 +289,12 @@ def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, sm
             if status in {'delivered_form', 'needs_manual'}:
                 return status, evidence, delivery_url
 
-    return 'no_contact_method', 'form_or_email_not_found', home.url
+    return 'no_contact_method', 'form_or_email_not_found', plan['home_url']
+
+
+def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
+    return deliver_plan(probe_candidate(row), row, sender_name, reply_to_email,
+                        smtp_user, smtp_pass, smtp_host, smtp_port)
 
 
 def main():
@@ -354,7 +302,23 @@ def main():
     parser.add_argument('--targets', required=True)
     parser.add_argument('--tracker', required=True)
     parser.add_argument('--daily-limit', type=int, default=int(os.getenv('OUTREACH_DAILY_LIMIT', '8')))
+    parser.add_argument('--compact-every', type=int, default=500,
+                        help='fold the tracker journal into the CSV once it has this many entries')
+    parser.add_argument('--compact', action='store_true', help='fold the tracker journal into the CSV and exit')
+    parser.add_argument('--parse-workers', type=int, default=int(os.getenv('OUTREACH_PARSE_WORKERS', '0')),
+                        help='processes for HTML parsing (0 = in-process, -1 = one per CPU)')
+    parser.add_argument('--io-workers', type=int, default=int(os.getenv('OUTREACH_IO_WORKERS', '8')),
+                        help='candidates probed ahead when --parse-workers is set')
+    parser.add_argument('--profile-dir', default=os.getenv('OUTREACH_PROFILE_DIR', ''),
+                        help='write cProfile/tracemalloc output here (see profiling.py)')
     args = parser.parse_args()
+    profiling.start('daily_outreach', args.profile_dir)
+
+    if args.compact:
+        tracker, pending = tracker_journal.load_tracker(args.tracker)
+        tracker_journal.compact(args.tracker, tracker, ensure_tracker_columns(tracker))
+        print(f'daily_outreach: compacted journal_entries={pending}')
+        return
 
     reply_to_email = required_env('OUTREACH_REPLY_TO_EMAIL')
     sender_name = os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships')
@@ -365,7 +329,9 @@ def main():
     smtp_port = int(os.getenv('OUTREACH_SMTP_PORT', '465'))
 
     targets = read_csv(args.targets)
-    tracker = read_csv(args.tracker)
+    # Replaying the journal resumes an interrupted run: rows it already
+    # touched are no longer not_contacted and are skipped below.
+    tracker, journal_entries = tracker_journal.load_tracker(args.tracker)
     fieldnames = ensure_tracker_columns(tracker)
 
     tracker_map = {r['listing_id']: r for r in tracker}
@@ -383,27 +349,56 @@ def main():
         candidates.append((t, row))
 
     sent_today = 0
-
-    for target, tracker_row in candidates:
+    journal = tracker_journal.open_journal(args.tracker)
+    pool = parse_pool(args.parse_workers)
+
+    tracer = Tracer('daily_outreach')
+
+    def probe(item):
+        trace = tracer.start(item[0]['listing_id'])
+        with bind(trace):
+            plan = probe_candidate(item[0], pool)
+        plan['trace'] = trace
+        return plan
+
+    # Pipeline mode: upcoming candidates are fetched and parsed while the
+    # current one is delivered. Probes never contact anyone.
+    io = ThreadPoolExecutor(max_workers=args.io_workers) if pool else None
+    if io:
+        work = probe_ahead(io, candidates, probe, args.io_workers)
+    else:
+        work = ((item, probe(item)) for item in candidates)
+
+    for (target, tracker_row), plan in work:
         if sent_today >= args.daily_limit:
             break
 
-        status, evidence, delivery_url = process_candidate(
-            target,
-            sender_name,
-            reply_to_email,
-            smtp_user,
-            smtp_pass,
-            smtp_host,
-            smtp_port,
-        )
+        trace = plan['trace']
+        with bind(trace):
+            status, evidence, delivery_url = deliver_plan(
+                plan,
+                target,
+                sender_name,
+                reply_to_email,
+                smtp_user,
+                smtp_pass,
+                smtp_host,
+                smtp_port,
+            )
 
-        tracker_row['contacted_at'] = now_stamp()
-        tracker_row['contact_channel'] = 'email' if status == 'delivered_email' else ('dm' if status in {'platform_only', 'dm_sent'} else 'contact_form')
-        tracker_row['response_status'] = status
-        tracker_row['delivery_evidence'] = evidence
-        tracker_row['delivery_url'] = delivery_url
-        tracker_row['notes'] = evidence
+        changes = {
+            'contacted_at': now_stamp(),
+            'contact_channel': 'email' if status == 'delivered_email' else ('dm' if status in {'platform_only', 'dm_sent'} else 'contact_form'),
+            'response_status': status,
+            'delivery_evidence': evidence,
+            'delivery_url': delivery_url,
+            'notes': evidence,
+        }
+        tracker_row.update(changes)
+        with bind(trace), span('journal'):
+            tracker_journal.append_change(journal, tracker_row['listing_id'], changes)
+        tracer.finish(trace, status=status, evidence=evidence)
+        journal_entries += 1
 
         # Count only delivery attempts (not platform_only/no_contact/site_down pre-classification)
         if status in {'delivered_form', 'delivered_email', 'needs_manual'}:
@@ -412,8 +407,17 @@ def main():
         print(f"{target['title']} -> {status} ({evidence})")
         time.sleep(1.0)
 
-    write_csv(args.tracker, tracker, fieldnames)
-    print(f'daily_outreach: attempts_recorded={sent_today}')
+    if io:
+        work.close()
+        io.shutdown()
+        pool.shutdown()
+    tracer.close()
+
+    journal.close()
+    if journal_entries >= args.compact_every:
+        tracker_journal.compact(args.tracker, tracker, fieldnames)
+        journal_entries = 0
+    print(f'daily_outreach: attempts_recorded={sent_today} journal_entries={journal_entries}')
 
 
 if __name__ == '__main__':
@@ -3,6 +3,9 @@
 
 Replaces the CSV-tracker version. Reads candidates from DB, writes results
 back to DB with a consent-first template (no "listing is live" language).
+Each contact is claimed in the send ledger before it is contacted, so a
+crashed or parallel run never contacts it twice (see send_ledger.py).
+Each run writes its counts and stage timings to outreach_runs (see run_log.py).
 
 Required env vars:
   SUPABASE_URL
@@ -17,20 +20,46 @@ Optional env vars:
   OUTREACH_SMTP_PORT       (default: 465)
   OUTREACH_DAILY_LIMIT     (default: 8)
   OUTREACH_CITY            (filter to specific city slug, e.g. 'toronto')
+  OUTREACH_PARSE_WORKERS   (processes for HTML parsing; default 0 = in-process,
+                            -1 = one per CPU)
+  OUTREACH_IO_WORKERS      (candidates probed ahead; default 8, 0 = one candidate at a time)
+  OUTREACH_WRITE_QUEUE     (delivered results waiting for the DB writer; default 4)
+  OUTREACH_TRACE_DIR       (write per-candidate stage timings here; see stage_trace.py)
+  OUTREACH_PACING_SECONDS  (pause after each candidate; default 1.0, 0 in shadow mode)
+  OUTREACH_PROFILE_DIR     (profile the run into this directory; see profiling.py)
+  OUTREACH_SHADOW          (run against the shadow copy and local sinks; see shadow.py)
+  OUTREACH_SMTP_DAILY_CAP  (provider's daily cap, shared with the other senders; see send_quota.py)
+  OUTREACH_SEND_LEASE_SECONDS (how long a send may stay unrecorded before the next run
+                            reconciles it; default 900, see send_ledger.py)
+  OUTREACH_ARTIFACT_MAX_AGE_DAYS (act on the classifier's probe_artifact up to this age; default 30,
+                            0 = always crawl)
 """
 
+import itertools
 import os
+import queue
 import re
-import smtplib
 import ssl
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from email.message import EmailMessage
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlencode, urlparse
 
 import requests
-from bs4 import BeautifulSoup
-from supabase import create_client, Client
+from supabase import Client
+
+import form_cache
+import form_frameworks
+import profiling
+import send_ledger
+import send_quota
+import shadow
+from http_cassette import note_seed, prepare_session
+from page_analysis import analyze_response, parse_pool, probe_ahead
+from run_log import RunLog
+from stage_trace import Tracer, add_bytes, bind, span
 
 # ---------------------------------------------------------------------------
 # Config
@@ -50,7 +79,29 @@ SUCCESS_HINTS = (
     'inquiry received',
 )
 
-KEYWORDS = ('contact', 'booking', 'book', 'inquir', 'reach', 'get-in-touch')
+# deliver_plan() statuses that use up a slot of the daily limit.
+COUNTED_STATUSES = ('delivered_email', 'delivered_form', 'needs_manual')
+
+# outreach_attempts channel per deliver_plan() status (default contact_form).
+CHANNEL_BY_STATUS = {
+    'delivered_email': 'email',
+    'delivered_form': 'contact_form',
+    'platform_only': 'dm',
+    'dm_sent': 'dm',
+}
+
+# Send ledger step and template of the first message.
+INITIAL_STEP = 'initial'
+INITIAL_TEMPLATE = 'v1_permission_request'
+
+# Candidate addresses per query in contacted_emails().
+EMAIL_LOOKUP_CHUNK = 100
+
+# Older probe artifacts are ignored and the site is crawled again.
+ARTIFACT_MAX_AGE_DAYS = float(os.getenv('OUTREACH_ARTIFACT_MAX_AGE_DAYS', '30'))
+
+CANDIDATE_COLUMNS = ('id, listing_id, display_name, seed_contact_website, seed_contact_email, '
+                     'contact_method, city, classified_at, probe_artifact')
 
 HEADERS = {
     'User-Agent': (
@@ -74,7 +125,7 @@ def now_iso() -> str:
 
 
 def supabase_client() -> Client:
-    return create_client(required_env('SUPABASE_URL'), required_env('SUPABASE_SERVICE_ROLE_KEY'))
+    return shadow.supabase_client(required_env('SUPABASE_URL'), required_env('SUPABASE_SERVICE_ROLE_KEY'))
 
 
 # ---------------------------------------------------------------------------
@@ -95,71 +146,6 @@ def looks_like_email(value: str) -> bool:
     return bool(re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', v))
 
 
-def extract_mailto(soup: BeautifulSoup):
-    out, seen = [], set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href.lower().startswith('mailto:'):
-            continue
-        addr = href.split(':', 1)[1].split('?', 1)[0].strip()
-        if not addr or '@' not in addr:
-            continue
-        key = addr.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(addr)
-    return out
-
-
-def contact_pages(base_url: str, soup: BeautifulSoup):
-    pages, seen = [], set()
-    for a in soup.select('a[href]'):
-        href = (a.get('href') or '').strip()
-        if not href or href.lower().startswith(('mailto:', 'tel:', 'javascript:')):
-            continue
-        full = urljoin(base_url, href)
-        try:
-            u = urlparse(full)
-        except Exception:
-            continue
-        if u.scheme not in ('http', 'https'):
-            continue
-        label = (u.path + ('?' + u.query if u.query else '')).lower()
-        if not any(k in label for k in KEYWORDS):
-            continue
-        norm = u._replace(fragment='').geturl()
-        if norm in seen:
-            continue
-        seen.add(norm)
-        pages.append(norm)
-        if len(pages) >= 5:
-            break
-    return pages
-
-
-def has_captcha(form_html: str) -> bool:
-    lower = form_html.lower()
-    return 'captcha' in lower or 'g-recaptcha' in lower or 'hcaptcha' in lower
-
-
-def pick_field(form, patterns, include_textarea=False):
-    tags = ['input'] + (['textarea'] if include_textarea else [])
-    for t in form.find_all(tags):
-        typ = (t.get('type') or 'text').lower()
-        if typ in ('hidden', 'submit', 'button', 'checkbox', 'radio', 'file'):
-            continue
-        hay = ' '.join([
-            (t.get('name') or '').lower(),
-            (t.get('id') or '').lower(),
-            (t.get('placeholder') or '').lower(),
-            (t.get('aria-label') or '').lower(),
-        ])
-        if any(p in hay for p in patterns):
-            return t
-    return None
-
-
 def build_initial_body(sender_name: str, reply_to_email: str) -> str:
     return (
         'Hi,\n\n'
@@ -173,54 +159,44 @@ def build_initial_body(sender_name: str, reply_to_email: str) -> str:
     )
 
 
-def submit_form(session, page_url, form, sender_name, reply_to_email):
-    if has_captcha(str(form)):
-        return 'needs_manual', 'captcha_present', page_url
-
-    method = (form.get('method') or 'post').lower()
-    action = form.get('action') or page_url
-    action_url = urljoin(page_url, action)
+def submit_form(session, page_url, form, schema, sender_name, reply_to_email):
+    """Fill and submit one form descriptor (see page_analysis.describe_form).
 
-    name_field = pick_field(form, ['name'])
-    email_field = pick_field(form, ['email'])
-    subject_field = pick_field(form, ['subject'])
-    message_field = pick_field(form, ['message', 'inquir', 'enquir', 'comment'], include_textarea=True)
+    schema comes from form_frameworks.detect() and says where to post and
+    which field takes what.
+    """
+    if form['has_captcha']:
+        return 'needs_manual', 'captcha_present', page_url
 
-    if message_field is None or not message_field.get('name'):
+    if 'message' not in schema['fields']:
         return 'needs_manual', 'form_no_message_field', page_url
 
-    body = build_initial_body(sender_name, reply_to_email)
-
-    data = {}
-    for inp in form.find_all(['input', 'textarea', 'select']):
-        n = inp.get('name')
-        if not n:
-            continue
-        typ = (inp.get('type') or 'text').lower()
-        if typ in ('submit', 'button', 'file'):
-            continue
-        if typ in ('checkbox', 'radio'):
-            if inp.has_attr('checked'):
-                data[n] = inp.get('value', 'on')
-            continue
-        data[n] = inp.text if inp.name == 'textarea' else inp.get('value', '')
-
-    data[message_field.get('name')] = body
-    if name_field and name_field.get('name'):
-        data[name_field.get('name')] = sender_name
-    if email_field and email_field.get('name'):
-        data[email_field.get('name')] = reply_to_email
-    if subject_field and subject_field.get('name'):
-        data[subject_field.get('name')] = 'Quick permission request from DommeDirectory'
-
+    method = schema['method']
+    action_url = schema['endpoint']
+    data = form_frameworks.form_data(schema, form, form_frameworks.contact_values(
+        sender_name, reply_to_email,
+        'Quick permission request from DommeDirectory',
+        build_initial_body(sender_name, reply_to_email),
+    ))
+
+    add_bytes('form_submit', len(urlencode(data)))
+    target = shadow.form_target(action_url)
+    if target is None:
+        return 'delivered_form', 'shadow_form_discarded', action_url
     try:
-        if method == 'get':
-            resp = session.get(action_url, params=data, headers=HEADERS, timeout=25, allow_redirects=True)
-        else:
-            resp = session.post(action_url, data=data, headers=HEADERS, timeout=25, allow_redirects=True)
+        with span('form_submit'):
+            if method == 'get':
+                resp = session.get(target, params=data, headers=HEADERS, timeout=25, allow_redirects=True)
+            else:
+                resp = session.post(target, data=data, headers=HEADERS, timeout=25, allow_redirects=True)
     except Exception:
         return 'site_down', 'form_submit_request_failed', action_url
 
+    verdict = form_frameworks.read_response(schema, resp)
+    if verdict is not None:
+        delivered, evidence = verdict
+        return ('delivered_form' if delivered else 'needs_manual'), evidence, resp.url
+
     body_text = (resp.text or '').lower()
     if any(s in body_text for s in SUCCESS_HINTS):
         return 'delivered_form', 'success_hint', resp.url
@@ -240,77 +216,210 @@ def send_email(to_addr, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_
     msg.set_content(build_initial_body(sender_name, reply_to_email))
 
     ctx = ssl.create_default_context()
+    add_bytes('smtp', len(msg.as_bytes()))
+    reservation = send_quota.reserve()
     try:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=25) as server:
+        with span('smtp'), shadow.smtp_connection(smtp_host, smtp_port, ctx) as server:
             server.login(smtp_user, smtp_pass)
             server.send_message(msg)
-        return 'delivered_email', 'smtp_sent', f'mailto:{to_addr}'
     except Exception:
+        send_quota.release(reservation)
         return 'needs_manual', 'smtp_send_failed', f'mailto:{to_addr}'
+    send_quota.commit(reservation)
+    return 'delivered_email', 'smtp_sent', f'mailto:{to_addr}'
 
 
-def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
-    """Try to contact a provider. Returns (status, evidence, delivery_url)."""
+def form_pages(session, home, page_urls, pool=None):
+    """Yield (page_url, forms) for each reachable page that has forms, lazily."""
+    visited = set()
+    for page_url in page_urls:
+        if page_url in visited:
+            continue
+        visited.add(page_url)
+
+        try:
+            resp = home if page_url == home.url else session.get(page_url, timeout=25, allow_redirects=True)
+        except Exception:
+            continue
+
+        if resp.status_code >= 400:
+            continue
+
+        forms = analyze_response(resp, pool)['forms']
+        if forms:
+            yield resp.url, forms
+
+
+def cached_form_page(session, site, cached, pool=None):
+    """(page_url, forms) for a known form page, keeping the forms that still fit.
+
+    With a site, a page that is gone or no longer has the form is dropped
+    from form_cache.
+    """
+    try:
+        resp = session.get(cached['page_url'], timeout=25, allow_redirects=True)
+    except Exception:
+        return None
+    if resp.status_code >= 500:
+        return None
+    forms = []
+    if resp.status_code < 400:
+        forms = [f for f in analyze_response(resp, pool)['forms'] if form_frameworks.matches(cached, f)]
+    if not forms:
+        if site:
+            form_cache.forget(site)
+        return None
+    return resp.url, forms
+
+
+def fresh_artifact(row) -> dict:
+    """The row's probe_artifact, or {} if there is none or it is too old to trust."""
+    artifact = row.get('probe_artifact')
+    if not artifact or ARTIFACT_MAX_AGE_DAYS <= 0:
+        return {}
+    try:
+        classified = datetime.fromisoformat(row['classified_at'])
+    except Exception:
+        return {}
+    age = datetime.now(timezone.utc) - classified
+    return artifact if age.total_seconds() <= ARTIFACT_MAX_AGE_DAYS * 86400 else {}
+
+
+def probe_input(row: dict, website: str) -> dict:
+    """What probe_candidate() needs from a candidate row."""
+    return {
+        'seed_contact_website': website,
+        'classified_at': row.get('classified_at'),
+        'probe_artifact': row.get('probe_artifact'),
+    }
+
+
+def probe_candidate(row, pool=None):
+    """Fetch and analyze a provider's site without contacting anyone.
+
+    Returns a plan for deliver_plan(): a final result, an address to email,
+    or the first page with forms (plus a generator over the remaining pages,
+    fetched only if every form there fails).
+
+    The classifier's probe_artifact is used while fresh: an address is
+    emailed without fetching anything, and a form page is fetched on its
+    own. A site in form_cache goes straight to its cached form page, which
+    wins over the artifact's. Anything stale falls back to crawling the
+    site from the home page.
+    """
     website = clean_url(row.get('seed_contact_website', ''))
     seed_email = (row.get('seed_contact_email') or '').strip()
+    note_seed('probe', website)
 
     if looks_like_email(seed_email):
-        return send_email(seed_email, sender_name, reply_to_email,
-                          smtp_user, smtp_pass, smtp_host, smtp_port)
+        return {'email': seed_email}
+
+    artifact = fresh_artifact(row)
+    if looks_like_email(artifact.get('email', '')):
+        return {'email': artifact['email']}
 
     if not website:
-        return 'no_contact_method', 'missing_seed_contact_website', ''
+        return {'result': ('no_contact_method', 'missing_seed_contact_website', '')}
 
     try:
         host = urlparse(website).netloc.lower()
     except Exception:
-        return 'no_contact_method', 'invalid_website_url', ''
+        return {'result': ('no_contact_method', 'invalid_website_url', '')}
 
     if host in PLATFORM_DOMAINS:
-        return 'platform_only', f'platform_domain:{host}', website
+        return {'result': ('platform_only', f'platform_domain:{host}', website)}
 
-    session = requests.Session()
+    session = prepare_session(requests.Session())
     session.headers.update(HEADERS)
 
+    site = form_cache.site_key(website)
+    cached = form_cache.lookup(site)
+    found = cached_form_page(session, site, cached, pool) if cached else None
+    if found:
+        return {
+            'session': session,
+            'home_url': website,
+            'site': site,
+            'cached': cached,
+            'first': found,
+            'more': iter(()),
+        }
+
+    if artifact.get('form'):
+        known = dict(artifact['form'], page_url=artifact['page_url'])
+        found = cached_form_page(session, None, known, pool)
+        if found:
+            return {
+                'session': session,
+                'home_url': website,
+                'site': site,
+                'known': known,
+                'first': found,
+                'more': iter(()),
+            }
+
     try:
         home = session.get(website, timeout=25, allow_redirects=True)
     except Exception:
-        return 'site_down', 'site_unreachable', website
+        return {'result': ('site_down', 'site_unreachable', website)}
 
     if home.status_code >= 500:
-        return 'site_down', f'http_{home.status_code}', home.url
+        return {'result': ('site_down', f'http_{home.status_code}', home.url)}
+
+    page = analyze_response(home, pool)
+    if page['emails']:
+        return {'email': page['emails'][0]}
+
+    pages = form_pages(session, home, [home.url] + page['contact_links'], pool)
+    return {
+        'session': session,
+        'home_url': home.url,
+        'site': site,
+        'builder': page['builder'],
+        'first': next(pages, None),
+        'more': pages,
+    }
 
-    home_soup = BeautifulSoup(home.text or '', 'html.parser')
-    emails = extract_mailto(home_soup)
 
-    if emails:
-        return send_email(emails[0], sender_name, reply_to_email,
-                          smtp_user, smtp_pass, smtp_host, smtp_port)
+def deliver_plan(plan, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
+    """Act on a probe_candidate() plan. Returns (status, evidence, delivery_url).
 
-    pages = [home.url] + contact_pages(home.url, home_soup)
-    visited = set()
-
-    for page_url in pages:
-        if page_url in visited:
-            continue
-        visited.add(page_url)
-
-        try:
-            resp = home if page_url == home.url else session.get(page_url, timeout=25, allow_redirects=True)
-        except Exception:
-            continue
+    Raises send_quota.QuotaExhausted, without contacting anyone, when an
+    email is due but the shared daily send cap is used up.
+    """
+    if 'result' in plan:
+        return plan['result']
 
-        if resp.status_code >= 400:
-            continue
+    if 'email' in plan:
+        return send_email(plan['email'], sender_name, reply_to_email,
+                          smtp_user, smtp_pass, smtp_host, smtp_port)
 
-        soup = BeautifulSoup(resp.text or '', 'html.parser')
-        for form in soup.find_all('form'):
+    site, cached = plan['site'], plan.get('cached')
+    known = cached or plan.get('known')
+    found = [plan['first']] if plan['first'] else []
+    for page_url, forms in itertools.chain(found, plan['more']):
+        for form in forms:
+            schema = form_frameworks.detect(form, page_url, known)
             status, evidence, delivery_url = submit_form(
-                session, resp.url, form, sender_name, reply_to_email)
+                plan['session'], page_url, form, schema, sender_name, reply_to_email)
+            if status == 'delivered_form':
+                form_cache.remember(site, page_url, schema)
+            elif status == 'needs_manual' and cached:
+                form_cache.failed(site)
             if status in {'delivered_form', 'needs_manual'}:
                 return status, evidence, delivery_url
 
-    return 'no_contact_method', 'form_or_email_not_found', home.url
+    if cached:
+        form_cache.failed(site)
+    if plan.get('builder'):
+        return 'no_contact_method', f"form_builder:{plan['builder']}", plan['home_url']
+    return 'no_contact_method', 'form_or_email_not_found', plan['home_url']
+
+
+def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, smtp_host, smtp_port):
+    """Try to contact a provider. Returns (status, evidence, delivery_url)."""
+    return deliver_plan(probe_candidate(row), sender_name, reply_to_email,
+                        smtp_user, smtp_pass, smtp_host, smtp_port)
 
 
 # ---------------------------------------------------------------------------
@@ -319,8 +428,9 @@ def process_candidate(row, sender_name, reply_to_email, smtp_user, smtp_pass, sm
 
 
 def record_attempt(sb: Client, contact_id: str, listing_id: str, channel: str,
-                   delivery_url: str, evidence: str, status: str, template: str):
-    sb.table('outreach_attempts').insert({
+                   delivery_url: str, evidence: str, status: str, template: str,
+                   send_key: str = None):
+    attempt = {
         'contact_id': contact_id,
         'listing_id': listing_id,
         'channel': channel,
@@ -329,7 +439,138 @@ def record_attempt(sb: Client, contact_id: str, listing_id: str, channel: str,
         'status': status,
         'template_version': template,
         'sent_at': now_iso(),
-    }).execute()
+    }
+    if send_key:
+        # Written at most once per send, even when a reconcile repeats it.
+        sb.table('outreach_attempts') \
+            .upsert(dict(attempt, send_key=send_key), on_conflict='send_key', ignore_duplicates=True) \
+            .execute()
+    else:
+        sb.table('outreach_attempts').insert(attempt).execute()
+
+
+def save_result(sb: Client, row: dict, status: str, evidence: str, delivery_url: str,
+                claimed: bool = False):
+    """Write a deliver_plan() outcome to the contact row and outreach_attempts.
+
+    claimed: the outcome of a send claimed in the ledger, whose attempt is
+    keyed so it is written once.
+    """
+    channel = CHANNEL_BY_STATUS.get(status, 'contact_form')
+
+    attempt_status = 'sent' if status in ('delivered_email', 'delivered_form') else 'failed'
+
+    # status already matches the outreach_contacts CHECK constraint values
+    sb.table('outreach_contacts').update({
+        'status': status,
+        'last_contacted_at': now_iso(),
+        'follow_up_count': 1,
+        'next_follow_up_at': None,
+        'notes': evidence,
+        'updated_at': now_iso(),
+    }).eq('id', row['id']).execute()
+
+    key = send_ledger.send_key(row['id'], INITIAL_STEP, INITIAL_TEMPLATE) if claimed else None
+    record_attempt(sb, row['id'], row.get('listing_id'), channel,
+                   delivery_url, evidence, attempt_status, INITIAL_TEMPLATE, key)
+
+
+def claim_send(row: dict, plan: dict):
+    """Claim the first message to row in the send ledger, if the plan contacts anyone.
+
+    Returns the claim token (None when nothing is claimed). Raises
+    send_ledger.NotClaimed when another run holds or has made the send.
+    """
+    if 'result' in plan:
+        return None
+    return send_ledger.claim(row['id'], INITIAL_STEP, INITIAL_TEMPLATE, row.get('listing_id'))
+
+
+def reconcile_sends(sb: Client) -> int:
+    """Write the first messages that crashed runs sent but never recorded.
+
+    One in doubt leaves the contact needs_manual, to be checked by hand.
+    """
+    def record(entry):
+        row = {'id': entry['contact_id'], 'listing_id': entry.get('listing_id')}
+        save_result(sb, row, entry['status'] or 'needs_manual', entry['evidence'],
+                    entry.get('delivery_url') or '', claimed=True)
+    return send_ledger.reconcile([INITIAL_STEP], record)
+
+
+def contacted_emails(sb: Client, emails) -> set:
+    """Those of `emails` (lower-cased) on rows already contacted in prior runs.
+
+    Looks up only the candidates' addresses, on the indexed
+    seed_contact_email_normalized column, a chunk per query.
+    """
+    wanted = sorted({(e or '').strip().lower() for e in emails} - {''})
+    found = set()
+    for start in range(0, len(wanted), EMAIL_LOOKUP_CHUNK):
+        rows = sb.table('outreach_contacts') \
+            .select('seed_contact_email_normalized') \
+            .in_('seed_contact_email_normalized', wanted[start:start + EMAIL_LOOKUP_CHUNK]) \
+            .neq('status', 'not_contacted') \
+            .execute().data or []
+        found.update(r['seed_contact_email_normalized'] for r in rows)
+    return found
+
+
+def suppress_duplicate(sb: Client, row: dict):
+    # Only while not_contacted: a parallel run may have just contacted row itself.
+    sb.table('outreach_contacts').update({
+        'status': 'needs_manual',
+        'notes': 'duplicate_target_already_contacted',
+        'updated_at': now_iso(),
+    }).eq('id', row['id']).eq('status', 'not_contacted').execute()
+    print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> suppressed (already_contacted_email)")
+
+
+class ResultWriter:
+    """Run write(*item) on a background thread, fed through a bounded queue.
+
+    put() blocks while `depth` items are waiting, so delivery never gets more
+    than `depth` contacts ahead of the database. After a failed write the
+    remaining items are printed rather than written, and put(), check() and
+    close() raise: sending stops instead of contacting people the run
+    cannot record. Call check() before each delivery.
+    """
+
+    def __init__(self, write, depth: int):
+        self._write = write
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._write(*item)
+                    continue
+                except Exception as e:
+                    self._error = e
+            print(f"  not recorded: {item[0].get('id')} {item[2:]}")
+
+    def check(self):
+        """Raise if a write has failed."""
+        if self._error is not None:
+            raise RuntimeError(f'result write failed: {self._error}') from self._error
+
+    def put(self, *item):
+        # Queued even after a failure, so the item is at least printed.
+        self._queue.put(item)
+        self.check()
+
+    def close(self):
+        """Wait for every queued write."""
+        self._queue.put(None)
+        self._thread.join()
+        self.check()
 
 
 # ---------------------------------------------------------------------------
@@ -337,6 +578,7 @@ def record_attempt(sb: Client, contact_id: str, listing_id: str, channel: str,
 # ---------------------------------------------------------------------------
 
 def main():
+    profiling.start('daily_outreach_db')
     reply_to = required_env('OUTREACH_REPLY_TO_EMAIL')
     sender_name = os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships')
     smtp_user = os.getenv('OUTREACH_SMTP_USERNAME', reply_to)
@@ -345,14 +587,25 @@ def main():
     smtp_port = int(os.getenv('OUTREACH_SMTP_PORT', '465'))
     daily_limit = int(os.getenv('OUTREACH_DAILY_LIMIT', '8'))
     city_filter = os.getenv('OUTREACH_CITY', '').strip().lower()
+    parse_workers = int(os.getenv('OUTREACH_PARSE_WORKERS', '0'))
+    io_workers = int(os.getenv('OUTREACH_IO_WORKERS', '8'))
+    write_depth = int(os.getenv('OUTREACH_WRITE_QUEUE', '4'))
+    pacing = float(os.getenv('OUTREACH_PACING_SECONDS', '0' if shadow.ENABLED else '1.0'))
 
+    run = RunLog('daily_outreach_db')
     sb = supabase_client()
+    send_quota.configure(sb, smtp_user, 'daily_outreach_db')
+    send_ledger.configure(sb, 'daily_outreach_db')
+    form_cache.configure(sb)
+    reconciled = reconcile_sends(sb)
 
-    # Pull not_contacted rows (already classified, have a deliverable method)
+    # Pull not_contacted rows (already classified, have a deliverable method),
+    # best priority_score first
     query = sb.table('outreach_contacts') \
-        .select('id, listing_id, display_name, seed_contact_website, seed_contact_email, contact_method, city') \
+        .select(CANDIDATE_COLUMNS) \
         .eq('status', 'not_contacted') \
         .in_('contact_method', ['email', 'contact_form']) \
+        .order('priority_score', desc=True) \
         .limit(daily_limit * 3)  # fetch extra — some may fail classification checks
 
     if city_filter:
@@ -360,83 +613,124 @@ def main():
 
     result = query.execute()
     candidates = result.data or []
+    form_cache.preload(clean_url(r.get('seed_contact_website', '')) for r in candidates)
 
     sent_today = 0
+    processed = 0
     seen_targets = set()
 
     # Prevent re-contacting duplicate rows for emails already touched in prior runs.
-    email_rows = sb.table('outreach_contacts').select('seed_contact_email, status').limit(5000).execute().data or []
-    already_contacted_emails = {
-        (r.get('seed_contact_email') or '').strip().lower()
-        for r in email_rows
-        if (r.get('seed_contact_email') or '').strip()
-        and (r.get('status') or '').strip() != 'not_contacted'
-    }
-
-    for row in candidates:
-        if sent_today >= daily_limit:
-            break
-
-        contact_id = row['id']
-        listing_id = row.get('listing_id')
-        seed_email = (row.get('seed_contact_email') or '').strip().lower()
-        website = clean_url(row.get('seed_contact_website', ''))
-        if seed_email and seed_email in already_contacted_emails:
-            sb.table('outreach_contacts').update({
-                'status': 'needs_manual',
-                'notes': 'duplicate_target_already_contacted',
-                'updated_at': now_iso(),
-            }).eq('id', contact_id).execute()
-            print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> suppressed (already_contacted_email)")
-            continue
-        if not website and not seed_email:
-            continue
-        dedupe_key = f'email:{seed_email}' if seed_email else f'site:{website.lower()}'
-        if dedupe_key in seen_targets:
-            print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> skipped (duplicate_target)")
-            continue
-        seen_targets.add(dedupe_key)
-
-        status, evidence, delivery_url = process_candidate(
-            {'seed_contact_website': website},
-            sender_name, reply_to, smtp_user, smtp_pass, smtp_host, smtp_port,
-        )
-
-        # Map to outreach_contacts.status values
-        db_status = status  # already matches the CHECK constraint values
-
-        # Map channel
-        channel_map = {
-            'delivered_email': 'email',
-            'delivered_form': 'contact_form',
-            'platform_only': 'dm',
-            'dm_sent': 'dm',
-        }
-        channel = channel_map.get(status, 'contact_form')
-
-        attempt_status = 'sent' if status in ('delivered_email', 'delivered_form') else 'failed'
-
-        sb.table('outreach_contacts').update({
-            'status': db_status,
-            'last_contacted_at': now_iso(),
-            'follow_up_count': 1,
-            'next_follow_up_at': None,
-            'notes': evidence,
-            'updated_at': now_iso(),
-        }).eq('id', contact_id).execute()
-
-        record_attempt(sb, contact_id, listing_id, channel,
-                       delivery_url, evidence, attempt_status, 'v1_permission_request')
-
-        if status in ('delivered_email', 'delivered_form', 'needs_manual'):
-            sent_today += 1
-
+    already_contacted_emails = contacted_emails(sb, (r.get('seed_contact_email') for r in candidates))
+
+    def eligible():
+        """Candidates left after suppression and in-run de-duplication."""
+        for row in candidates:
+            if sent_today >= daily_limit:
+                return
+
+            seed_email = (row.get('seed_contact_email') or '').strip().lower()
+            website = clean_url(row.get('seed_contact_website', ''))
+            if seed_email and seed_email in already_contacted_emails:
+                suppress_duplicate(sb, row)
+                continue
+            if not website and not seed_email:
+                continue
+            dedupe_key = f'email:{seed_email}' if seed_email else f'site:{website.lower()}'
+            if dedupe_key in seen_targets:
+                print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> skipped (duplicate_target)")
+                continue
+            seen_targets.add(dedupe_key)
+            yield row, website, seed_email
+
+    pool = parse_pool(parse_workers)
+
+    tracer = Tracer('daily_outreach_db', keep=True)
+
+    def probe(item):
+        trace = tracer.start(item[0]['id'])
+        with bind(trace):
+            plan = probe_candidate(probe_input(item[0], item[1]), pool)
+        plan['trace'] = trace
+        return plan
+
+    def record(row, trace, status, evidence, delivery_url, send_claim):
+        with bind(trace), span('db'):
+            save_result(sb, row, status, evidence, delivery_url, claimed=send_claim is not None)
+            send_ledger.finish(send_claim)
+        tracer.finish(trace, status=status, evidence=evidence)
+        run.count(status=status, channel=CHANNEL_BY_STATUS.get(status, 'contact_form'),
+                  city=row.get('city'), evidence=evidence)
         print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> {status} ({evidence})")
-        if seed_email:
-            already_contacted_emails.add(seed_email)
-        time.sleep(1.0)
+
+    # Pipeline: threads fetch and parse the next candidates' sites while the
+    # current one is delivered, and a writer thread records results behind
+    # delivery. Delivery itself stays on this thread, one contact at a time,
+    # so the daily limit is exact. Probes never contact anyone, so probing
+    # past the daily limit costs only a few page loads.
+    io = ThreadPoolExecutor(max_workers=io_workers) if io_workers > 0 else None
+    if io:
+        work = probe_ahead(io, eligible(), probe, io_workers)
+        writer = ResultWriter(record, write_depth)
+        write = writer.put
+    else:
+        work = ((item, probe(item)) for item in eligible())
+        write = record
+
+    # Delivered contacts must be recorded even if the loop stops early, or
+    # the next run would contact them again.
+    try:
+        for (row, website, seed_email), plan in work:
+            if sent_today >= daily_limit:
+                break
+            if io:
+                writer.check()
+
+            trace = plan['trace']
+            try:
+                send_claim = claim_send(row, plan)
+            except send_ledger.NotClaimed as e:
+                tracer.finish(trace, status='skipped', evidence=str(e))
+                run.count(status='skipped', city=row.get('city'))
+                print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> skipped ({e})")
+                continue
+            try:
+                with bind(trace):
+                    status, evidence, delivery_url = deliver_plan(
+                        plan, sender_name, reply_to, smtp_user, smtp_pass, smtp_host, smtp_port,
+                    )
+            except send_quota.QuotaExhausted as e:
+                # Left not_contacted for a later run.
+                send_ledger.release(send_claim)
+                tracer.finish(trace, status='deferred', evidence=str(e))
+                run.count(status='deferred', city=row.get('city'))
+                run.error('send_quota')
+                print(f"[{row.get('city','?')}] {row.get('display_name','?')} -> deferred ({e})")
+                continue
+
+            # Stored before the contact row is written, so a crash in
+            # between is recorded by the next run rather than resent.
+            send_ledger.settle(send_claim, status, evidence, delivery_url)
+            write(row, trace, status, evidence, delivery_url, send_claim)
+            processed += 1
+
+            if status in COUNTED_STATUSES:
+                sent_today += 1
+
+            if seed_email:
+                already_contacted_emails.add(seed_email)
+            time.sleep(pacing)
+    finally:
+        if io:
+            work.close()
+            io.shutdown()
+            writer.close()
+        if pool:
+            pool.shutdown()
+    tracer.close()
 
     print(f'daily_outreach_db: sent={sent_today}')
+    shadow.report('daily_outreach_db', processed, sent=sent_today)
+    run.save(sb, tracer, sent=sent_today, processed=processed, reconciled=reconciled)
 
 
 if __name__ == '__main__':
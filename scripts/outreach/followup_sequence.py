@@ -5,6 +5,9 @@ Consent-safe reminders for contacts that received the initial permission request
 
 Day-4 trigger: contacted 4+ days ago, not yet claimed, follow_up_count == 1.
 Day-10 trigger: contacted 10+ days ago, not yet claimed, follow_up_count == 2.
+Each reminder is claimed in the send ledger before it is sent, so a crashed
+or parallel run never sends it twice (see send_ledger.py).
+Each run writes its counts and stage timings to outreach_runs (see run_log.py).
 
 Required env vars:
   SUPABASE_URL
@@ -18,6 +21,11 @@ Optional:
   OUTREACH_SMTP_HOST
   OUTREACH_SMTP_PORT
   FOLLOWUP_DAILY_LIMIT  (default: 10)
+  OUTREACH_TRACE_DIR    (write per-contact stage timings here; see stage_trace.py)
+  OUTREACH_PROFILE_DIR  (profile the run into this directory; see profiling.py)
+  OUTREACH_SHADOW       (run against the shadow copy and a local SMTP sink; see shadow.py)
+  OUTREACH_SMTP_DAILY_CAP (provider's daily cap, shared with the other senders; see send_quota.py)
+  OUTREACH_SEND_LEASE_SECONDS (time before an unrecorded send is reconciled; see send_ledger.py)
 """
 
 import os
@@ -26,7 +34,28 @@ import ssl
 from datetime import datetime, timezone, timedelta
 from email.message import EmailMessage
 
-from supabase import create_client, Client
+from supabase import Client
+
+import profiling
+import send_ledger
+import send_quota
+import shadow
+from run_log import RunLog
+from stage_trace import Tracer, add_bytes, bind, span
+
+# send_smtp outcomes. NOT_SENT means the server refused the message before
+# any of it went out; IN_DOUBT means it may have been delivered.
+SENT = 'sent'
+NOT_SENT = 'not_sent'
+IN_DOUBT = 'in_doubt'
+
+# Refusals raised by send_message before the DATA command.
+REFUSED_BEFORE_DATA = (
+    smtplib.SMTPHeloError,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPNotSupportedError,
+)
 
 
 def required_env(name: str) -> str:
@@ -45,12 +74,18 @@ def days_ago_iso(n: int) -> str:
 
 
 def supabase_client() -> Client:
-    return create_client(required_env('SUPABASE_URL'), required_env('SUPABASE_SERVICE_ROLE_KEY'))
+    return shadow.supabase_client(required_env('SUPABASE_URL'), required_env('SUPABASE_SERVICE_ROLE_KEY'))
 
 
 def send_smtp(to_addr: str, subject: str, body: str,
               sender_name: str, smtp_user: str, smtp_pass: str,
-              smtp_host: str, smtp_port: int, reply_to: str) -> bool:
+              smtp_host: str, smtp_port: int, reply_to: str) -> str:
+    """Send one reminder; returns SENT, NOT_SENT or IN_DOUBT.
+
+    Only a failure to connect or log in, or a refused sender or recipient,
+    counts as NOT_SENT. Anything that fails once the message is being
+    handed over may have been delivered anyway.
+    """
     msg = EmailMessage()
     msg['From'] = f'{sender_name} <{smtp_user}>'
     msg['To'] = to_addr
@@ -58,14 +93,29 @@ def send_smtp(to_addr: str, subject: str, body: str,
     msg['Subject'] = subject
     msg.set_content(body)
     ctx = ssl.create_default_context()
+    add_bytes('smtp', len(msg.as_bytes()))
+    # Raises send_quota.QuotaExhausted before anything is sent.
+    reservation = send_quota.reserve()
+    phase = 'connect'
     try:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=25) as server:
+        with span('smtp'), shadow.smtp_connection(smtp_host, smtp_port, ctx) as server:
             server.login(smtp_user, smtp_pass)
+            phase = 'send'
             server.send_message(msg)
-        return True
+            phase = 'sent'
     except Exception as e:
-        print(f'  SMTP error: {e}')
-        return False
+        if phase == 'connect' or (phase == 'send' and isinstance(e, REFUSED_BEFORE_DATA)):
+            send_quota.release(reservation)
+            print(f'  SMTP error: {e}')
+            return NOT_SENT
+        if phase == 'send':
+            # May have been delivered, so it counts against the cap.
+            send_quota.commit(reservation)
+            print(f'  SMTP error mid-send: {e}')
+            return IN_DOUBT
+        # Accepted; only closing the connection failed.
+    send_quota.commit(reservation)
+    return SENT
 
 
 def day4_body(sender_name: str, reply_to: str) -> str:
@@ -89,12 +139,91 @@ def day10_body(sender_name: str, reply_to: str) -> str:
     )
 
 
+# Send ledger step -> who is due (follow_up_count and days since the last
+# message), the follow_up_count once sent, and the reminder itself.
+STEPS = {
+    'day4': {
+        'due_count': 1,
+        'after_days': 4,
+        'follow_up_count': 2,
+        'evidence': 'day4_permission_followup',
+        'template': 'v2_followup_day4',
+        'subject': 'Follow-up: permission request from DommeDirectory',
+        'body': day4_body,
+    },
+    'day10': {
+        'due_count': 2,
+        'after_days': 10,
+        'follow_up_count': 3,
+        'evidence': 'day10_permission_followup',
+        'template': 'v3_followup_day10',
+        'subject': 'Final follow-up: DommeDirectory permission request',
+        'body': day10_body,
+    },
+}
+
+
 def get_contact_email(row: dict) -> str:
     """Return the email address to follow up at, if any."""
     return (row.get('seed_contact_email') or '').strip()
 
 
+def record_followup(sb: Client, contact_id: str, listing_id: str, step: str,
+                    delivery_url: str, evidence: str = None):
+    """Advance the contact past step and log the attempt, once per send.
+
+    With evidence (a send in doubt) the attempt is logged as failed, but
+    the contact still advances so the reminder is not sent twice.
+    """
+    spec = STEPS[step]
+    sb.table('outreach_contacts').update({
+        'follow_up_count': spec['follow_up_count'],
+        'last_contacted_at': now_iso(),
+        'updated_at': now_iso(),
+    }).eq('id', contact_id).execute()
+
+    sb.table('outreach_attempts').upsert({
+        'contact_id': contact_id,
+        'listing_id': listing_id,
+        'channel': 'email',
+        'delivery_url': delivery_url,
+        'delivery_evidence': evidence or spec['evidence'],
+        'status': 'failed' if evidence else 'sent',
+        'template_version': spec['template'],
+        'send_key': send_ledger.send_key(contact_id, step, spec['template']),
+        'sent_at': now_iso(),
+    }, on_conflict='send_key', ignore_duplicates=True).execute()
+
+
+def reconcile_sends(sb: Client) -> int:
+    """Write the reminders that crashed runs sent but never recorded."""
+    def record(entry):
+        record_followup(sb, entry['contact_id'], entry.get('listing_id'), entry['step'],
+                        entry.get('delivery_url'), None if entry['status'] else entry['evidence'])
+    return send_ledger.reconcile(list(STEPS), record)
+
+
+def due_contacts(sb: Client, step: str, limit: int) -> list:
+    """Contacts due the step's reminder, longest waiting first.
+
+    Last contacted 'after_days' or more ago, no response yet, and the
+    previous message already sent (follow_up_count == 'due_count').
+    """
+    spec = STEPS[step]
+    res = sb.table('outreach_contacts') \
+        .select('id, listing_id, display_name, city, seed_contact_email, follow_up_count, last_contacted_at') \
+        .in_('status', ['delivered_email', 'delivered_form']) \
+        .eq('claimed', False) \
+        .eq('follow_up_count', spec['due_count']) \
+        .lte('last_contacted_at', days_ago_iso(spec['after_days'])) \
+        .order('last_contacted_at') \
+        .limit(limit) \
+        .execute()
+    return res.data or []
+
+
 def main():
+    profiling.start('followup_sequence')
     reply_to = required_env('OUTREACH_REPLY_TO_EMAIL')
     sender_name = os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships')
     smtp_user = os.getenv('OUTREACH_SMTP_USERNAME', reply_to)
@@ -103,111 +232,89 @@ def main():
     smtp_port = int(os.getenv('OUTREACH_SMTP_PORT', '465'))
     daily_limit = int(os.getenv('FOLLOWUP_DAILY_LIMIT', '10'))
 
+    run = RunLog('followup_sequence')
     sb = supabase_client()
+    send_quota.configure(sb, smtp_user, 'followup_sequence')
+    send_ledger.configure(sb, 'followup_sequence')
+    reconciled = reconcile_sends(sb)
 
-    four_days_ago = days_ago_iso(4)
-    ten_days_ago = days_ago_iso(10)
-
-    # Day-4 candidates: initial message sent 4+ days ago, no response yet.
-    day4_res = sb.table('outreach_contacts') \
-        .select('id, listing_id, display_name, seed_contact_email, follow_up_count, last_contacted_at') \
-        .in_('status', ['delivered_email', 'delivered_form']) \
-        .eq('claimed', False) \
-        .eq('follow_up_count', 1) \
-        .lte('last_contacted_at', four_days_ago) \
-        .limit(daily_limit) \
-        .execute()
-
-    # Day-10 candidates: day-4 reminder already sent, still no response.
-    day10_res = sb.table('outreach_contacts') \
-        .select('id, listing_id, display_name, seed_contact_email, follow_up_count, last_contacted_at') \
-        .in_('status', ['delivered_email', 'delivered_form']) \
-        .eq('claimed', False) \
-        .eq('follow_up_count', 2) \
-        .lte('last_contacted_at', ten_days_ago) \
-        .limit(daily_limit) \
-        .execute()
+    due = {step: due_contacts(sb, step, daily_limit) for step in STEPS}
 
     sent = 0
+    processed = 0
     seen_emails = set()
-
-    for row in (day4_res.data or []):
-        if sent >= daily_limit:
-            break
-        email = get_contact_email(row)
-        if not email:
-            continue
-        email_key = email.lower()
-        if email_key in seen_emails:
-            continue
-        seen_emails.add(email_key)
-
-        listing_id = row.get('listing_id')
-        body = day4_body(sender_name, reply_to)
-        subject = 'Follow-up: permission request from DommeDirectory'
-
-        ok = send_smtp(email, subject, body, sender_name, smtp_user, smtp_pass, smtp_host, smtp_port, reply_to)
-
-        if ok:
-            sb.table('outreach_contacts').update({
-                'follow_up_count': 2,
-                'last_contacted_at': now_iso(),
-                'updated_at': now_iso(),
-            }).eq('id', row['id']).execute()
-
-            sb.table('outreach_attempts').insert({
-                'contact_id': row['id'],
-                'listing_id': listing_id,
-                'channel': 'email',
-                'delivery_url': f'mailto:{email}',
-                'delivery_evidence': 'day4_permission_followup',
-                'status': 'sent',
-                'template_version': 'v2_followup_day4',
-                'sent_at': now_iso(),
-            }).execute()
-
-            sent += 1
-            print(f'[day4] {row.get("display_name","?")} -> {email}')
-
-    for row in (day10_res.data or []):
-        if sent >= daily_limit:
-            break
-        email = get_contact_email(row)
-        if not email:
-            continue
-        email_key = email.lower()
-        if email_key in seen_emails:
-            continue
-        seen_emails.add(email_key)
-
-        listing_id = row.get('listing_id')
-        body = day10_body(sender_name, reply_to)
-        subject = 'Final follow-up: DommeDirectory permission request'
-
-        ok = send_smtp(email, subject, body, sender_name, smtp_user, smtp_pass, smtp_host, smtp_port, reply_to)
-
-        if ok:
-            sb.table('outreach_contacts').update({
-                'follow_up_count': 3,
-                'last_contacted_at': now_iso(),
-                'updated_at': now_iso(),
-            }).eq('id', row['id']).execute()
-
-            sb.table('outreach_attempts').insert({
-                'contact_id': row['id'],
-                'listing_id': listing_id,
-                'channel': 'email',
-                'delivery_url': f'mailto:{email}',
-                'delivery_evidence': 'day10_permission_followup',
-                'status': 'sent',
-                'template_version': 'v3_followup_day10',
-                'sent_at': now_iso(),
-            }).execute()
-
-            sent += 1
-            print(f'[day10] {row.get("display_name","?")} -> {email}')
-
+    exhausted = False
+    sent_by_step = {step: 0 for step in STEPS}
+    tracer = Tracer('followup_sequence', keep=True)
+
+    def run_step(step, rows):
+        nonlocal sent, processed, exhausted
+        spec = STEPS[step]
+        for row in rows:
+            if sent >= daily_limit or exhausted:
+                break
+            email = get_contact_email(row)
+            if not email:
+                continue
+            email_key = email.lower()
+            if email_key in seen_emails:
+                continue
+            seen_emails.add(email_key)
+
+            listing_id = row.get('listing_id')
+            body = spec['body'](sender_name, reply_to)
+
+            try:
+                send_claim = send_ledger.claim(row['id'], step, spec['template'], listing_id)
+            except send_ledger.NotClaimed as e:
+                print(f'[{step}] {row.get("display_name","?")} -> skipped ({e})')
+                run.count(status='skipped', channel='email', city=row.get('city'))
+                continue
+
+            trace = tracer.start(row['id'])
+            with bind(trace):
+                try:
+                    outcome = send_smtp(email, spec['subject'], body, sender_name, smtp_user, smtp_pass,
+                                        smtp_host, smtp_port, reply_to)
+                except send_quota.QuotaExhausted as e:
+                    print(f'[{step}] stopping: {e}')
+                    run.error('send_quota')
+                    exhausted = True
+                    outcome = NOT_SENT
+                if outcome == SENT:
+                    send_ledger.settle(send_claim, 'sent', spec['evidence'], f'mailto:{email}')
+                    with span('db'):
+                        record_followup(sb, row['id'], listing_id, step, f'mailto:{email}')
+                        send_ledger.finish(send_claim)
+                elif outcome == NOT_SENT:
+                    # Nothing went out; a later run may send it.
+                    send_ledger.release(send_claim)
+                # IN_DOUBT keeps the claim, so reconcile_sends records it
+                # once the lease runs out and it is never sent again.
+            ok = outcome == SENT
+            tracer.finish(trace, step=step, sent=ok)
+            processed += 1
+            if ok:
+                evidence = None
+            elif outcome == IN_DOUBT:
+                evidence = send_ledger.IN_DOUBT
+            else:
+                evidence = None if exhausted else 'smtp_send_failed'
+            run.count(status='sent' if ok else 'deferred' if exhausted else 'failed', channel='email',
+                      city=row.get('city'), evidence=evidence)
+
+            if ok:
+                sent += 1
+                sent_by_step[step] += 1
+                print(f'[{step}] {row.get("display_name","?")} -> {email}')
+
+    for step, rows in due.items():
+        run_step(step, rows)
+
+    tracer.close()
     print(f'followup_sequence: sent={sent}')
+    shadow.report('followup_sequence', processed, sent=sent)
+    run.save(sb, tracer, sent=sent, reconciled=reconciled, **sent_by_step)
 
 
 if __name__ == '__main__':
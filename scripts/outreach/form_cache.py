@@ -0,0 +1,170 @@
+"""Per-site cache of the contact form that works.
+
+Without it, sending to a contact_form row means fetching the home page,
+following contact links until a form turns up, and working out its fields
+again. With it, each site keeps one row in outreach_form_schemas: the page
+the form is on plus its form_frameworks schema (framework, endpoint, field
+roles). The row is written when the classifier finds a confirmable form
+there (unverified) and again whenever a submission is delivered (verified).
+The senders then fetch only that page, check the form still fits, and
+submit with the stored schema.
+
+An entry is ignored after MAX_FAILURES undelivered submissions in a row,
+and deleted when its page no longer has the form; the next send crawls the
+site as before. Sites are keyed by host without www., plus the path when
+the site lives under a shared host (see site_key).
+
+Call configure(sb) once; without it every function is a no-op. In shadow
+mode sb points at the shadow schema, which has its own copy of the table.
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlparse
+
+MAX_FAILURES = 2
+
+SCHEMA_KEYS = ('framework', 'endpoint', 'method', 'fields', 'extra')
+
+COLUMNS = 'site, page_url, framework, endpoint, method, fields, extra, verified_at, failures'
+
+# Sites per query in preload().
+PRELOAD_CHUNK = 200
+
+_sb = None
+_lock = threading.Lock()
+# site -> row (or None) for this process, so shared sites cost one lookup.
+_memo = {}
+
+
+def configure(sb):
+    global _sb
+    _sb = sb
+    with _lock:
+        _memo.clear()
+
+
+def site_key(website: str) -> str:
+    u = urlparse(website)
+    host = u.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host + u.path.rstrip('/')
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def lookup(site: str) -> Optional[dict]:
+    """The cached row for a site, or None."""
+    if _sb is None or not site:
+        return None
+    with _lock:
+        if site in _memo:
+            return _memo[site]
+    try:
+        rows = _sb.table('outreach_form_schemas') \
+            .select(COLUMNS) \
+            .eq('site', site) \
+            .limit(1) \
+            .execute().data or []
+    except Exception as e:
+        print(f'form_cache: lookup failed ({e})')
+        rows = []
+    row = rows[0] if rows and rows[0]['failures'] < MAX_FAILURES else None
+    with _lock:
+        _memo[site] = row
+    return row
+
+
+def preload(websites):
+    """Fetch the rows for a run's candidate sites up front, a chunk per query."""
+    if _sb is None:
+        return
+    with _lock:
+        sites = sorted({site_key(w) for w in websites if w} - set(_memo))
+    for start in range(0, len(sites), PRELOAD_CHUNK):
+        chunk = sites[start:start + PRELOAD_CHUNK]
+        try:
+            rows = _sb.table('outreach_form_schemas') \
+                .select(COLUMNS) \
+                .in_('site', chunk) \
+                .execute().data or []
+        except Exception as e:
+            print(f'form_cache: preload failed ({e})')
+            return
+        found = {row['site']: row for row in rows if row['failures'] < MAX_FAILURES}
+        with _lock:
+            for site in chunk:
+                _memo.setdefault(site, found.get(site))
+
+
+def _store(site: str, page_url: str, schema: dict, verified: bool):
+    row = {'site': site, 'page_url': page_url, 'failures': 0, 'updated_at': _now()}
+    row.update({k: schema[k] for k in SCHEMA_KEYS})
+    if verified:
+        row['verified_at'] = row['updated_at']
+    try:
+        # The classifier never overwrites what a sender has verified.
+        _sb.table('outreach_form_schemas') \
+            .upsert(row, on_conflict='site', ignore_duplicates=not verified) \
+            .execute()
+    except Exception as e:
+        print(f'form_cache: store failed ({e})')
+        return
+    with _lock:
+        if verified:
+            _memo[site] = row
+        else:
+            # The upsert may have kept a verified row; read it back on lookup.
+            _memo.pop(site, None)
+
+
+def note(site: str, page_url: str, schema: dict):
+    """Record where the classifier found a confirmable form (unverified)."""
+    if _sb is not None and site:
+        _store(site, page_url, schema, verified=False)
+
+
+def remember(site: str, page_url: str, schema: dict):
+    """Record a delivered submission."""
+    if _sb is None or not site:
+        return
+    with _lock:
+        row = _memo.get(site)
+    if row and row['verified_at'] and not row['failures'] and row['page_url'] == page_url \
+            and all(row[k] == schema[k] for k in SCHEMA_KEYS):
+        return
+    _store(site, page_url, schema, verified=True)
+
+
+def failed(site: str):
+    """Count an undelivered submission made with the cached schema."""
+    if _sb is None or not site:
+        return
+    with _lock:
+        row = _memo.get(site)
+        failures = (row or {}).get('failures', 0) + 1
+        if row is not None:
+            _memo[site] = dict(row, failures=failures) if failures < MAX_FAILURES else None
+    try:
+        _sb.table('outreach_form_schemas') \
+            .update({'failures': failures, 'updated_at': _now()}) \
+            .eq('site', site) \
+            .execute()
+    except Exception as e:
+        print(f'form_cache: update failed ({e})')
+
+
+def forget(site: str):
+    """Drop a site whose cached page no longer has the form."""
+    if _sb is None or not site:
+        return
+    with _lock:
+        _memo[site] = None
+    try:
+        _sb.table('outreach_form_schemas').delete().eq('site', site).execute()
+    except Exception as e:
+        print(f'form_cache: delete failed ({e})')
@@ -0,0 +1,196 @@
+"""Contact-form plugins the outreach senders know how to submit.
+
+Most provider sites that have a contact form use one of a few WordPress
+plugins. Each one marks its forms with a hidden field, lays the fields out
+the same way every time, and has a fixed endpoint and success marker.
+detect() recognizes them from a form descriptor (see
+page_analysis.describe_form) and returns a schema:
+
+  {
+    'framework': 'cf7' | 'wpforms' | 'gravity' | 'generic',
+    'endpoint': absolute URL the submission goes to,
+    'method': 'post' or 'get',
+    'fields': {role: field name},   roles: name, first_name, last_name,
+                                    email, subject, message
+    'extra': {field name: value},   sent on top of the form's own values
+  }
+
+  cf7      Contact Form 7 (_wpcf7). Posted to the plugin's REST feedback
+           route, which answers with a JSON status rather than a page.
+  wpforms  WPForms (wpforms[id]). Posted to the page with wpforms[submit].
+  gravity  Gravity Forms (gform_submit). Posted to the form action.
+  generic  Anything else, mapped with the pick_field() heuristics.
+
+read_response() judges the reply by the plugin's own markers. Schemas are
+plain JSON-able dicts, so form_cache.py can keep the one that worked.
+
+Wix and Squarespace render their forms from script and post them to
+session-bound APIs, so there is no form in the page to detect here;
+page_analysis reports them as the page's 'builder' instead.
+"""
+
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+from page_analysis import MESSAGE_HINTS, SKIP_FIELD_TYPES, default_form_data, pick_field
+
+# Hidden field each plugin puts in every form it renders.
+MARKER_FIELDS = (
+    ('cf7', '_wpcf7'),
+    ('wpforms', 'wpforms[id]'),
+    ('gravity', 'gform_submit'),
+)
+
+# Suffixes of the first/last name sub-fields.
+NAME_PARTS = {
+    'wpforms': (('[first]',), ('[last]',)),
+    'gravity': (('.3',), ('.6',)),
+}
+
+# (delivered, failed) markers in the page a plugin returns after a post.
+PAGE_MARKERS = {
+    'wpforms': ('wpforms-confirmation-container', 'wpforms-error'),
+    'gravity': ('gform_confirmation_message', 'gform_validation_error'),
+}
+
+
+def field_value(form: dict, name: str) -> Optional[str]:
+    for field in form['fields']:
+        if field['name'] == name:
+            return field['value']
+    return None
+
+
+def framework_of(form: dict) -> str:
+    names = {field['name'] for field in form['fields']}
+    for framework, marker in MARKER_FIELDS:
+        if marker in names:
+            return framework
+    return 'generic'
+
+
+def _first(form: dict, tag: str, typ: Optional[str] = None) -> Optional[dict]:
+    for field in form['fields']:
+        if field['tag'] == tag and field['name'] and (typ is None or field['type'] == typ):
+            return field
+    return None
+
+
+def _suffixed(form: dict, suffixes) -> Optional[dict]:
+    for field in form['fields']:
+        name = field['name'] or ''
+        if field['type'] not in SKIP_FIELD_TYPES and name.endswith(suffixes):
+            return field
+    return None
+
+
+def plugin_fields(form: dict, framework: str) -> dict:
+    """Field roles for a plugin form.
+
+    The plugins name fields after their type or position (text-123,
+    wpforms[fields][2], input_4), so roles come from the input type and
+    the plugins' name sub-fields rather than from the field names.
+    """
+    first, last = NAME_PARTS.get(framework, ((), ()))
+    found = {
+        'email': _first(form, 'input', 'email') or pick_field(form, ['email']),
+        'message': _first(form, 'textarea') or pick_field(form, MESSAGE_HINTS, include_textarea=True),
+        'first_name': _suffixed(form, first) if first else None,
+        'last_name': _suffixed(form, last) if last else None,
+        'subject': pick_field(form, ['subject']),
+    }
+    if found['first_name'] is None:
+        found['name'] = pick_field(form, ['name'])
+    return {role: field['name'] for role, field in found.items() if field and field['name']}
+
+
+def generic_fields(form: dict) -> dict:
+    found = {
+        'name': pick_field(form, ['name']),
+        'email': pick_field(form, ['email']),
+        'subject': pick_field(form, ['subject']),
+        'message': pick_field(form, MESSAGE_HINTS, include_textarea=True),
+    }
+    return {role: field['name'] for role, field in found.items() if field and field['name']}
+
+
+def detect(form: dict, page_url: str, known: Optional[dict] = None) -> dict:
+    """The schema to submit `form` with; `known` (a cached schema) wins if it still fits."""
+    if known and matches(known, form):
+        return {k: known[k] for k in ('framework', 'endpoint', 'method', 'fields', 'extra')}
+
+    framework = framework_of(form)
+    action_url = urljoin(page_url, form['action'] or page_url)
+    schema = {'framework': framework, 'endpoint': action_url, 'method': form['method'], 'extra': {}}
+
+    if framework == 'generic':
+        schema['fields'] = generic_fields(form)
+        return schema
+
+    schema['fields'] = plugin_fields(form, framework)
+    schema['method'] = 'post'
+    if framework == 'cf7':
+        # rest_route works on any URL WordPress serves, so this needs
+        # neither pretty permalinks nor the install's root path.
+        page = urlparse(page_url)._replace(query='', fragment='').geturl()
+        form_id = field_value(form, '_wpcf7')
+        schema['endpoint'] = f'{page}?rest_route=/contact-form-7/v1/contact-forms/{form_id}/feedback'
+    elif framework == 'wpforms':
+        schema['extra'] = {'wpforms[submit]': 'wpforms-submit'}
+    return schema
+
+
+def matches(schema: dict, form: dict) -> bool:
+    """Whether a stored schema still fits this form."""
+    if form['has_captcha'] or 'message' not in schema['fields']:
+        return False
+    names = {field['name'] for field in form['fields']}
+    if not set(schema['fields'].values()) <= names:
+        return False
+    return framework_of(form) == schema['framework']
+
+
+def contact_values(sender_name: str, email: str, subject: str, message: str) -> dict:
+    """Our side of the form, by role."""
+    first, _, last = sender_name.strip().partition(' ')
+    return {
+        'name': sender_name,
+        'first_name': first,
+        'last_name': last.strip() or first,
+        'email': email,
+        'subject': subject,
+        'message': message,
+    }
+
+
+def form_data(schema: dict, form: dict, values: dict) -> dict:
+    """The form's own values, then the schema's extras, then ours by role."""
+    data = default_form_data(form)
+    data.update(schema['extra'])
+    for role, name in schema['fields'].items():
+        if role in values:
+            data[name] = values[role]
+    return data
+
+
+def read_response(schema: dict, resp):
+    """(delivered, evidence) from the plugin's reply, or None if it gives no verdict."""
+    framework = schema['framework']
+    if framework == 'cf7':
+        try:
+            status = resp.json().get('status')
+        except Exception:
+            return None
+        if not status:
+            return None
+        return status == 'mail_sent', f'cf7_{status}'
+
+    markers = PAGE_MARKERS.get(framework)
+    if markers is None:
+        return None
+    text = resp.text or ''
+    if markers[0] in text:
+        return True, f'{framework}_confirmation'
+    if markers[1] in text:
+        return False, f'{framework}_error'
+    return None
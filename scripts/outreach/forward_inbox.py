@@ -1,18 +1,40 @@
 #!/usr/bin/env python3
 """Forward new inbox messages and auto-classify outreach replies.
 
-Uses IMAP to read unseen messages and SMTP to forward each message as an .eml
+Uses IMAP to read new messages and SMTP to forward each message as an .eml
 attachment. When Supabase credentials are present, this script also:
   - detects simple positive/opt-out reply intent
   - updates outreach_contacts status (replied / opted_out)
   - optionally sends an auto-ack for positive or opt-out replies
+
+Runs once and exits by default (cron). With --idle (or
+OUTREACH_FORWARDER_IDLE=true) it stays connected and handles new mail as it
+arrives via IMAP IDLE.
+
+New mail is tracked with a UIDVALIDITY + last-processed-UID checkpoint rather
+than the Seen flag, so reading the mailbox by hand does not hide messages.
+
+With OUTREACH_SMTP_DAILY_CAP set, forwards and auto-acks are counted in the
+shared send-quota ledger (see send_quota.py). Forwards are always sent;
+auto-acks are skipped once the day's cap is used up.
+
+With Supabase configured, each run (each batch of new mail in --idle mode)
+writes its counts to outreach_runs (see run_log.py).
 """
 
+import argparse
+import base64
 import imaplib
+import json
 import os
 import re
 import smtplib
+import socket
 import ssl
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timezone
 from email import policy
 from email.message import EmailMessage
@@ -22,6 +44,11 @@ from typing import Optional, Tuple
 
 from supabase import Client, create_client
 
+import profiling
+import send_quota
+from reply_intent import classify_reply_intent, normalize_body
+from run_log import RunLog
+
 
 def getenv_required(name: str) -> str:
     value = os.getenv(name, '').strip()
@@ -45,48 +72,8 @@ def extract_text(msg: EmailMessage) -> str:
         content = preferred.get_content() or ''
     else:
         content = msg.get_content() or ''
-    if preferred is not None and preferred.get_content_type() == 'text/html':
-        content = re.sub(r'<[^>]+>', ' ', content)
-    content = re.sub(r'\s+', ' ', content).strip()
-    return content[:4000]
-
-
-def classify_reply_intent(subject: str, body: str) -> Optional[str]:
-    text = f'{subject}\n{body}'.lower()
-
-    # Skip obvious autoresponders.
-    if any(s in text for s in ('out of office', 'automatic reply', 'autoreply', 'auto reply')):
-        return None
-
-    opt_out_patterns = (
-        r'\bdo not contact\b',
-        r"\bdon't contact\b",
-        r'\bunsubscribe\b',
-        r'\bremove me\b',
-        r'\bopt out\b',
-        r'\btake me off\b',
-        r'\bstop\b',
-        r'\bnot interested\b',
-        r'\bno thanks\b',
-        r'^\s*no[\s.,!]*$',
-    )
-    positive_patterns = (
-        r'^\s*yes\b',
-        r'\binterested\b',
-        r'\bsounds good\b',
-        r'\bokay\b',
-        r'\bok\b',
-        r'\bsure\b',
-        r'\bproceed\b',
-        r'\bsend (a )?(draft|preview)\b',
-        r"\blet'?s do it\b",
-    )
-
-    if any(re.search(pattern, text, flags=re.IGNORECASE | re.MULTILINE) for pattern in opt_out_patterns):
-        return 'opt_out'
-    if any(re.search(pattern, text, flags=re.IGNORECASE | re.MULTILINE) for pattern in positive_patterns):
-        return 'positive'
-    return None
+    is_html = preferred is not None and preferred.get_content_type() == 'text/html'
+    return normalize_body(content, is_html=is_html)
 
 
 def append_note(existing: Optional[str], new_note: str) -> str:
@@ -105,12 +92,27 @@ def get_supabase_client() -> Optional[Client]:
     return create_client(url, key)
 
 
-def load_contacts_by_email(sb: Client) -> dict[str, dict]:
-    res = sb.table('outreach_contacts') \
-        .select('id, seed_contact_email, status, notes, updated_at, last_contacted_at') \
-        .limit(5000) \
-        .execute()
-    rows = res.data or []
+# Sender addresses are resolved this many per outreach_contacts query.
+CONTACT_LOOKUP_CHUNK = 100
+
+# Resolved contacts (and misses) kept between batches in IDLE mode.
+CONTACT_CACHE_SIZE = 2000
+
+
+def resolve_contacts(sb: Client, emails: list[str]) -> dict[str, dict]:
+    """Look up outreach contacts for just these sender addresses.
+
+    Matches on the indexed seed_contact_email_normalized column. When an
+    address appears on several rows, the most recently contacted one wins.
+    """
+    rows: list[dict] = []
+    wanted = sorted(set(emails))
+    for start in range(0, len(wanted), CONTACT_LOOKUP_CHUNK):
+        res = sb.table('outreach_contacts') \
+            .select('id, seed_contact_email_normalized, status, notes, updated_at, last_contacted_at') \
+            .in_('seed_contact_email_normalized', wanted[start:start + CONTACT_LOOKUP_CHUNK]) \
+            .execute()
+        rows.extend(res.data or [])
 
     def sort_key(row: dict):
         return (
@@ -122,14 +124,376 @@ def load_contacts_by_email(sb: Client) -> dict[str, dict]:
 
     by_email: dict[str, dict] = {}
     for row in rows:
-        email = (row.get('seed_contact_email') or '').strip().lower()
-        if not email:
-            continue
-        if email not in by_email:
+        email = row.get('seed_contact_email_normalized') or ''
+        if email and email not in by_email:
             by_email[email] = row
     return by_email
 
 
+class ContactCache:
+    """Small LRU over resolve_contacts, remembering misses too.
+
+    Cached rows are the same dicts update_contact_status mutates, so a status
+    change made by this process is visible to later messages. clear() drops
+    everything so changes made elsewhere are picked up.
+    """
+
+    def __init__(self, sb: Client, max_size: int = CONTACT_CACHE_SIZE):
+        self.sb = sb
+        self.max_size = max_size
+        self.entries: OrderedDict[str, Optional[dict]] = OrderedDict()
+
+    def resolve(self, emails: list[str]) -> dict[str, dict]:
+        wanted = {e for e in emails if e}
+        missing = [e for e in wanted if e not in self.entries]
+        if missing:
+            found = resolve_contacts(self.sb, missing)
+            for email in missing:
+                self.entries[email] = found.get(email)
+
+        out = {}
+        for email in wanted:
+            self.entries.move_to_end(email)
+            if self.entries[email] is not None:
+                out[email] = self.entries[email]
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return out
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+# Only these headers are needed to decide whether a message is skipped.
+SKIP_HEADER_FIELDS = ('FROM', 'TO', 'SUBJECT', 'AUTO-SUBMITTED')
+
+# New mail is handled in batches of this many UIDs; each batch costs one
+# header fetch, a few body fetches, one flag update and one checkpoint write.
+FORWARD_BATCH_SIZE = 100
+
+# Full bodies are pulled this many messages per UID FETCH, and never more
+# than BODY_FETCH_BYTES in one response.
+BODY_FETCH_CHUNK = 25
+BODY_FETCH_BYTES = 8 * 1024 * 1024
+
+# Messages above the spool threshold are copied to a temp file in pieces of
+# this size and streamed into the forward instead of being held in memory.
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Enough of a spooled or truncated message to classify its reply text.
+CLASSIFY_PREFIX_BYTES = 256 * 1024
+
+# Read size when streaming a spool into SMTP; a multiple of 57 so every
+# base64 line but the last is a full 76 characters.
+STREAM_PIECE_BYTES = 57 * 1024
+
+# Servers drop IDLE after 30 minutes (RFC 2177), so it is re-issued sooner.
+IDLE_RENEW_SECONDS = 25 * 60
+
+RECONNECT_BACKOFF_MIN = 5
+RECONNECT_BACKOFF_MAX = 300
+
+_UID_RE = re.compile(rb'\bUID (\d+)', re.IGNORECASE)
+_SIZE_RE = re.compile(rb'\bRFC822\.SIZE (\d+)', re.IGNORECASE)
+_DOT_RE = re.compile(rb'^\.', re.MULTILINE)
+_EOL_RE = re.compile(rb'\r?\n')
+
+
+def parse_uid_fetch(data) -> list[tuple[bytes, bytes, bytes]]:
+    """Pair each literal in a UID FETCH response with its message UID.
+
+    Returns (uid, literal, meta) where meta is the response text around the
+    literal. Servers may report UID before or after the literal, so the
+    closing fragment that follows each tuple is checked too.
+    """
+    out = []
+    for i, part in enumerate(data or []):
+        if not isinstance(part, tuple):
+            continue
+        meta = part[0]
+        if i + 1 < len(data) and isinstance(data[i + 1], bytes):
+            meta += data[i + 1]
+        match = _UID_RE.search(meta)
+        if match is None:
+            continue
+        out.append((match.group(1), part[1], meta))
+    return out
+
+
+def fetch_headers(imap: imaplib.IMAP4, uids: list[bytes]) -> tuple[dict[bytes, EmailMessage], dict[bytes, int]]:
+    """Fetch the skip-rule headers and size of every UID in a single round trip."""
+    if not uids:
+        return {}, {}
+    fields = ' '.join(SKIP_HEADER_FIELDS)
+    typ, data = imap.uid(
+        'FETCH', compress_uid_set(uids), f'(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({fields})])'
+    )
+    if typ != 'OK':
+        raise RuntimeError('Failed to fetch message headers')
+    parser = BytesParser(policy=policy.default)
+    headers_by_uid = {}
+    sizes = {}
+    for uid, raw, meta in parse_uid_fetch(data):
+        headers_by_uid[uid] = parser.parsebytes(raw, headersonly=True)
+        size = _SIZE_RE.search(meta)
+        sizes[uid] = int(size.group(1)) if size else 0
+    return headers_by_uid, sizes
+
+
+def chunk_by_size(uids: list[bytes], sizes: dict[bytes, int]):
+    """Group UIDs so each group stays under BODY_FETCH_CHUNK messages and BODY_FETCH_BYTES."""
+    chunk: list[bytes] = []
+    chunk_bytes = 0
+    for uid in uids:
+        size = sizes.get(uid, 0)
+        if chunk and (len(chunk) >= BODY_FETCH_CHUNK or chunk_bytes + size > BODY_FETCH_BYTES):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(uid)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def fetch_bodies(imap: imaplib.IMAP4, uids: list[bytes], sizes: dict[bytes, int]):
+    """Yield (uid, raw_bytes) for each UID in the given order, fetched in bulk chunks.
+
+    BODY.PEEK leaves the Seen flag alone so a failed forward is retried next run.
+    Raises when a chunk fails or comes back without one of its messages, so
+    the checkpoint stops below it.
+    """
+    for chunk in chunk_by_size(uids, sizes):
+        typ, data = imap.uid('FETCH', compress_uid_set(chunk), '(UID BODY.PEEK[])')
+        if typ != 'OK':
+            raise RuntimeError(f'Failed to fetch {len(chunk)} message bodies')
+        bodies = {uid: raw for uid, raw, _ in parse_uid_fetch(data)}
+        missing = [uid for uid in chunk if uid not in bodies]
+        if missing:
+            raise RuntimeError(f'Body fetch returned no message for UID {missing[0].decode()}')
+        for uid in chunk:
+            yield uid, bodies[uid]
+
+
+def uid_order_groups(uids: list[bytes], sizes: dict[bytes, int], spool_bytes: int):
+    """Split UIDs, in UID order, into runs of small messages and single large ones."""
+    run: list[bytes] = []
+    for uid in sorted(uids, key=int):
+        if sizes.get(uid, 0) <= spool_bytes:
+            run.append(uid)
+            continue
+        if run:
+            yield run
+            run = []
+        yield [uid]
+    if run:
+        yield run
+
+
+def spool_body(imap: imaplib.IMAP4, uid: bytes, size: int):
+    """Copy one message into a temp file with partial fetches, SPOOL_CHUNK_BYTES at a time.
+
+    Raises unless all `size` bytes arrived, so a truncated copy is never
+    forwarded and the UID stays pending.
+    """
+    spool = tempfile.TemporaryFile()
+    offset = 0
+    while offset < size:
+        typ, data = imap.uid('FETCH', uid.decode(), f'(UID BODY.PEEK[]<{offset}.{SPOOL_CHUNK_BYTES}>)')
+        parts = parse_uid_fetch(data) if typ == 'OK' else []
+        if not parts or not parts[0][1]:
+            break
+        spool.write(parts[0][1])
+        offset += len(parts[0][1])
+    if offset < size:
+        spool.close()
+        raise RuntimeError(f'Fetched {offset} of {size} bytes for UID {uid.decode()}')
+    spool.seek(0)
+    return spool
+
+
+def fetch_truncated(imap: imaplib.IMAP4, uid: bytes, limit: int) -> bytes:
+    """Return a message's full header plus only the first `limit` bytes of its body."""
+    typ, data = imap.uid('FETCH', uid.decode(), f'(UID BODY.PEEK[HEADER] BODY.PEEK[TEXT]<0.{limit}>)')
+    if typ != 'OK':
+        raise RuntimeError(f'Failed to fetch truncated message for UID {uid.decode()}')
+    header = b''
+    text = b''
+    for part in data or []:
+        if not isinstance(part, tuple):
+            continue
+        if b'HEADER' in part[0].upper():
+            header = part[1]
+        elif b'TEXT' in part[0].upper():
+            text = part[1]
+    return header + text
+
+
+def compress_uid_set(uids: list[bytes]) -> str:
+    """Render UIDs as an IMAP sequence set, collapsing runs: 1:4,7,9:12."""
+    nums = sorted({int(u) for u in uids})
+    parts = []
+    start = prev = None
+    for n in nums:
+        if prev is not None and n == prev + 1:
+            prev = n
+            continue
+        if start is not None:
+            parts.append(f'{start}:{prev}' if prev != start else str(start))
+        start = prev = n
+    if start is not None:
+        parts.append(f'{start}:{prev}' if prev != start else str(start))
+    return ','.join(parts)
+
+
+def mark_seen(imap: imaplib.IMAP4, uids: list[bytes]) -> None:
+    if uids:
+        imap.uid('STORE', compress_uid_set(uids), '+FLAGS', '(\\Seen)')
+
+
+def mailbox_uid_state(imap: imaplib.IMAP4) -> tuple[int, int]:
+    """Return (UIDVALIDITY, UIDNEXT) for the selected mailbox.
+
+    Uses the values from SELECT when still pending, else asks via STATUS.
+    """
+    _, validity = imap.response('UIDVALIDITY')
+    _, uid_next = imap.response('UIDNEXT')
+    if validity and validity[0] is not None and uid_next and uid_next[0] is not None:
+        return int(validity[0]), int(uid_next[0])
+
+    typ, data = imap.status('INBOX', '(UIDVALIDITY UIDNEXT)')
+    status = (data[0] or b'') if typ == 'OK' and data else b''
+    v_match = re.search(rb'UIDVALIDITY (\d+)', status)
+    n_match = re.search(rb'UIDNEXT (\d+)', status)
+    if v_match is None or n_match is None:
+        raise RuntimeError('Server did not report UIDVALIDITY/UIDNEXT')
+    return int(v_match.group(1)), int(n_match.group(1))
+
+
+def load_checkpoint(sb: Optional[Client], mailbox: str) -> dict:
+    """Return the persisted {mailbox, uid_validity, last_uid} for a mailbox.
+
+    Stored in outreach_mailbox_checkpoints when Supabase is configured, else in
+    the JSON file at OUTREACH_FORWARDER_CHECKPOINT_FILE.
+    """
+    checkpoint = {'mailbox': mailbox, 'uid_validity': None, 'last_uid': 0}
+    if sb:
+        res = sb.table('outreach_mailbox_checkpoints') \
+            .select('uid_validity, last_uid') \
+            .eq('mailbox', mailbox) \
+            .limit(1) \
+            .execute()
+        row = (res.data or [None])[0]
+    else:
+        try:
+            with open(checkpoint_file(), encoding='utf-8') as f:
+                row = json.load(f).get(mailbox)
+        except (OSError, ValueError):
+            row = None
+    if row:
+        checkpoint['uid_validity'] = row.get('uid_validity')
+        checkpoint['last_uid'] = int(row.get('last_uid') or 0)
+    return checkpoint
+
+
+def save_checkpoint(sb: Optional[Client], checkpoint: dict) -> None:
+    row = {
+        'mailbox': checkpoint['mailbox'],
+        'uid_validity': checkpoint['uid_validity'],
+        'last_uid': checkpoint['last_uid'],
+        'updated_at': now_iso(),
+    }
+    if sb:
+        sb.table('outreach_mailbox_checkpoints').upsert(row, on_conflict='mailbox').execute()
+        return
+
+    path = checkpoint_file()
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state[checkpoint['mailbox']] = row
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def checkpoint_file() -> str:
+    return os.path.expanduser(
+        os.getenv('OUTREACH_FORWARDER_CHECKPOINT_FILE', '~/.dommedirectory/forwarder_checkpoint.json')
+    )
+
+
+def advance_checkpoint(checkpoint: dict, uids: list[bytes], done: list[bytes]) -> None:
+    """Move last_uid past the longest run of handled UIDs, in UID order.
+
+    A message that failed mid-batch holds the checkpoint so it is retried.
+    Only valid because a batch that leaves such a gap ends the run: a later
+    batch would otherwise move last_uid past it.
+    """
+    done_set = set(done)
+    for uid in sorted(uids, key=int):
+        if uid not in done_set:
+            break
+        checkpoint['last_uid'] = max(checkpoint['last_uid'], int(uid))
+
+
+def search_new(imap: imaplib.IMAP4, sb: Optional[Client], checkpoint: dict) -> list[bytes]:
+    """Return UIDs above the checkpoint, independent of the Seen flag.
+
+    With no usable checkpoint (first run, or the server reset UIDVALIDITY),
+    everything already in the mailbox counts as processed and only UNSEEN
+    mail is picked up, once, to bootstrap. The new checkpoint is kept under
+    'reset' and only saved by commit_reset once that mail is handled, so a
+    run that dies mid-bootstrap bootstraps again.
+    """
+    checkpoint.pop('reset', None)
+    uid_validity, uid_next = mailbox_uid_state(imap)
+    if checkpoint['uid_validity'] != uid_validity:
+        if checkpoint['uid_validity'] is not None:
+            print(f"forwarder: UIDVALIDITY changed {checkpoint['uid_validity']} -> {uid_validity}; rescanning unseen")
+        checkpoint['reset'] = {'uid_validity': uid_validity, 'last_uid': uid_next - 1}
+        return search_unseen(imap)
+
+    typ, data = imap.uid('SEARCH', None, f"UID {checkpoint['last_uid'] + 1}:*")
+    if typ != 'OK':
+        raise RuntimeError('Failed to search inbox for new mail')
+    uids = data[0].split() if data and data[0] else []
+    # "n:*" always matches the newest message, even when its UID is below n.
+    return [u for u in uids if int(u) > checkpoint['last_uid']]
+
+
+def commit_reset(sb: Optional[Client], checkpoint: dict) -> None:
+    """Adopt and save the checkpoint search_new bootstrapped, once its mail is handled."""
+    reset = checkpoint.pop('reset', None)
+    if reset:
+        checkpoint.update(reset)
+        save_checkpoint(sb, checkpoint)
+
+
+def skip_reason(headers: EmailMessage, forward_to: str) -> Optional[str]:
+    """Return why a message should be marked seen without forwarding, if at all."""
+    subj = str(headers.get('Subject', '(no subject)'))
+    from_lower = str(headers.get('From', '(unknown sender)')).lower()
+
+    # Prevent obvious forwarding loops.
+    if forward_to.lower() in str(headers.get('To', '')).lower() and 'FWD' in subj.upper():
+        return 'forward_loop'
+
+    # Only forward replies from external senders — skip our own
+    # outgoing mail, auto-replies, bounces, and mailer-daemon.
+    if 'dommedirectory.com' in from_lower:
+        return 'own_domain'
+    if any(skip in from_lower for skip in ('mailer-daemon', 'postmaster', 'noreply', 'no-reply')):
+        return 'system_sender'
+    auto = str(headers.get('Auto-Submitted', '')).lower()
+    if auto and auto != 'no':
+        return 'auto_submitted'
+    return None
+
+
 def update_contact_status(sb: Client, contact: dict, intent: str, subject: str) -> Tuple[bool, str]:
     contact_id = contact['id']
     previous_status = (contact.get('status') or '').strip()
@@ -193,145 +557,463 @@ def send_auto_ack(
     msg['Subject'] = subject
     msg.set_content(body)
 
+    try:
+        reservation = send_quota.reserve()
+    except send_quota.QuotaExhausted as exc:
+        print(f'auto_ack_deferred: {to_email} -> {exc}')
+        return False
     try:
         smtp.send_message(msg)
-        return True
     except Exception as exc:
+        send_quota.release(reservation)
         print(f'auto_ack_error: {to_email} -> {exc}')
         return False
+    send_quota.commit(reservation)
+    return True
+
+
+def build_forward(cfg: dict, original: EmailMessage, note: str = '') -> EmailMessage:
+    """Forward envelope and summary text; the caller attaches the original."""
+    subj = str(original.get('Subject', '(no subject)'))
+    from_hdr = str(original.get('From', '(unknown sender)'))
+    fwd = EmailMessage()
+    fwd['From'] = f"{cfg['sender_name']} <{cfg['reply_to']}>"
+    fwd['To'] = cfg['forward_to']
+    fwd['Reply-To'] = cfg['reply_to']
+    fwd['Subject'] = f'[Inbox Forward] {subj}'
+    fwd.set_content(
+        'Forwarded from hello@dommedirectory.com\n\n'
+        f'Original From: {from_hdr}\n'
+        f'Original Subject: {subj}\n'
+        + (f'\n{note}\n' if note else '')
+    )
+    return fwd
+
+
+def send_streamed_forward(smtp: smtplib.SMTP, cfg: dict, fwd: EmailMessage, spool) -> None:
+    """Send fwd with the spooled original attached, streaming it through SMTP DATA.
+
+    The MIME wrapper is rendered around a placeholder attachment, then the
+    placeholder's bytes are replaced on the wire by the spool file, base64
+    encoded a slice at a time. The original never sits in memory whole.
+    """
+    token = uuid.uuid4().hex.encode()
+    fwd.add_attachment(token, maintype='message', subtype='rfc822', filename='original.eml')
+    wire = fwd.as_bytes(policy=policy.SMTP)
+    head, tail = wire.split(base64.b64encode(token), 1)
+    # The placeholder line's ending is replaced by the last streamed line's.
+    # The email package ends that line with a bare LF, and DATA is sent by
+    # hand here, so every line ending is made CRLF.
+    placeholder_end = _EOL_RE.match(tail)
+    head = _EOL_RE.sub(b'\r\n', head)
+    tail = _EOL_RE.sub(b'\r\n', tail[placeholder_end.end() if placeholder_end else 0:])
+
+    smtp.ehlo_or_helo_if_needed()
+    try:
+        code, resp = smtp.mail(cfg['reply_to'])
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, resp, cfg['reply_to'])
+        code, resp = smtp.rcpt(cfg['forward_to'])
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({cfg['forward_to']: (code, resp)})
+        code, resp = smtp.docmd('DATA')
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+
+        smtp.send(_DOT_RE.sub(b'..', head))
+        spool.seek(0)
+        while True:
+            piece = spool.read(STREAM_PIECE_BYTES)
+            if not piece:
+                break
+            # Base64 lines never start with '.', so no dot-stuffing is needed.
+            smtp.send(base64.encodebytes(piece).replace(b'\n', b'\r\n'))
+        smtp.send(_DOT_RE.sub(b'..', tail) + b'.\r\n')
+
+        code, resp = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+    except smtplib.SMTPResponseException:
+        try:
+            smtp.rset()
+        except smtplib.SMTPException:
+            pass
+        raise
+
+
+def handle_reply(
+    smtp: smtplib.SMTP,
+    cfg: dict,
+    sb: Optional[Client],
+    contacts_by_email: dict[str, dict],
+    counts: dict[str, int],
+    original: EmailMessage,
+    text: str,
+) -> None:
+    """Classify a reply, update its outreach contact and send any auto-ack."""
+    subj = str(original.get('Subject', '(no subject)'))
+    sender_email = parseaddr(str(original.get('From', '')))[1].strip().lower()
+    if not sb or not sender_email:
+        return
 
+    intent = classify_reply_intent(subj, text)
+    if not intent:
+        return
+    contact = contacts_by_email.get(sender_email)
+    if not contact:
+        return
+    changed, next_status = update_contact_status(sb, contact, intent, subj)
+    if not changed:
+        return
 
-def main() -> None:
-    imap_host = os.getenv('OUTREACH_IMAP_HOST', 'mail.spacemail.com')
-    imap_port = int(os.getenv('OUTREACH_IMAP_PORT', '993'))
-    smtp_host = os.getenv('OUTREACH_SMTP_HOST', 'mail.spacemail.com')
-    smtp_port = int(os.getenv('OUTREACH_SMTP_PORT', '465'))
+    if intent == 'positive':
+        counts['classified_positive'] += 1
+        if cfg['auto_ack_positive'] and send_auto_ack(
+            smtp, sender_email, cfg['sender_name'], cfg['reply_to'], subj, intent
+        ):
+            counts['auto_acks'] += 1
+    elif intent == 'opt_out':
+        counts['classified_opt_out'] += 1
+        if cfg['auto_ack_opt_out'] and send_auto_ack(
+            smtp, sender_email, cfg['sender_name'], cfg['reply_to'], subj, intent
+        ):
+            counts['auto_acks'] += 1
+    print(f'forwarder: status_update {sender_email} -> {next_status}')
+
+
+def parse_prefix(raw: bytes) -> tuple[EmailMessage, str]:
+    """Parse a message from its first bytes; the body may be cut mid-part."""
+    original = BytesParser(policy=policy.default).parsebytes(raw)
+    try:
+        text = extract_text(original)
+    except Exception:
+        text = ''
+    return original, text
 
+
+def load_config() -> dict:
     reply_to = getenv_required('OUTREACH_REPLY_TO_EMAIL')
-    imap_user = os.getenv('OUTREACH_IMAP_USERNAME', reply_to)
-    imap_pass = os.getenv('OUTREACH_IMAP_PASSWORD') or os.getenv('OUTREACH_SMTP_PASSWORD')
-    smtp_user = os.getenv('OUTREACH_SMTP_USERNAME', reply_to)
-    smtp_pass = os.getenv('OUTREACH_SMTP_PASSWORD')
-    forward_to = getenv_required('OUTREACH_FORWARD_TO_EMAIL')
-    sender_name = os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships')
-    auto_ack_positive = env_truthy('OUTREACH_AUTO_ACK_POSITIVE', 'true')
-    auto_ack_opt_out = env_truthy('OUTREACH_AUTO_ACK_OPT_OUT', 'false')
-
-    if not imap_pass:
+    cfg = {
+        'imap_host': os.getenv('OUTREACH_IMAP_HOST', 'mail.spacemail.com'),
+        'imap_port': int(os.getenv('OUTREACH_IMAP_PORT', '993')),
+        'smtp_host': os.getenv('OUTREACH_SMTP_HOST', 'mail.spacemail.com'),
+        'smtp_port': int(os.getenv('OUTREACH_SMTP_PORT', '465')),
+        'reply_to': reply_to,
+        'imap_user': os.getenv('OUTREACH_IMAP_USERNAME', reply_to),
+        'imap_pass': os.getenv('OUTREACH_IMAP_PASSWORD') or os.getenv('OUTREACH_SMTP_PASSWORD'),
+        'smtp_user': os.getenv('OUTREACH_SMTP_USERNAME', reply_to),
+        'smtp_pass': os.getenv('OUTREACH_SMTP_PASSWORD'),
+        'forward_to': getenv_required('OUTREACH_FORWARD_TO_EMAIL'),
+        'sender_name': os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships'),
+        'auto_ack_positive': env_truthy('OUTREACH_AUTO_ACK_POSITIVE', 'true'),
+        'auto_ack_opt_out': env_truthy('OUTREACH_AUTO_ACK_OPT_OUT', 'false'),
+        # Above spool_bytes a message is streamed from a temp file; above
+        # max_bytes only its headers and a truncated body are forwarded.
+        'spool_bytes': int(os.getenv('OUTREACH_FORWARD_SPOOL_BYTES', str(2 * 1024 * 1024))),
+        'max_bytes': int(os.getenv('OUTREACH_FORWARD_MAX_BYTES', str(25 * 1024 * 1024))),
+    }
+
+    if not cfg['imap_pass']:
         raise RuntimeError('Missing OUTREACH_IMAP_PASSWORD (or OUTREACH_SMTP_PASSWORD fallback)')
-    if not smtp_pass:
+    if not cfg['smtp_pass']:
         raise RuntimeError('Missing OUTREACH_SMTP_PASSWORD')
+    return cfg
 
-    sb = get_supabase_client()
-    contacts_by_email = load_contacts_by_email(sb) if sb else {}
-    if sb:
-        print(f'forwarder: loaded_contacts={len(contacts_by_email)}')
-    else:
-        print('forwarder: supabase not configured; reply classification disabled')
 
-    imap = imaplib.IMAP4_SSL(imap_host, imap_port)
-    imap.login(imap_user, imap_pass)
+def connect_imap(cfg: dict) -> imaplib.IMAP4_SSL:
+    imap = imaplib.IMAP4_SSL(cfg['imap_host'], cfg['imap_port'])
+    imap.login(cfg['imap_user'], cfg['imap_pass'])
     imap.select('INBOX')
+    return imap
 
-    typ, data = imap.search(None, '(UNSEEN)')
+
+def search_unseen(imap: imaplib.IMAP4) -> list[bytes]:
+    typ, data = imap.uid('SEARCH', None, '(UNSEEN)')
     if typ != 'OK':
         raise RuntimeError('Failed to search inbox for unseen mail')
+    return data[0].split() if data and data[0] else []
+
+
+def new_counts() -> dict[str, int]:
+    return {'forwarded': 0, 'classified_positive': 0, 'classified_opt_out': 0, 'auto_acks': 0}
+
 
-    msg_ids = data[0].split() if data and data[0] else []
-    if not msg_ids:
-        print('forwarder: no unseen messages')
+def print_counts(counts: dict[str, int]) -> None:
+    print(
+        f"forwarder: forwarded={counts['forwarded']} "
+        f"classified_positive={counts['classified_positive']} "
+        f"classified_opt_out={counts['classified_opt_out']} "
+        f"auto_acks={counts['auto_acks']}"
+    )
+
+
+def save_run(sb: Optional[Client], run: RunLog, uids: list[bytes], counts: dict[str, int]) -> None:
+    forwarded = counts['forwarded']
+    run.count(status='forwarded', channel='email', n=forwarded)
+    run.count(status='skipped', n=len(uids) - forwarded)
+    run.save(sb, **counts)
+
+
+def process_uids(
+    imap: imaplib.IMAP4,
+    cfg: dict,
+    sb: Optional[Client],
+    contacts: Optional[ContactCache],
+    uids: list[bytes],
+    checkpoint: Optional[dict] = None,
+) -> dict[str, int]:
+    """Skip, classify and forward one batch of new messages.
+
+    The checkpoint (when given) advances past every UID handled in order, even
+    if the batch stops early on an error, and is saved before the batch's Seen
+    flags go out in one UID STORE. Messages are forwarded in UID order
+    and any fetch or send failure raises, so nothing above the checkpoint
+    has been forwarded and the caller stops before the next batch. While
+    bootstrapping (see search_new) the checkpoint is left to commit_reset.
+    """
+    counts = new_counts()
+    done: list[bytes] = []
+
+    try:
+        # Phase 1: one batched header fetch; skip rules never need the body.
+        headers_by_uid, sizes = fetch_headers(imap, uids)
+        pending = []
+        for uid in uids:
+            headers = headers_by_uid.get(uid)
+            if headers is None or skip_reason(headers, cfg['forward_to']):
+                # Expunged since the search, or not ours to forward.
+                done.append(uid)
+            else:
+                pending.append(uid)
+
+        # Resolve only the senders in this batch, in one chunked query.
+        contacts_by_email = contacts.resolve([
+            parseaddr(str(headers_by_uid[uid].get('From', '')))[1].strip().lower()
+            for uid in pending
+        ]) if contacts and pending else {}
+
+        large = [uid for uid in pending if sizes.get(uid, 0) > cfg['spool_bytes']]
+        print(f'forwarder: new={len(uids)} skipped={len(done)} pending={len(pending)} large={len(large)}')
+        if not pending:
+            return counts
+
+        ctx = ssl.create_default_context()
+        with smtplib.SMTP_SSL(cfg['smtp_host'], cfg['smtp_port'], context=ctx, timeout=30) as smtp:
+            smtp.login(cfg['smtp_user'], cfg['smtp_pass'])
+
+            # Phase 2: full bodies, only for messages we will forward, in UID
+            # order. Small ones are fetched in bulk; large ones go one at a
+            # time so memory stays flat.
+            for group in uid_order_groups(pending, sizes, cfg['spool_bytes']):
+                if sizes.get(group[0], 0) <= cfg['spool_bytes']:
+                    for uid, raw in fetch_bodies(imap, group, sizes):
+                        original = BytesParser(policy=policy.default).parsebytes(raw)
+                        handle_reply(smtp, cfg, sb, contacts_by_email, counts, original, extract_text(original))
+
+                        fwd = build_forward(cfg, original)
+                        fwd.add_attachment(
+                            raw,
+                            maintype='message',
+                            subtype='rfc822',
+                            filename='original.eml',
+                        )
+                        smtp.send_message(fwd)
+                        send_quota.record()
+                        done.append(uid)
+                        counts['forwarded'] += 1
+                    continue
+
+                uid = group[0]
+                size = sizes[uid]
+                if size > cfg['max_bytes']:
+                    raw = fetch_truncated(imap, uid, CLASSIFY_PREFIX_BYTES)
+                    original, text = parse_prefix(raw)
+                    handle_reply(smtp, cfg, sb, contacts_by_email, counts, original, text)
+                    fwd = build_forward(cfg, original, note=(
+                        f'Original is {size} bytes, over the {cfg["max_bytes"]}-byte forward cap. '
+                        f'Attached: full headers and the first {len(raw)} bytes only; '
+                        'read the rest in the inbox.'
+                    ))
+                    fwd.add_attachment(raw, maintype='text', subtype='plain', filename='original-truncated.eml')
+                    smtp.send_message(fwd)
+                else:
+                    with spool_body(imap, uid, size) as spool:
+                        original, text = parse_prefix(spool.read(CLASSIFY_PREFIX_BYTES))
+                        handle_reply(smtp, cfg, sb, contacts_by_email, counts, original, text)
+                        send_streamed_forward(smtp, cfg, build_forward(cfg, original), spool)
+                send_quota.record()
+                done.append(uid)
+                counts['forwarded'] += 1
+    finally:
+        # The checkpoint first: when the connection dropped mid-batch the flag
+        # update fails too, and the checkpoint is what keeps these UIDs from
+        # being forwarded again.
+        if checkpoint is not None and 'reset' not in checkpoint:
+            advance_checkpoint(checkpoint, uids, done)
+            save_checkpoint(sb, checkpoint)
+        try:
+            mark_seen(imap, done)
+        except Exception as exc:
+            print(f'forwarder: could not mark {len(done)} messages seen ({exc})')
+
+    return counts
+
+
+def idle_wait(imap: imaplib.IMAP4, timeout: float) -> bool:
+    """Block in IMAP IDLE until the server reports new mail or timeout expires.
+
+    imaplib has no IDLE support before Python 3.14, so the command is driven
+    by hand over the existing connection. Returns True when EXISTS/RECENT was
+    seen, False when the wait simply timed out.
+    """
+    tag = imap._new_tag()
+    imap.send(tag + b' IDLE\r\n')
+    line = imap.readline()
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.abort(f'IDLE rejected: {line!r}')
+
+    got_mail = False
+    deadline = time.monotonic() + timeout
+    try:
+        while not got_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            imap.sock.settimeout(remaining)
+            try:
+                line = imap.readline()
+            except socket.timeout:
+                # A socket file refuses further reads after a timeout; nothing
+                # was buffered, so a fresh one picks up where it left off.
+                imap.file = imap.sock.makefile('rb')
+                break
+            if not line:
+                raise imaplib.IMAP4.abort('connection closed during IDLE')
+            if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                got_mail = True
+    finally:
+        imap.sock.settimeout(None)
+
+    imap.send(b'DONE\r\n')
+    # Drain untagged updates until the server completes the IDLE command.
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort('connection closed ending IDLE')
+        if line.startswith(tag):
+            if b' OK' not in line:
+                raise imaplib.IMAP4.abort(f'IDLE failed: {line!r}')
+            return got_mail
+
+
+def run_once(cfg: dict) -> None:
+    run = RunLog('forward_inbox')
+    sb = get_supabase_client()
+    contacts = ContactCache(sb) if sb else None
+    if not sb:
+        print('forwarder: supabase not configured; reply classification disabled')
+    send_quota.configure(sb, cfg['smtp_user'], 'forward_inbox')
+
+    imap = connect_imap(cfg)
+    checkpoint = load_checkpoint(sb, cfg['imap_user'])
+    uids = search_new(imap, sb, checkpoint)
+    if not uids:
+        print('forwarder: no new messages')
+        commit_reset(sb, checkpoint)
         imap.logout()
+        save_run(sb, run, uids, new_counts())
         return
 
-    ctx = ssl.create_default_context()
-    sent = 0
-    classified_positive = 0
-    classified_opt_out = 0
-    auto_acks = 0
-
-    with smtplib.SMTP_SSL(smtp_host, smtp_port, context=ctx, timeout=30) as smtp:
-        smtp.login(smtp_user, smtp_pass)
-
-        for msg_id in msg_ids:
-            typ, fetched = imap.fetch(msg_id, '(RFC822)')
-            if typ != 'OK' or not fetched or not isinstance(fetched[0], tuple):
-                continue
-
-            raw = fetched[0][1]
-            original = BytesParser(policy=policy.default).parsebytes(raw)
-
-            subj = str(original.get('Subject', '(no subject)'))
-            from_hdr = str(original.get('From', '(unknown sender)'))
-            sender_email = parseaddr(from_hdr)[1].strip().lower()
-
-            # Prevent obvious forwarding loops.
-            if forward_to.lower() in str(original.get('To', '')).lower() and 'FWD' in subj.upper():
-                imap.store(msg_id, '+FLAGS', '(\\Seen)')
-                continue
-
-            # Only forward replies from external senders — skip our own
-            # outgoing mail, auto-replies, bounces, and mailer-daemon.
-            from_lower = from_hdr.lower()
-            if 'dommedirectory.com' in from_lower:
-                imap.store(msg_id, '+FLAGS', '(\\Seen)')
-                continue
-            if any(skip in from_lower for skip in ('mailer-daemon', 'postmaster', 'noreply', 'no-reply')):
-                imap.store(msg_id, '+FLAGS', '(\\Seen)')
-                continue
-            auto = str(original.get('Auto-Submitted', '')).lower()
-            if auto and auto != 'no':
-                imap.store(msg_id, '+FLAGS', '(\\Seen)')
-                continue
-
-            if sb and sender_email:
-                intent = classify_reply_intent(subj, extract_text(original))
-                if intent:
-                    contact = contacts_by_email.get(sender_email)
-                    if contact:
-                        changed, next_status = update_contact_status(sb, contact, intent, subj)
-                        if changed:
-                            if intent == 'positive':
-                                classified_positive += 1
-                                if auto_ack_positive and send_auto_ack(
-                                    smtp, sender_email, sender_name, reply_to, subj, intent
-                                ):
-                                    auto_acks += 1
-                            elif intent == 'opt_out':
-                                classified_opt_out += 1
-                                if auto_ack_opt_out and send_auto_ack(
-                                    smtp, sender_email, sender_name, reply_to, subj, intent
-                                ):
-                                    auto_acks += 1
-                            print(f'forwarder: status_update {sender_email} -> {next_status}')
-
-            fwd = EmailMessage()
-            fwd['From'] = f'{sender_name} <{reply_to}>'
-            fwd['To'] = forward_to
-            fwd['Reply-To'] = reply_to
-            fwd['Subject'] = f'[Inbox Forward] {subj}'
-            fwd.set_content(
-                'Forwarded from hello@dommedirectory.com\n\n'
-                f'Original From: {from_hdr}\n'
-                f'Original Subject: {subj}\n'
-            )
-            fwd.add_attachment(
-                raw,
-                maintype='message',
-                subtype='rfc822',
-                filename='original.eml',
-            )
-
-            smtp.send_message(fwd)
-            imap.store(msg_id, '+FLAGS', '(\\Seen)')
-            sent += 1
-
+    counts = new_counts()
+    for start in range(0, len(uids), FORWARD_BATCH_SIZE):
+        batch = process_uids(imap, cfg, sb, contacts, uids[start:start + FORWARD_BATCH_SIZE], checkpoint)
+        for key, value in batch.items():
+            counts[key] += value
+    commit_reset(sb, checkpoint)
     imap.logout()
-    print(
-        f'forwarder: forwarded={sent} '
-        f'classified_positive={classified_positive} '
-        f'classified_opt_out={classified_opt_out} '
-        f'auto_acks={auto_acks}'
+    print_counts(counts)
+    save_run(sb, run, uids, counts)
+
+
+def run_idle(cfg: dict) -> None:
+    """Hold one IMAP connection in IDLE and process mail as it arrives.
+
+    Reconnects with exponential backoff after any connection error, and
+    drops cached contact lookups every OUTREACH_CONTACTS_REFRESH_SECONDS.
+    """
+    idle_timeout = int(os.getenv('OUTREACH_IDLE_TIMEOUT_SECONDS', str(IDLE_RENEW_SECONDS)))
+    refresh_every = int(os.getenv('OUTREACH_CONTACTS_REFRESH_SECONDS', '900'))
+
+    sb = get_supabase_client()
+    if not sb:
+        print('forwarder: supabase not configured; reply classification disabled')
+    send_quota.configure(sb, cfg['smtp_user'], 'forward_inbox')
+    contacts = ContactCache(sb) if sb else None
+    contacts_cleared_at = time.monotonic()
+    checkpoint = load_checkpoint(sb, cfg['imap_user'])
+    backoff = RECONNECT_BACKOFF_MIN
+
+    while True:
+        imap = None
+        try:
+            imap = connect_imap(cfg)
+            print('forwarder: idle listener connected')
+            backoff = RECONNECT_BACKOFF_MIN
+            while True:
+                if contacts and time.monotonic() - contacts_cleared_at >= refresh_every:
+                    contacts.clear()
+                    contacts_cleared_at = time.monotonic()
+
+                run = RunLog('forward_inbox')
+                uids = search_new(imap, sb, checkpoint)
+                counts = new_counts()
+                for start in range(0, len(uids), FORWARD_BATCH_SIZE):
+                    batch = process_uids(imap, cfg, sb, contacts, uids[start:start + FORWARD_BATCH_SIZE], checkpoint)
+                    print_counts(batch)
+                    for key, value in batch.items():
+                        counts[key] += value
+                commit_reset(sb, checkpoint)
+                if uids:
+                    save_run(sb, run, uids, counts)
+
+                idle_wait(imap, idle_timeout)
+        except KeyboardInterrupt:
+            print('forwarder: idle listener stopped')
+            if imap is not None:
+                try:
+                    imap.logout()
+                except Exception:
+                    pass
+            return
+        except Exception as exc:
+            print(f'forwarder: listener error ({exc}); reconnecting in {backoff}s')
+            if imap is not None:
+                try:
+                    imap.logout()
+                except Exception:
+                    pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--idle',
+        action='store_true',
+        default=env_truthy('OUTREACH_FORWARDER_IDLE'),
+        help='stay connected and process new mail via IMAP IDLE',
     )
+    parser.add_argument('--profile-dir', default=os.getenv('OUTREACH_PROFILE_DIR', ''),
+                        help='write cProfile/tracemalloc output here (see profiling.py)')
+    args = parser.parse_args()
+    profiling.start('forward_inbox', args.profile_dir)
+
+    cfg = load_config()
+    if args.idle:
+        run_idle(cfg)
+    else:
+        run_once(cfg)
 
 
 if __name__ == '__main__':
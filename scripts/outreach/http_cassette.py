@@ -0,0 +1,186 @@
+"""Record/replay of the outreach scripts' HTTP traffic.
+
+OUTREACH_CASSETTE=<path>.jsonl.gz with OUTREACH_CASSETTE_MODE=record saves
+every request made through prepare_session() sessions: one gzip-compressed
+JSON line per request, keyed by method, URL and a hash of the body (field names for form posts), with
+the status, headers and body of the response (or the exception raised).
+Each run appends a gzip member, so several scripts can record into the
+same cassette in turn.
+
+OUTREACH_CASSETTE_MODE=replay serves those sessions entirely from the
+cassette. Repeated requests get the recorded responses in order; a request
+the cassette has never seen fails like an unreachable site.
+
+note_seed() marks the website each classify()/probe_candidate() call
+starts from, so bench/replay_cassette.py can rerun exactly that workload.
+"""
+
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from urllib.parse import parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from stage_trace import ENABLED as TRACING, TracedAdapter, add_bytes, traced_session
+
+CASSETTE = os.getenv('OUTREACH_CASSETTE', '').strip()
+
+MODE = os.getenv('OUTREACH_CASSETTE_MODE', 'record' if CASSETTE else '').strip().lower()
+
+_lock = threading.Lock()
+_writer = None
+_replay = None
+_misses = 0
+
+
+def request_key(method: str, url: str, body, content_type: str = '') -> str:
+    """Method, URL and a body digest.
+
+    Form posts are keyed by their field names only, so a replay still
+    matches after the message text or sender settings change.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if body and content_type.startswith('application/x-www-form-urlencoded'):
+        body = '&'.join(sorted(k for k, _ in parse_qsl(body.decode('utf-8', 'replace'), keep_blank_values=True))).encode('utf-8')
+    digest = hashlib.sha256(body or b'').hexdigest()[:16]
+    return f'{method.upper()} {url} {digest}'
+
+
+def _key(request) -> str:
+    return request_key(request.method, request.url, request.body, request.headers.get('Content-Type') or '')
+
+
+def _write(entry: dict):
+    global _writer
+    line = (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+    with _lock:
+        if _writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(CASSETTE)), exist_ok=True)
+            _writer = gzip.open(CASSETTE, 'ab')
+        _writer.write(line)
+
+
+def close():
+    """Flush the cassette being recorded and report replay misses."""
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    if MODE == 'replay' and _misses:
+        print(f'http_cassette: replay_misses={_misses}')
+
+
+if CASSETTE:
+    atexit.register(close)
+
+
+def read_entries(path: str):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def seeds(path: str):
+    """(kind, url) pairs noted while recording, in order and deduplicated."""
+    out, seen = [], set()
+    for entry in read_entries(path):
+        if 'seed' not in entry:
+            continue
+        key = (entry['kind'], entry['seed'])
+        if key not in seen:
+            seen.add(key)
+            out.append(key)
+    return out
+
+
+def note_seed(kind: str, url: str):
+    if MODE == 'record' and CASSETTE and url:
+        _write({'kind': kind, 'seed': url})
+
+
+def _load_replay():
+    global _replay
+    with _lock:
+        if _replay is None:
+            index = {}
+            for entry in read_entries(CASSETTE):
+                if 'key' in entry:
+                    index.setdefault(entry['key'], deque()).append(entry)
+            _replay = index
+    return _replay
+
+
+class RecordingAdapter(TracedAdapter if TRACING else HTTPAdapter):
+    def send(self, request, stream=False, **kwargs):
+        key = _key(request)
+        try:
+            resp = super().send(request, stream=False, **kwargs)
+        except requests.RequestException as e:
+            _write({'key': key, 'error': type(e).__name__, 'message': str(e)[:500]})
+            raise
+        _write({
+            'key': key,
+            'status': resp.status_code,
+            'reason': resp.reason,
+            'headers': dict(resp.headers),
+            'body': base64.b64encode(resp.content).decode('ascii'),
+        })
+        return resp
+
+
+class ReplayAdapter(HTTPAdapter):
+    def send(self, request, stream=False, **kwargs):
+        global _misses
+        key = _key(request)
+        recorded = _load_replay().get(key)
+        with _lock:
+            if not recorded:
+                _misses += 1
+                entry = None
+            else:
+                # Keep the last response for any further repeats.
+                entry = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        if entry is None:
+            raise requests.ConnectionError(f'cassette miss: {key}', request=request)
+        if 'error' in entry:
+            error = getattr(requests.exceptions, entry['error'], requests.ConnectionError)
+            raise error(entry['message'], request=request)
+
+        resp = requests.Response()
+        resp.status_code = entry['status']
+        resp.reason = entry['reason']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = base64.b64decode(entry['body'])
+        resp._content_consumed = True
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        add_bytes('download', len(resp._content))
+        return resp
+
+
+def prepare_session(session):
+    """Mount the record/replay adapter when a cassette is configured.
+
+    Otherwise this is stage_trace.traced_session().
+    """
+    if not CASSETTE or MODE not in ('record', 'replay'):
+        return traced_session(session)
+    adapter = ReplayAdapter() if MODE == 'replay' else RecordingAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""Classify and send for every active city in one run.
+
+Runs the build_delivery_queues_db classify step and then the
+daily_outreach_db send step across all cities at once. Cities take turns:
+each worker asks the scheduler for the next candidate, which comes from
+the city with the fewest slots used that still has candidates and quota,
+so one large metro cannot use up the day's budget. A city that runs out
+of candidates drops out of the rotation and the rest share what is left.
+
+Active cities come from outreach_city_backlog(): every city with
+not_contacted rows whose location (if any) is active. Each run writes its
+counts and stage timings to outreach_runs (see run_log.py).
+
+Required env vars: as daily_outreach_db.py.
+
+Optional env vars:
+  OUTREACH_CITIES          comma-separated cities to run (default: all active)
+  CLASSIFY_LIMIT           rows to classify (or reprobe) across all cities (default: 100)
+  CLASSIFY_CITY_QUOTAS     per-city classify caps, e.g. '*=40,toronto=80'
+                           ('*' is the default cap; none = no per-city cap)
+  OUTREACH_DAILY_LIMIT     sends across all cities (default: 8)
+  OUTREACH_CITY_QUOTAS     per-city send caps, same format
+  OUTREACH_CITY_WORKERS    candidates in flight at once (default: 4)
+  OUTREACH_PARSE_WORKERS   processes for HTML parsing (default: 0 = in-process)
+  OUTREACH_PACING_SECONDS  pause after each candidate, per worker (default: 1.0,
+                           0 in shadow mode)
+  OUTREACH_TRACE_DIR       stage timings, plus <dir>/outreach_cities.cities.json
+  OUTREACH_PROFILE_DIR     profile the run into this directory (see profiling.py)
+  OUTREACH_SHADOW          run against the shadow copy and local sinks (see shadow.py)
+  OUTREACH_SMTP_DAILY_CAP  provider's daily cap, shared with the other senders (see send_quota.py)
+  OUTREACH_SEND_LEASE_SECONDS  time before an unrecorded send is reconciled (see send_ledger.py)
+  plus the sender and SMTP settings of daily_outreach_db.py.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import form_cache
+import profiling
+import send_ledger
+import send_quota
+import shadow
+from build_delivery_queues_db import classify, due_for_probe, refresh_priority_scores, save_classification
+from daily_outreach_db import (
+    CANDIDATE_COLUMNS, CHANNEL_BY_STATUS, COUNTED_STATUSES, claim_send, clean_url, contacted_emails,
+    deliver_plan, probe_candidate, probe_input, reconcile_sends, required_env, save_result, supabase_client,
+    suppress_duplicate,
+)
+from page_analysis import parse_pool
+from run_log import RunLog
+from stage_trace import TRACE_DIR, Tracer, bind, percentile, span
+
+SCRIPT = 'outreach_cities'
+
+NO_CITY = '(none)'
+
+
+def parse_quotas(spec: str) -> dict:
+    """'*=5,toronto=10' -> {'*': 5, 'toronto': 10}."""
+    quotas = {}
+    for part in (spec or '').split(','):
+        city, sep, value = part.partition('=')
+        if sep and city.strip():
+            quotas[city.strip().lower()] = int(value)
+    return quotas
+
+
+def quota_for(quotas: dict, city: str, total: int) -> int:
+    return min(quotas.get(city.lower(), quotas.get('*', total)), total)
+
+
+class FairScheduler:
+    """Fair turns over per-city queues with per-city and global budgets.
+
+    A slot is reserved when a candidate is handed out and given back by
+    done() if the outcome does not count, so concurrent workers never
+    overshoot either budget.
+    """
+
+    def __init__(self, queues: dict, quotas: dict, total: int):
+        self.queues = {city: list(rows) for city, rows in queues.items() if rows}
+        self.quotas = quotas
+        self.total = total
+        self.used = {city: 0 for city in queues}
+        self.in_flight = {city: 0 for city in queues}
+        self.order = sorted(self.queues)
+        self.turn = 0
+        self._cond = threading.Condition()
+
+    def _busy(self, city: str) -> int:
+        return self.used[city] + self.in_flight[city]
+
+    def _pick(self):
+        if sum(self.used.values()) + sum(self.in_flight.values()) >= self.total:
+            return None
+        # The city with the fewest slots taken goes next, in turn on ties,
+        # so failed candidates do not cost a city its share.
+        rotation = self.order[self.turn:] + self.order[:self.turn]
+        ready = [c for c in rotation if self.queues.get(c) and self._busy(c) < self.quotas[c]]
+        if not ready:
+            return None
+        city = min(ready, key=self._busy)
+        self.turn = (self.order.index(city) + 1) % len(self.order)
+        self.in_flight[city] += 1
+        return city, self.queues[city].pop(0)
+
+    def _waiting(self) -> bool:
+        # A running candidate may still hand its slot back.
+        return any(self.in_flight.values()) and any(self.queues.values())
+
+    def next(self):
+        """The next (city, row), or None when every city is finished."""
+        with self._cond:
+            while True:
+                item = self._pick()
+                if item is not None or not self._waiting():
+                    return item
+                self._cond.wait()
+
+    def done(self, city: str, counted: bool):
+        with self._cond:
+            self.in_flight[city] -= 1
+            if counted:
+                self.used[city] += 1
+            self._cond.notify_all()
+
+
+class CityStats:
+    def __init__(self):
+        self.cities = {}
+        self._lock = threading.Lock()
+
+    def add(self, city: str, phase: str, outcome: str, counted: bool, seconds: float):
+        with self._lock:
+            entry = self.cities.setdefault(city, {})
+            stats = entry.setdefault(phase, {'attempted': 0, 'counted': 0, 'outcomes': {}, 'ms': []})
+            stats['attempted'] += 1
+            stats['counted'] += int(counted)
+            stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+            stats['ms'].append(seconds * 1000)
+
+    def summary(self, backlog: dict, quotas: dict) -> dict:
+        out = {}
+        for city in sorted(set(self.cities) | set(backlog)):
+            entry = {'backlog': backlog.get(city, {}), 'quotas': quotas.get(city, {})}
+            for phase, stats in self.cities.get(city, {}).items():
+                ms = sorted(stats['ms'])
+                entry[phase] = {
+                    'attempted': stats['attempted'],
+                    'counted': stats['counted'],
+                    'outcomes': stats['outcomes'],
+                    'p50_ms': round(percentile(ms, 50), 1),
+                    'p95_ms': round(percentile(ms, 95), 1),
+                }
+            out[city] = entry
+        return out
+
+
+def city_backlog(sb, only: list) -> dict:
+    """{city: {'unclassified': n, 'sendable': n}} for active cities."""
+    rows = sb.rpc('outreach_city_backlog').execute().data or []
+    wanted = {c.lower() for c in only}
+    backlog = {}
+    for r in rows:
+        city = r.get('city') or NO_CITY
+        if wanted and city.lower() not in wanted:
+            continue
+        backlog[city] = {'unclassified': r.get('unclassified') or 0, 'sendable': r.get('sendable') or 0}
+    return backlog
+
+
+def city_query(sb, columns: str, city: str):
+    query = sb.table('outreach_contacts') \
+        .select(columns) \
+        .eq('status', 'not_contacted')
+    return query.is_('city', 'null') if city == NO_CITY else query.eq('city', city)
+
+
+def run_phase(name: str, queues: dict, quotas: dict, total: int, workers: int, handle):
+    """Hand candidates to `workers` threads fairly; handle(city, row) -> counted."""
+    scheduler = FairScheduler(queues, quotas, total)
+    workers = max(workers, 1)
+
+    def worker():
+        while True:
+            item = scheduler.next()
+            if item is None:
+                return
+            city, row = item
+            counted = False
+            try:
+                counted = handle(city, row)
+            finally:
+                scheduler.done(city, counted)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+    print(f'{SCRIPT}: {name} ' + ' '.join(f'{city}={scheduler.used[city]}' for city in sorted(scheduler.used)))
+
+
+def main():
+    profiling.start(SCRIPT)
+    reply_to = required_env('OUTREACH_REPLY_TO_EMAIL')
+    sender_name = os.getenv('OUTREACH_SENDER_NAME', 'DommeDirectory Partnerships')
+    smtp_user = os.getenv('OUTREACH_SMTP_USERNAME', reply_to)
+    smtp_pass = required_env('OUTREACH_SMTP_PASSWORD')
+    smtp_host = os.getenv('OUTREACH_SMTP_HOST', 'mail.spacemail.com')
+    smtp_port = int(os.getenv('OUTREACH_SMTP_PORT', '465'))
+    only = [c.strip() for c in os.getenv('OUTREACH_CITIES', '').split(',') if c.strip()]
+    classify_limit = int(os.getenv('CLASSIFY_LIMIT', '100'))
+    classify_quotas = parse_quotas(os.getenv('CLASSIFY_CITY_QUOTAS', ''))
+    daily_limit = int(os.getenv('OUTREACH_DAILY_LIMIT', '8'))
+    send_quotas = parse_quotas(os.getenv('OUTREACH_CITY_QUOTAS', ''))
+    workers = int(os.getenv('OUTREACH_CITY_WORKERS', '4'))
+    parse_workers = int(os.getenv('OUTREACH_PARSE_WORKERS', '0'))
+    pacing = float(os.getenv('OUTREACH_PACING_SECONDS', '0' if shadow.ENABLED else '1.0'))
+
+    run = RunLog(SCRIPT)
+    sb = supabase_client()
+    send_quota.configure(sb, smtp_user, SCRIPT)
+    send_ledger.configure(sb, SCRIPT)
+    form_cache.configure(sb)
+    reconciled = reconcile_sends(sb)
+    backlog = city_backlog(sb, only)
+    cities = sorted(backlog)
+    print(f'{SCRIPT}: cities={len(cities)} ' + ' '.join(
+        f"{c}={backlog[c]['unclassified']}/{backlog[c]['sendable']}" for c in cities))
+
+    pool = parse_pool(parse_workers)
+    tracer = Tracer(SCRIPT, keep=True)
+    stats = CityStats()
+    quotas = {c: {'classify': quota_for(classify_quotas, c, classify_limit),
+                  'send': quota_for(send_quotas, c, daily_limit)} for c in cities}
+
+    # Classify unclassified rows, then due reprobes: every outcome uses a slot.
+    queues = {}
+    for city in cities:
+        cap = quotas[city]['classify']
+        if cap and backlog[city]['unclassified']:
+            query = city_query(sb, 'id, seed_contact_website, display_name, city, probe_failures', city)
+            queues[city] = due_for_probe(query) \
+                .limit(cap) \
+                .execute().data or []
+
+    def classify_one(city, row):
+        started = time.perf_counter()
+        trace = tracer.start(row['id'])
+        with bind(trace):
+            outcome = classify((row.get('seed_contact_website') or '').strip(), pool)
+            with span('db'):
+                save_classification(sb, row, outcome)
+        tracer.finish(trace, city=city, phase='classify', method=outcome[0], reason=outcome[1])
+        stats.add(city, 'classify', outcome[0], True, time.perf_counter() - started)
+        run.count(status='classified', city=city, evidence=outcome[2])
+        print(f"  [{city}] {row.get('display_name','?')} -> {outcome[0]} ({outcome[1]})")
+        time.sleep(pacing)
+        return True
+
+    run_phase('classified', queues, {c: quotas[c]['classify'] for c in cities},
+              classify_limit, workers, classify_one)
+    if refresh_priority_scores(sb) is None:
+        run.error('priority_refresh')
+
+    # Send, best priority_score first within each city. Only delivered and
+    # needs_manual outcomes use a slot; the target sets are shared so a
+    # provider listed in two cities is contacted once.
+    seen_targets = set()
+    targets_lock = threading.Lock()
+
+    queues = {}
+    for city in cities:
+        cap = quotas[city]['send']
+        if cap:
+            queues[city] = city_query(sb, CANDIDATE_COLUMNS, city) \
+                .in_('contact_method', ['email', 'contact_form']) \
+                .order('priority_score', desc=True) \
+                .limit(cap * 3) \
+                .execute().data or []
+    form_cache.preload(clean_url(r.get('seed_contact_website', '')) for rows in queues.values() for r in rows)
+    already_contacted_emails = contacted_emails(
+        sb, (r.get('seed_contact_email') for rows in queues.values() for r in rows))
+
+    def claim(row, website, seed_email):
+        """'ok', 'suppress' or 'skip', reserving the target if 'ok'."""
+        with targets_lock:
+            if seed_email and seed_email in already_contacted_emails:
+                return 'suppress'
+            if not website and not seed_email:
+                return 'skip'
+            dedupe_key = f'email:{seed_email}' if seed_email else f'site:{website.lower()}'
+            if dedupe_key in seen_targets:
+                return 'skip'
+            seen_targets.add(dedupe_key)
+            return 'ok'
+
+    def send_one(city, row):
+        seed_email = (row.get('seed_contact_email') or '').strip().lower()
+        website = clean_url(row.get('seed_contact_website', ''))
+        verdict = claim(row, website, seed_email)
+        if verdict == 'suppress':
+            suppress_duplicate(sb, row)
+            stats.add(city, 'send', 'suppressed', False, 0.0)
+            return False
+        if verdict == 'skip':
+            return False
+
+        started = time.perf_counter()
+        trace = tracer.start(row['id'])
+        with bind(trace):
+            plan = probe_candidate(probe_input(row, website), pool)
+            try:
+                send_claim = claim_send(row, plan)
+            except send_ledger.NotClaimed as e:
+                tracer.finish(trace, city=city, phase='send', status='skipped', evidence=str(e))
+                stats.add(city, 'send', 'skipped', False, time.perf_counter() - started)
+                run.count(status='skipped', city=city)
+                print(f"[{city}] {row.get('display_name','?')} -> skipped ({e})")
+                return False
+            try:
+                status, evidence, delivery_url = deliver_plan(
+                    plan, sender_name, reply_to, smtp_user, smtp_pass, smtp_host, smtp_port)
+            except send_quota.QuotaExhausted as e:
+                # Left not_contacted for a later run.
+                send_ledger.release(send_claim)
+                tracer.finish(trace, city=city, phase='send', status='deferred', evidence=str(e))
+                stats.add(city, 'send', 'deferred', False, time.perf_counter() - started)
+                run.count(status='deferred', city=city)
+                run.error('send_quota')
+                print(f"[{city}] {row.get('display_name','?')} -> deferred ({e})")
+                return False
+            send_ledger.settle(send_claim, status, evidence, delivery_url)
+            with span('db'):
+                save_result(sb, row, status, evidence, delivery_url, claimed=send_claim is not None)
+                send_ledger.finish(send_claim)
+        tracer.finish(trace, city=city, phase='send', status=status, evidence=evidence)
+
+        counted = status in COUNTED_STATUSES
+        stats.add(city, 'send', status, counted, time.perf_counter() - started)
+        run.count(status=status, channel=CHANNEL_BY_STATUS.get(status, 'contact_form'), city=city,
+                  evidence=evidence)
+        print(f"[{city}] {row.get('display_name','?')} -> {status} ({evidence})")
+        if seed_email:
+            with targets_lock:
+                already_contacted_emails.add(seed_email)
+        time.sleep(pacing)
+        return counted
+
+    run_phase('sent', queues, {c: quotas[c]['send'] for c in cities}, daily_limit, workers, send_one)
+
+    if pool:
+        pool.shutdown()
+    tracer.close()
+
+    summary = stats.summary(backlog, quotas)
+    sent = 0
+    attempted = 0
+    classified = {}
+    for city, entry in summary.items():
+        send = entry.get('send', {})
+        sent += send.get('counted', 0)
+        attempted += send.get('attempted', 0)
+        for method, n in entry.get('classify', {}).get('outcomes', {}).items():
+            classified[method] = classified.get(method, 0) + n
+        outcomes = ' '.join(f'{k}={v}' for k, v in sorted(send.get('outcomes', {}).items()))
+        print(f"{SCRIPT}: city={city} classified={entry.get('classify', {}).get('attempted', 0)} "
+              f"sent={send.get('counted', 0)}/{entry['quotas'].get('send', 0)} "
+              f"p50_ms={send.get('p50_ms', 0.0)} p95_ms={send.get('p95_ms', 0.0)} {outcomes}".rstrip())
+    if TRACE_DIR:
+        with open(os.path.join(TRACE_DIR, f'{SCRIPT}.cities.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+    print(f'{SCRIPT}: sent={sent}')
+    shadow.report(SCRIPT, attempted, sent=sent, cities=len(cities))
+    run.save(sb, tracer, sent=sent, cities=len(cities), classified=classified, reconciled=reconciled)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""Pure HTML analysis shared by the outreach classifiers and runners.
+
+analyze_page() turns one fetched page into a small, picklable dict:
+
+  {
+    'url': final page URL,
+    'emails': mailto addresses in page order (deduplicated),
+    'contact_links': up to 5 same-scheme links that look like contact pages,
+    'forms': [form descriptor, ...],
+    'builder': 'wix' | 'squarespace' | None,
+  }
+
+A form descriptor keeps only what the scripts read from the soup:
+
+  {'action', 'method', 'has_captcha', 'fields': [{'tag', 'name', 'type',
+   'id', 'placeholder', 'aria_label', 'value', 'checked', 'text'}, ...]}
+
+builder names a site builder that renders its contact forms from script,
+so the page has no <form> to submit even when the site has a form. It is
+found by plain substring search of the page head, in either parse mode.
+
+Because the result holds no soup objects, parsing can run in a
+ProcessPoolExecutor (see analyze_response) while the calling threads keep
+waiting on network I/O.
+
+OUTREACH_PARSE_MODE=selective builds only the <a> and <form> subtrees
+(everything analyze_page reads) with SoupStrainer, on lxml when it is
+installed and html.parser otherwise. The default, full, parses the whole
+document with html.parser. bench/bench_page_parse.py checks that both
+modes agree on a synthetic page corpus; real pages are not checked yet.
+"""
+
+import importlib.util
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.compat import chardet
+
+from stage_trace import span
+
+FAST_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+KEYWORDS = ('contact', 'booking', 'book', 'inquir', 'reach', 'get-in-touch')
+
+SKIP_FIELD_TYPES = ('hidden', 'submit', 'button', 'checkbox', 'radio', 'file')
+
+MESSAGE_HINTS = ('message', 'inquir', 'enquir', 'comment')
+
+# Site builders whose forms are rendered from script; markers are searched
+# for in the first BUILDER_SCAN_CHARS of the page, lowercased.
+BUILDER_MARKERS = (
+    ('wix', ('static.wixstatic.com', 'wix.com website builder', 'static.parastorage.com')),
+    ('squarespace', ('static1.squarespace.com', 'this is squarespace.', 'squarespace-cdn.com')),
+)
+
+BUILDER_SCAN_CHARS = 32 * 1024
+
+PARSE_MODE = os.getenv('OUTREACH_PARSE_MODE', 'full').strip().lower()
+
+# The only tags analyze_page looks at; forms keep all their descendants.
+ANALYZED_TAGS = SoupStrainer(['a', 'form'])
+
+
+def decode_body(content: bytes, encoding: Optional[str]) -> str:
+    """Decode a response body the way requests.Response.text does."""
+    if not content:
+        return ''
+    if encoding is None:
+        encoding = chardet.detect(content)['encoding']
+    try:
+        return str(content, encoding, errors='replace')
+    except (LookupError, TypeError):
+        return str(content, errors='replace')
+
+
+def extract_mailto(soup: BeautifulSoup):
+    out, seen = [], set()
+    for a in soup.select('a[href]'):
+        href = (a.get('href') or '').strip()
+        if not href.lower().startswith('mailto:'):
+            continue
+        addr = href.split(':', 1)[1].split('?', 1)[0].strip()
+        if not addr or '@' not in addr:
+            continue
+        key = addr.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(addr)
+    return out
+
+
+def contact_pages(base_url: str, soup: BeautifulSoup):
+    pages, seen = [], set()
+    for a in soup.select('a[href]'):
+        href = (a.get('href') or '').strip()
+        if not href or href.lower().startswith(('mailto:', 'tel:', 'javascript:')):
+            continue
+        full = urljoin(base_url, href)
+        try:
+            u = urlparse(full)
+        except Exception:
+            continue
+        if u.scheme not in ('http', 'https'):
+            continue
+        label = (u.path + ('?' + u.query if u.query else '')).lower()
+        if not any(k in label for k in KEYWORDS):
+            continue
+        norm = u._replace(fragment='').geturl()
+        if norm in seen:
+            continue
+        seen.add(norm)
+        pages.append(norm)
+        if len(pages) >= 5:
+            break
+    return pages
+
+
+def has_captcha(form_html: str) -> bool:
+    lower = form_html.lower()
+    return 'captcha' in lower or 'g-recaptcha' in lower or 'hcaptcha' in lower
+
+
+def describe_form(form) -> dict:
+    fields = []
+    for t in form.find_all(['input', 'textarea', 'select']):
+        fields.append({
+            'tag': t.name,
+            'name': t.get('name'),
+            'type': (t.get('type') or 'text').lower(),
+            'id': t.get('id'),
+            'placeholder': t.get('placeholder'),
+            'aria_label': t.get('aria-label'),
+            'value': t.get('value'),
+            'checked': t.has_attr('checked'),
+            'text': t.text if t.name == 'textarea' else None,
+        })
+    return {
+        'action': form.get('action'),
+        'method': (form.get('method') or 'post').lower(),
+        'has_captcha': has_captcha(str(form)),
+        'fields': fields,
+    }
+
+
+def page_builder(html: str) -> Optional[str]:
+    head = html[:BUILDER_SCAN_CHARS].lower()
+    for builder, markers in BUILDER_MARKERS:
+        if any(marker in head for marker in markers):
+            return builder
+    return None
+
+
+def make_soup(html: str, mode: Optional[str] = None, parser: Optional[str] = None) -> BeautifulSoup:
+    """Build the soup for analyze_page in full or selective mode.
+
+    Selective mode falls back to html.parser if the fast backend fails.
+    """
+    mode = mode or PARSE_MODE
+    if mode != 'selective':
+        return BeautifulSoup(html, 'html.parser')
+    parser = parser or FAST_PARSER
+    if parser != 'html.parser':
+        try:
+            return BeautifulSoup(html, parser, parse_only=ANALYZED_TAGS)
+        except Exception:
+            pass
+    return BeautifulSoup(html, 'html.parser', parse_only=ANALYZED_TAGS)
+
+
+def analyze_page(content, encoding: Optional[str], url: str,
+                 mode: Optional[str] = None, parser: Optional[str] = None) -> dict:
+    """Parse one page into emails, contact links and form descriptors.
+
+    content may be raw bytes (decoded here, off the I/O thread) or text.
+    """
+    html = decode_body(content, encoding) if isinstance(content, bytes) else (content or '')
+    soup = make_soup(html, mode, parser)
+    result = {
+        'url': url,
+        'emails': extract_mailto(soup),
+        'contact_links': contact_pages(url, soup),
+        'forms': [describe_form(form) for form in soup.find_all('form')],
+        'builder': page_builder(html),
+    }
+    soup.decompose()
+    return result
+
+
+def analyze_response(resp, pool: Optional[ProcessPoolExecutor] = None) -> dict:
+    """Analyze a requests.Response, in a worker process when a pool is given."""
+    with span('parse'):
+        if pool is None:
+            return analyze_page(resp.content, resp.encoding, resp.url)
+        return pool.submit(analyze_page, resp.content, resp.encoding, resp.url).result()
+
+
+def parse_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Return a ProcessPoolExecutor for workers > 0, else None (parse in-process).
+
+    workers < 0 means one process per CPU core.
+    """
+    if workers == 0:
+        return None
+    return ProcessPoolExecutor(max_workers=os.cpu_count() if workers < 0 else workers)
+
+
+# ---------------------------------------------------------------------------
+# Form descriptor helpers
+# ---------------------------------------------------------------------------
+
+def field_hay(field: dict) -> str:
+    return ' '.join([
+        (field.get('name') or '').lower(),
+        (field.get('id') or '').lower(),
+        (field.get('placeholder') or '').lower(),
+        (field.get('aria_label') or '').lower(),
+    ])
+
+
+def pick_field(form: dict, patterns, include_textarea=False) -> Optional[dict]:
+    tags = ('input', 'textarea') if include_textarea else ('input',)
+    for field in form['fields']:
+        if field['tag'] not in tags or field['type'] in SKIP_FIELD_TYPES:
+            continue
+        hay = field_hay(field)
+        if any(p in hay for p in patterns):
+            return field
+    return None
+
+
+def is_confirmable_form(form: dict) -> bool:
+    """A captcha-free form with a free-text message field."""
+    if form['has_captcha']:
+        return False
+    return pick_field(form, MESSAGE_HINTS, include_textarea=True) is not None
+
+
+def has_confirmable_form(analysis: dict) -> bool:
+    return any(is_confirmable_form(form) for form in analysis['forms'])
+
+
+def default_form_data(form: dict) -> dict:
+    """The values a browser would submit for the form as rendered."""
+    data = {}
+    for field in form['fields']:
+        n = field['name']
+        if not n:
+            continue
+        typ = field['type']
+        if typ in ('submit', 'button', 'file'):
+            continue
+        if typ in ('checkbox', 'radio'):
+            if field['checked']:
+                data[n] = field['value'] if field['value'] is not None else 'on'
+            continue
+        if field['tag'] == 'textarea':
+            data[n] = field['text'] or ''
+        else:
+            data[n] = field['value'] if field['value'] is not None else ''
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Pipeline helpers
+# ---------------------------------------------------------------------------
+
+def probe_ahead(executor, items, probe, window: int):
+    """Yield (item, probe(item)) in input order, probing up to `window` ahead.
+
+    Probes run on `executor` threads while the caller handles earlier items;
+    stopping iteration early cancels probes that have not started.
+    """
+    pending = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(probe, item)))
+            if len(pending) >= window:
+                break
+        while pending:
+            item, future = pending.popleft()
+            for nxt in items:
+                pending.append((nxt, executor.submit(probe, nxt)))
+                break
+            yield item, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,161 @@
+"""Opt-in profiling for the outreach entry points.
+
+Profiling is off unless OUTREACH_PROFILE_DIR is set (or --profile-dir for the
+scripts that take arguments). When it is, start() profiles the rest of the
+run and, at exit, writes to that directory:
+
+  <script>.prof            cProfile stats for every thread (load with pstats
+                           or snakeviz)
+  <script>.profile.txt     top functions by cumulative and by own time
+  <script>.alloc.json      allocation growth per hot stage (parse, form_submit,
+                           smtp), from tracemalloc snapshots around the first
+                           OUTREACH_PROFILE_SAMPLES (default 3) spans of each
+  <script>.alloc.txt       the same, top lines per stage
+  <script>.snapshot        tracemalloc snapshot at exit (tracemalloc.Snapshot.load)
+
+Parsing in a process pool (OUTREACH_PARSE_WORKERS) happens outside the
+profiled process; profile with the default in-process parsing.
+"""
+
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+import stage_trace
+
+PROFILE_DIR = os.getenv('OUTREACH_PROFILE_DIR', '').strip()
+
+ALLOC_STAGES = ('parse', 'form_submit', 'smtp')
+
+TOP_N = int(os.getenv('OUTREACH_PROFILE_TOP', '40'))
+
+SKIP_FILES = frozenset((
+    tracemalloc.__file__,
+    __file__,
+    '<frozen importlib._bootstrap>',
+    '<frozen importlib._bootstrap_external>',
+    '<unknown>',
+))
+
+SNAPSHOT_FILTERS = tuple(tracemalloc.Filter(False, name) for name in SKIP_FILES)
+
+
+class Profiler:
+    """cProfile on every thread plus sampled tracemalloc diffs per stage."""
+
+    def __init__(self, script: str, directory: str, samples: int):
+        self.script = script
+        self.directory = directory
+        self.samples = samples
+        self.profiles = []
+        self.allocs = {}
+        self.seen = {}
+        self._lock = threading.Lock()
+
+    def _thread_profile(self, *_):
+        # Called once at the start of each new thread; enable() replaces
+        # this hook with the profiler for that thread.
+        prof = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(prof)
+        prof.enable()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start(int(os.getenv('OUTREACH_PROFILE_FRAMES', '1')))
+        stage_trace.observe(self.stage)
+        threading.setprofile(self._thread_profile)
+        self.main = cProfile.Profile()
+        self.main.enable()
+        atexit.register(self.finish)
+
+    @contextmanager
+    def stage(self, stage: str):
+        with self._lock:
+            sample = stage in ALLOC_STAGES and self.seen.get(stage, 0) < self.samples
+            if sample:
+                self.seen[stage] = self.seen.get(stage, 0) + 1
+        if not sample:
+            yield
+            return
+        # Filtering whole snapshots is slow; drop our own frames from the diff instead.
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            diffs = [d for d in after.compare_to(before, 'lineno')
+                     if d.traceback[0].filename not in SKIP_FILES][:TOP_N]
+            with self._lock:
+                lines = self.allocs.setdefault(stage, {})
+                for diff in diffs:
+                    key = str(diff.traceback)
+                    size, count = lines.get(key, (0, 0))
+                    lines[key] = (size + diff.size_diff, count + diff.count_diff)
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f'{self.script}{suffix}')
+
+    def finish(self):
+        self.main.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(self.main)
+        for prof in self.profiles:
+            prof.create_stats()
+            if prof.stats:
+                stats.add(prof)
+        stats.dump_stats(self._path('.prof'))
+
+        out = io.StringIO()
+        report = pstats.Stats(self._path('.prof'), stream=out)
+        report.strip_dirs()
+        out.write(f'{self.script}: cProfile over {len(self.profiles) + 1} thread(s)\n')
+        report.sort_stats('cumulative').print_stats(TOP_N)
+        report.sort_stats('tottime').print_stats(TOP_N)
+
+        tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS).dump(self._path('.snapshot'))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        summary = {
+            'script': self.script,
+            'traced_current_bytes': current,
+            'traced_peak_bytes': peak,
+            'samples': self.seen,
+            'stages': {},
+        }
+        for stage, lines in self.allocs.items():
+            top = sorted(lines.items(), key=lambda kv: -abs(kv[1][0]))[:TOP_N]
+            summary['stages'][stage] = [
+                {'line': line, 'size_diff': size, 'count_diff': count} for line, (size, count) in top
+            ]
+        with open(self._path('.alloc.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        with open(self._path('.alloc.txt'), 'w', encoding='utf-8') as f:
+            f.write(f'{self.script}: traced_peak_bytes={peak} traced_current_bytes={current}\n')
+            for stage, lines in summary['stages'].items():
+                f.write(f"\n[{stage}] growth over {self.seen.get(stage, 0)} sampled span(s)\n")
+                for entry in lines:
+                    f.write(f"{entry['size_diff']:>12,} B {entry['count_diff']:>8,} blocks  {entry['line']}\n")
+
+        with open(self._path('.profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+        print(f'{self.script}: profile written to {self.directory} peak_traced_bytes={peak}')
+
+
+def start(script: str, directory: Optional[str] = None) -> Optional[Profiler]:
+    """Profile the rest of this process if a profile directory is configured."""
+    directory = directory if directory is not None else PROFILE_DIR
+    if not directory:
+        return None
+    profiler = Profiler(script, directory, int(os.getenv('OUTREACH_PROFILE_SAMPLES', '3')))
+    profiler.start()
+    return profiler
@@ -0,0 +1,100 @@
+"""One outreach_runs row per outreach script run.
+
+Each script counts its candidates as it goes (RunLog.count) and saves a
+summary row at the end (RunLog.save):
+
+  by_status / by_channel / by_city   candidates per outcome, channel and city
+  totals                             the script's own counters (sent, forwarded, ...)
+  stages                             p50/p95/max per stage, from the run's Tracer
+  errors                             tally by kind (see error_kind)
+
+so reports read a few rows per day instead of aggregating outreach_attempts.
+Stage timings come from a Tracer made with keep=True, which times the
+script's own spans (parse, form_submit, smtp, db, ...) without
+OUTREACH_TRACE_DIR; the HTTP stages (dns, connect, tls, ttfb, download) are
+only there when tracing is on.
+
+Saving is best effort: a failed insert is printed and the run carries on.
+A run that dies before the end writes no row. In shadow mode sb points at
+the shadow schema, which has its own copy of the table.
+"""
+
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+# Outcome evidence that means something went wrong, as opposed to a site
+# that simply offers no way to reach the provider.
+ERROR_EVIDENCE = ('site_unreachable', 'form_submit_request_failed', 'smtp_send_failed')
+
+
+def error_kind(evidence: Optional[str]) -> Optional[str]:
+    """The error tally key for an outcome's evidence, or None."""
+    evidence = evidence or ''
+    if re.fullmatch(r'http_5\d\d', evidence):
+        return 'http_5xx'
+    return evidence if evidence in ERROR_EVIDENCE else None
+
+
+def _add(table: dict, key: Optional[str], n: int):
+    if key:
+        table[key] = table.get(key, 0) + n
+
+
+class RunLog:
+    """Counters for one script run; thread-safe."""
+
+    def __init__(self, script: str):
+        self.script = script
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self.candidates = 0
+        self.by_status = {}
+        self.by_channel = {}
+        self.by_city = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def count(self, status: Optional[str] = None, channel: Optional[str] = None,
+              city: Optional[str] = None, evidence: Optional[str] = None, n: int = 1):
+        """Count n candidates; evidence that is an error is tallied as well."""
+        with self._lock:
+            self.candidates += n
+            _add(self.by_status, status, n)
+            _add(self.by_channel, channel, n)
+            _add(self.by_city, city, n)
+            _add(self.errors, error_kind(evidence), n)
+
+    def error(self, kind: str, n: int = 1):
+        with self._lock:
+            _add(self.errors, kind, n)
+
+    def row(self, tracer=None, **totals) -> dict:
+        finished_at = datetime.now(timezone.utc)
+        with self._lock:
+            return {
+                'script': self.script,
+                'started_at': self.started_at.isoformat(),
+                'finished_at': finished_at.isoformat(),
+                'duration_ms': round((time.monotonic() - self._started) * 1000),
+                'candidates': self.candidates,
+                'by_status': dict(self.by_status),
+                'by_channel': dict(self.by_channel),
+                'by_city': dict(self.by_city),
+                'totals': totals,
+                'stages': tracer.summary() if tracer is not None else {},
+                'errors': dict(self.errors),
+                'error_count': sum(self.errors.values()),
+            }
+
+    def save(self, sb, tracer=None, **totals):
+        """Insert the run's row; keyword arguments go into totals."""
+        if sb is None:
+            return
+        row = self.row(tracer, **totals)
+        try:
+            sb.table('outreach_runs').insert(row).execute()
+        except Exception as e:
+            print(f'run_log: save failed ({e})')
@@ -0,0 +1,180 @@
+"""Idempotency ledger for the messages sent to providers.
+
+Every message has a key: contact, sequence step (initial, day4, day10) and
+template version. A sender claims the key in outreach_send_ledger before
+contacting anyone (claim), stores the outcome as soon as it is known
+(settle) and closes the entry once the contact row and outreach_attempts
+are written (finish). A key that is already claimed or closed is never
+sent again, so reruns, retries and parallel senders contact a provider at
+most once per step and template. A send that fails before anything went
+out is released and may be claimed again.
+
+Each claim holds a lease of OUTREACH_SEND_LEASE_SECONDS (default 900). At
+start-up the senders reconcile entries whose lease ran out (reconcile):
+
+  settled    the run died between sending and writing; the stored outcome
+             is written now
+  reserved   the run died mid-send, so the message may have gone out; it
+             is written as IN_DOUBT and not sent again
+
+To contact someone again with the same template, delete their entry.
+
+Call configure(sb, script) once; without it claim() returns None and the
+other functions are no-ops. In shadow mode sb points at the shadow schema,
+which has its own copy of the table.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+LEASE_SECONDS = int(os.getenv('OUTREACH_SEND_LEASE_SECONDS', '900'))
+
+# Evidence recorded for a send that may or may not have gone out.
+IN_DOUBT = 'send_in_doubt'
+
+COLUMNS = 'key, contact_id, listing_id, step, template_version, state, token, status, evidence, delivery_url'
+
+OPEN_STATES = ['reserved', 'settled']
+
+_sb = None
+_script = None
+
+
+class NotClaimed(Exception):
+    """Another run holds or has made this send, or the ledger could not be reached."""
+
+
+def configure(sb, script: str):
+    global _sb, _script
+    _sb = sb
+    _script = script
+
+
+def send_key(contact_id: str, step: str, template_version: str) -> str:
+    return f'{contact_id}:{step}:{template_version}'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _lease() -> dict:
+    """Columns that give the calling run a fresh claim."""
+    expires = datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)
+    return {'token': str(uuid.uuid4()), 'script': _script,
+            'expires_at': expires.isoformat(), 'updated_at': _now()}
+
+
+def claim(contact_id: str, step: str, template_version: str,
+          listing_id: Optional[str] = None) -> Optional[str]:
+    """Claim a send before making it. Returns the claim token (None with the ledger off).
+
+    Raises NotClaimed when the key is held or done. An unreachable ledger
+    also raises, so nothing is sent that the ledger does not know about.
+    """
+    if _sb is None:
+        return None
+    key = send_key(contact_id, step, template_version)
+    lease = dict(_lease(), state='reserved')
+    try:
+        rows = _sb.table('outreach_send_ledger') \
+            .upsert(dict(lease, key=key, contact_id=contact_id, listing_id=listing_id,
+                         step=step, template_version=template_version),
+                    on_conflict='key', ignore_duplicates=True) \
+            .execute().data
+        if not rows:
+            # Only a released send (nothing went out) is claimed again.
+            rows = _sb.table('outreach_send_ledger') \
+                .update(lease) \
+                .eq('key', key) \
+                .eq('state', 'released') \
+                .execute().data
+    except Exception as e:
+        raise NotClaimed(f'send ledger unavailable: {e}') from e
+    if not rows:
+        raise NotClaimed(f'{step} send already claimed')
+    return lease['token']
+
+
+def _update(token: Optional[str], changes: dict, states: list) -> bool:
+    if _sb is None or not token:
+        return False
+    try:
+        rows = _sb.table('outreach_send_ledger') \
+            .update(dict(changes, updated_at=_now())) \
+            .eq('token', token) \
+            .in_('state', states) \
+            .execute().data
+    except Exception as e:
+        # The entry stays open and is reconciled once its lease runs out.
+        print(f'send_ledger: update failed ({e})')
+        return False
+    return bool(rows)
+
+
+def settle(token: Optional[str], status: str, evidence: str, delivery_url: str):
+    """Store a claimed send's outcome, before it is written anywhere else."""
+    _update(token, {'state': 'settled', 'status': status, 'evidence': evidence,
+                    'delivery_url': delivery_url}, ['reserved'])
+
+
+def finish(token: Optional[str]):
+    """Close a send whose outcome is written to outreach_contacts and outreach_attempts."""
+    _update(token, {'state': 'recorded'}, ['settled'])
+
+
+def release(token: Optional[str]):
+    """Give up a claim when nothing was sent, so a later run may send."""
+    _update(token, {'state': 'released'}, ['reserved'])
+
+
+def reconcile(steps: list, record) -> int:
+    """Write the sends that runs died before recording. Returns how many.
+
+    record(entry) writes one entry to outreach_contacts and
+    outreach_attempts; a send in doubt has status None and evidence IN_DOUBT.
+    """
+    if _sb is None:
+        return 0
+    try:
+        entries = _sb.table('outreach_send_ledger') \
+            .select(COLUMNS) \
+            .in_('step', steps) \
+            .in_('state', OPEN_STATES) \
+            .lt('expires_at', _now()) \
+            .execute().data or []
+    except Exception as e:
+        print(f'send_ledger: reconcile failed ({e})')
+        return 0
+
+    done = 0
+    for entry in entries:
+        # Take the entry over first, so two runs never record it twice.
+        lease = _lease()
+        try:
+            taken = _sb.table('outreach_send_ledger') \
+                .update(lease) \
+                .eq('key', entry['key']) \
+                .eq('token', entry['token']) \
+                .in_('state', OPEN_STATES) \
+                .lt('expires_at', _now()) \
+                .execute().data
+        except Exception as e:
+            print(f'send_ledger: reconcile failed ({e})')
+            return done
+        if not taken:
+            continue
+        if entry['state'] == 'reserved':
+            entry = dict(entry, status=None, evidence=IN_DOUBT)
+        try:
+            record(entry)
+        except Exception as e:
+            # Retried by a later run once the new lease runs out.
+            print(f"send_ledger: could not record {entry['key']} ({e})")
+            continue
+        _update(lease['token'], {'state': 'recorded', 'evidence': entry['evidence']}, OPEN_STATES)
+        print(f"send_ledger: reconciled {entry['key']} ({entry['evidence']})")
+        done += 1
+    return done
@@ -0,0 +1,93 @@
+"""Daily SMTP send quota shared by every outreach sender.
+
+Set OUTREACH_SMTP_DAILY_CAP to the provider's daily message cap to turn it
+on (default 0 = off). Each sender then reserves a slot in the
+outreach_send_quota ledger before sending through the SMTP account, commits
+it once the message is accepted and releases it if the send fails. The
+count is kept per account and UTC day, so reruns and parallel jobs of
+daily_outreach_db.py, outreach_cities.py, followup_sequence.py and
+forward_inbox.py together never go over the cap.
+
+Reservations not settled within OUTREACH_QUOTA_TTL_SECONDS (default 900)
+count as sent. Inbox forwards are recorded without being held back. The
+ledger is never used in shadow mode, whose mail goes to local sinks.
+"""
+
+import os
+from typing import Optional
+
+import shadow
+
+DAILY_CAP = int(os.getenv('OUTREACH_SMTP_DAILY_CAP', '0'))
+
+TTL_SECONDS = int(os.getenv('OUTREACH_QUOTA_TTL_SECONDS', '900'))
+
+_ledger = None
+
+
+class QuotaExhausted(Exception):
+    """No send capacity left today, or the ledger could not be reached."""
+
+
+def configure(sb, account: str, script: str):
+    """Use the ledger for this process's sends, if a cap is configured."""
+    global _ledger
+    if DAILY_CAP > 0 and sb is not None and not shadow.ENABLED:
+        _ledger = {'sb': sb, 'account': account.strip().lower(), 'script': script}
+
+
+def _reserve(force: bool):
+    return _ledger['sb'].rpc('outreach_quota_reserve', {
+        'p_account': _ledger['account'],
+        'p_cap': DAILY_CAP,
+        'p_script': _ledger['script'],
+        'p_ttl_seconds': TTL_SECONDS,
+        'p_force': force,
+    }).execute().data
+
+
+def reserve() -> Optional[str]:
+    """Reserve one send. Returns the reservation id (None with the ledger off).
+
+    Raises QuotaExhausted when the cap is reached. An unreachable ledger
+    also raises, so sends stop rather than risk going over the cap.
+    """
+    if _ledger is None:
+        return None
+    try:
+        reservation = _reserve(False)
+    except Exception as e:
+        raise QuotaExhausted(f'send quota ledger unavailable: {e}') from e
+    if not reservation:
+        raise QuotaExhausted(f"daily cap of {DAILY_CAP} reached for {_ledger['account']}")
+    return reservation
+
+
+def _settle(function: str, reservation: Optional[str]):
+    if _ledger is None or not reservation:
+        return
+    try:
+        _ledger['sb'].rpc(function, {'p_reservation': reservation}).execute()
+    except Exception as e:
+        # An unsettled reservation expires and counts as sent.
+        print(f'send_quota: {function} failed ({e})')
+
+
+def commit(reservation: Optional[str]):
+    _settle('outreach_quota_commit', reservation)
+
+
+def release(reservation: Optional[str]):
+    _settle('outreach_quota_release', reservation)
+
+
+def record():
+    """Count a send that must not be held back (inbox forwards)."""
+    if _ledger is None:
+        return
+    try:
+        reservation = _reserve(True)
+    except Exception as e:
+        print(f'send_quota: record failed ({e})')
+        return
+    commit(reservation)
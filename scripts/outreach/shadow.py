@@ -0,0 +1,122 @@
+"""Shadow mode: run the real outreach pipeline without contacting anyone.
+
+With OUTREACH_SHADOW=1, outreach_cities.py, daily_outreach_db.py and
+followup_sequence.py select candidates, probe sites, analyze forms and
+render every message exactly as in production, but:
+
+  - Supabase reads and writes go to a shadow copy: the schema named by
+    OUTREACH_SHADOW_SCHEMA (default outreach_shadow; refresh it with
+    outreach_shadow.refresh_from_public()), or a replica/staging project
+    when OUTREACH_SHADOW_SUPABASE_URL and OUTREACH_SHADOW_SUPABASE_KEY are set.
+  - Form submissions go to OUTREACH_SHADOW_FORM_SINK (a base URL; the
+    provider's host and path are appended), or are built and discarded.
+  - Email goes to OUTREACH_SHADOW_SMTP (host:port of a plain SMTP sink), or
+    is rendered and discarded.
+
+Site probes are real GETs; add OUTREACH_CASSETTE_MODE=replay to keep those
+offline too. Pacing defaults to 0, and at exit each script prints (and
+writes <script>.shadow.json to OUTREACH_TRACE_DIR, if set) its throughput
+and resource usage. bench/shadow_sinks.py runs both sinks locally.
+"""
+
+import json
+import os
+import resource
+import smtplib
+import time
+from urllib.parse import urlparse
+
+from supabase import ClientOptions, Client, create_client
+
+from stage_trace import TRACE_DIR
+
+ENABLED = os.getenv('OUTREACH_SHADOW', '').strip().lower() in ('1', 'true', 'yes')
+
+SCHEMA = os.getenv('OUTREACH_SHADOW_SCHEMA', 'outreach_shadow').strip()
+
+FORM_SINK = os.getenv('OUTREACH_SHADOW_FORM_SINK', '').strip().rstrip('/')
+
+SMTP_SINK = os.getenv('OUTREACH_SHADOW_SMTP', '').strip()
+
+STARTED = time.monotonic()
+
+
+def supabase_client(url: str, key: str) -> Client:
+    """The production client, or the shadow copy's in shadow mode."""
+    if not ENABLED:
+        return create_client(url, key)
+    replica_url = os.getenv('OUTREACH_SHADOW_SUPABASE_URL', '').strip()
+    if replica_url:
+        replica_key = os.getenv('OUTREACH_SHADOW_SUPABASE_KEY', '').strip()
+        if not replica_key:
+            raise RuntimeError('Missing required env var: OUTREACH_SHADOW_SUPABASE_KEY')
+        return create_client(replica_url, replica_key)
+    if not SCHEMA or SCHEMA == 'public':
+        raise RuntimeError('OUTREACH_SHADOW_SCHEMA must name a schema other than public')
+    return create_client(url, key, options=ClientOptions(schema=SCHEMA))
+
+
+def form_target(action_url: str):
+    """Where to send a form submission; None means build it and drop it."""
+    if not ENABLED:
+        return action_url
+    if not FORM_SINK:
+        return None
+    parsed = urlparse(action_url)
+    return f'{FORM_SINK}/{parsed.netloc}{parsed.path or "/"}'
+
+
+class NullSMTP:
+    """Stands in for smtplib.SMTP_SSL when there is no SMTP sink."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        msg.as_bytes()
+
+
+def smtp_connection(host: str, port: int, context, timeout: float = 25):
+    """SMTP_SSL to the real server, or the shadow sink in shadow mode."""
+    if not ENABLED:
+        return smtplib.SMTP_SSL(host, port, context=context, timeout=timeout)
+    if not SMTP_SINK:
+        return NullSMTP()
+    sink_host, _, sink_port = SMTP_SINK.rpartition(':')
+    return smtplib.SMTP(sink_host or 'localhost', int(sink_port), timeout=timeout)
+
+
+def report(script: str, candidates: int, **fields):
+    """Print throughput and resource usage for a shadow run."""
+    if not ENABLED:
+        return
+    elapsed = time.monotonic() - STARTED
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    summary = {
+        'script': script,
+        'candidates': candidates,
+        'seconds': round(elapsed, 2),
+        'candidates_per_min': round(candidates / elapsed * 60, 1) if elapsed else 0.0,
+        'cpu_user_s': round(own.ru_utime, 2),
+        'cpu_sys_s': round(own.ru_stime, 2),
+        'children_cpu_s': round(children.ru_utime + children.ru_stime, 2),
+        # ru_maxrss is in KiB on Linux.
+        'max_rss_mb': round(own.ru_maxrss / 1024, 1),
+        'children_max_rss_mb': round(children.ru_maxrss / 1024, 1),
+    }
+    if os.path.isdir('/proc/self/fd'):
+        summary['open_fds'] = len(os.listdir('/proc/self/fd'))
+    summary.update(fields)
+
+    print(f'{script}: shadow ' + ' '.join(f'{k}={v}' for k, v in summary.items() if k != 'script'))
+    if TRACE_DIR:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f'{script}.shadow.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
@@ -0,0 +1,322 @@
+"""Per-candidate stage timings for the outreach scripts.
+
+Tracing is off unless OUTREACH_TRACE_DIR is set. When it is, each script
+writes <dir>/<script>.jsonl with one line per candidate:
+
+  {"script": ..., "candidate": ..., "status": ..., "total_ms": ...,
+   "ms": {"dns": ..., "connect": ..., "tls": ..., "ttfb": ..., "download": ...,
+          "parse": ..., "form_submit": ..., "smtp": ..., "db" or "journal": ...},
+   "bytes": {"download": ..., "form_submit": ..., "smtp": ...}}
+
+and, at close, <dir>/<script>.rollup.json with p50/p95/max per stage.
+A Tracer made with keep=True times candidates without the directory too,
+in memory only, for the run's outreach_runs row (see run_log.py). A Tracer
+made with sample=N keeps no finished traces, only up to N timings per stage
+(a reservoir sample), so its memory stays bounded on very long runs; counts
+and max_ms stay exact and p50/p95 become estimates.
+
+Stages add up across a candidate's requests (a site visit is usually
+several pages). dns/connect/tls/ttfb/download come from traced_session()
+and cover every HTTP request, including the ones inside form_submit, so
+form_submit is the wall time of the submission and overlaps them. ttfb is
+the time from sending the request to reading the response headers.
+
+Timings go to whichever trace is bound to the current thread with bind(),
+so a candidate probed on a worker thread and delivered on the main thread
+can be traced across both.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+TRACE_DIR = os.getenv('OUTREACH_TRACE_DIR', '').strip()
+
+ENABLED = bool(TRACE_DIR)
+
+_local = threading.local()
+
+
+def current() -> Optional[dict]:
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def bind(trace: Optional[dict]):
+    """Make `trace` the target of spans on this thread for the block."""
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def add_time(stage: str, seconds: float, trace: Optional[dict] = None):
+    trace = trace or current()
+    if trace is None:
+        return
+    ms = trace['ms']
+    ms[stage] = ms.get(stage, 0.0) + seconds * 1000
+
+
+def add_bytes(stage: str, count: int, trace: Optional[dict] = None):
+    trace = trace or current()
+    if trace is None or not count:
+        return
+    counts = trace['bytes']
+    counts[stage] = counts.get(stage, 0) + count
+
+
+_observers = []
+
+
+def observe(hook):
+    """Run every span inside hook(stage) as well, e.g. for profiling."""
+    _observers.append(hook)
+
+
+@contextmanager
+def span(stage: str):
+    trace = current()
+    if trace is None and not _observers:
+        yield
+        return
+    with ExitStack() as stack:
+        for hook in _observers:
+            stack.enter_context(hook(stage))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if trace is not None:
+                add_time(stage, time.perf_counter() - start, trace)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+
+def stage_timings(trace: dict):
+    """(stage, ms) pairs of a finished trace, including its total."""
+    yield 'total', trace['total_ms']
+    yield from trace['ms'].items()
+
+
+def stage_stats(values: list, count: int, max_ms: float) -> dict:
+    values.sort()
+    return {
+        'count': count,
+        'p50_ms': round(percentile(values, 50), 1),
+        'p95_ms': round(percentile(values, 95), 1),
+        'max_ms': round(max_ms, 1),
+    }
+
+
+def rollup(traces) -> dict:
+    """p50/p95/max per stage over candidates that spent time in it."""
+    by_stage: dict = {}
+    for trace in traces:
+        for stage, ms in stage_timings(trace):
+            by_stage.setdefault(stage, []).append(ms)
+    return {stage: stage_stats(values, len(values), max(values)) for stage, values in by_stage.items()}
+
+
+class StageSample:
+    """Exact count and max plus a reservoir of at most `size` timings for one stage."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.count = 0
+        self.max_ms = 0.0
+        self.values = []
+
+    def add(self, ms: float):
+        self.count += 1
+        self.max_ms = max(self.max_ms, ms)
+        if len(self.values) < self.size:
+            self.values.append(ms)
+            return
+        slot = random.randrange(self.count)
+        if slot < self.size:
+            self.values[slot] = ms
+
+    def stats(self) -> dict:
+        return stage_stats(list(self.values), self.count, self.max_ms)
+
+
+class Tracer:
+    """Writes finished candidate traces for one script run."""
+
+    def __init__(self, script: str, directory: str = TRACE_DIR, keep: bool = False, sample: int = 0):
+        self.script = script
+        self.enabled = bool(directory) or keep
+        self.path = os.path.join(directory, f'{script}.jsonl') if directory else ''
+        self.traces = []
+        self.sample = sample
+        self.samples: dict = {}
+        self.finished = 0
+        self._lock = threading.Lock()
+        self._file = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def start(self, candidate: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        return {
+            'script': self.script,
+            'candidate': candidate,
+            'started': time.perf_counter(),
+            'ms': {},
+            'bytes': {},
+        }
+
+    def finish(self, trace: Optional[dict], **fields):
+        if trace is None:
+            return
+        started = trace.pop('started')
+        trace['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        trace['ms'] = {stage: round(ms, 1) for stage, ms in trace['ms'].items()}
+        trace.update(fields)
+        line = json.dumps(trace, sort_keys=True)
+        with self._lock:
+            self.finished += 1
+            if self.sample:
+                for stage, ms in stage_timings(trace):
+                    if stage not in self.samples:
+                        self.samples[stage] = StageSample(self.sample)
+                    self.samples[stage].add(ms)
+            else:
+                self.traces.append(trace)
+            if self._file is not None:
+                self._file.write(line + '\n')
+                self._file.flush()
+
+    def summary(self) -> dict:
+        with self._lock:
+            if self.sample:
+                return {stage: sample.stats() for stage, sample in self.samples.items()}
+            return rollup(self.traces)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        summary = self.summary()
+        with open(os.path.join(os.path.dirname(self.path), f'{self.script}.rollup.json'), 'w', encoding='utf-8') as f:
+            json.dump({'script': self.script, 'candidates': self.finished, 'stages': summary}, f, indent=2, sort_keys=True)
+        for stage, stats in sorted(summary.items()):
+            print(f"{self.script}: trace stage={stage} n={stats['count']} "
+                  f"p50_ms={stats['p50_ms']} p95_ms={stats['p95_ms']} max_ms={stats['max_ms']}")
+
+
+# ---------------------------------------------------------------------------
+# HTTP instrumentation
+# ---------------------------------------------------------------------------
+
+class _TracedConnectionMixin:
+    def _new_conn(self):
+        trace = current()
+        if trace is None:
+            return super()._new_conn()
+
+        # Resolve here so the lookup is timed on its own, then connect to
+        # each address in turn the way create_connection would.
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            add_time('dns', time.perf_counter() - start, trace)
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        add_time('dns', resolved - start, trace)
+
+        dns_host = self._dns_host
+        error = None
+        try:
+            for info in infos:
+                self._dns_host = info[4][0]
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = dns_host
+            self._connected_at = time.perf_counter()
+            add_time('connect', self._connected_at - resolved, trace)
+
+
+class TracedHTTPConnection(_TracedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        self._connected_at = None
+        super().connect()
+        trace = current()
+        if trace is not None and self._connected_at is not None:
+            add_time('tls', time.perf_counter() - self._connected_at, trace)
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracedAdapter(HTTPAdapter):
+    """Splits each request into connection stages, ttfb and download."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TracedHTTPConnectionPool,
+            'https': TracedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs):
+        trace = current()
+        if trace is None:
+            return super().send(request, stream=stream, **kwargs)
+
+        before = sum(trace['ms'].get(s, 0.0) for s in ('dns', 'connect', 'tls'))
+        start = time.perf_counter()
+        resp = super().send(request, stream=stream, **kwargs)
+        headers_at = time.perf_counter()
+        after = sum(trace['ms'].get(s, 0.0) for s in ('dns', 'connect', 'tls'))
+        add_time('ttfb', headers_at - start - (after - before) / 1000, trace)
+
+        if not stream:
+            body = resp.content
+            add_time('download', time.perf_counter() - headers_at, trace)
+            add_bytes('download', len(body), trace)
+        return resp
+
+
+def traced_session(session):
+    """Mount TracedAdapter on a requests.Session when tracing is enabled."""
+    if ENABLED:
+        adapter = TracedAdapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
@@ -0,0 +1,110 @@
+"""Append-only change journal for the CSV outreach tracker.
+
+The tracker CSV is the base snapshot; every status change made during a run
+is appended to `<tracker>.journal` as one JSON line and fsynced before the
+next attempt starts. Readers replay the journal over the base, so a crashed
+or killed run keeps every status it recorded and the next run resumes where
+it stopped. compact() folds the journal back into the CSV.
+"""
+
+import csv
+import json
+import os
+
+
+def journal_path(tracker_path: str) -> str:
+    return f'{tracker_path}.journal'
+
+
+def read_entries(path: str):
+    """Yield journal entries in order, ignoring torn lines from a crashed write."""
+    try:
+        f = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_tracker(tracker_path: str, key: str = 'listing_id'):
+    """Read the tracker CSV with its journal replayed on top.
+
+    Returns (rows, pending_entries) where pending_entries is how many journal
+    lines are not yet folded into the CSV.
+    """
+    with open(tracker_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    by_key = {r.get(key): r for r in rows}
+
+    pending = 0
+    for entry in read_entries(journal_path(tracker_path)):
+        row = by_key.get(entry.get('key'))
+        if row is not None:
+            row.update(entry.get('changes') or {})
+        pending += 1
+    return rows, pending
+
+
+def iter_tracker(tracker_path: str, key: str = 'listing_id'):
+    """Yield tracker rows with the journal replayed on top, one at a time.
+
+    Like load_tracker(), but only the journal's changes (merged per key) are
+    held in memory, never the whole CSV.
+    """
+    changes = {}
+    for entry in read_entries(journal_path(tracker_path)):
+        changes.setdefault(entry.get('key'), {}).update(entry.get('changes') or {})
+    with open(tracker_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            update = changes.get(row.get(key))
+            if update:
+                row.update(update)
+            yield row
+
+
+def open_journal(tracker_path: str):
+    path = journal_path(tracker_path)
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b'\n'
+    journal = open(path, 'a', encoding='utf-8')
+    if torn:
+        # Terminate the line a crash cut short so the next entry starts cleanly.
+        journal.write('\n')
+    return journal
+
+
+def append_change(journal, key_value: str, changes: dict) -> None:
+    """Durably record one row's changed fields before moving on."""
+    journal.write(json.dumps({'key': key_value, 'changes': changes}, ensure_ascii=False) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def compact(tracker_path: str, rows, fieldnames) -> None:
+    """Rewrite the CSV from replayed rows, then empty the journal.
+
+    The CSV is swapped in atomically; if the process dies before the journal
+    is truncated, replaying it again over the new CSV is a no-op.
+    """
+    tmp = f'{tracker_path}.tmp'
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames)
+        w.writeheader()
+        w.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, tracker_path)
+
+    with open(journal_path(tracker_path), 'w', encoding='utf-8') as f:
+        f.flush()
+        os.fsync(f.fileno())
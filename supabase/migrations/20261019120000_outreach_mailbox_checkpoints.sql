@@ -0,0 +1,19 @@
+-- Inbox forwarder checkpoint: one row per mailbox.
+-- forward_inbox.py processes only UIDs above last_uid, so new mail is found
+-- even when someone has already read it by hand. A UIDVALIDITY change means
+-- the server renumbered the mailbox and the checkpoint is rebuilt.
+
+CREATE TABLE IF NOT EXISTS outreach_mailbox_checkpoints (
+  mailbox       TEXT PRIMARY KEY,   -- IMAP login, e.g. hello@dommedirectory.com
+  uid_validity  BIGINT NOT NULL,
+  last_uid      BIGINT NOT NULL DEFAULT 0,
+  updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- RLS: only service_role touches forwarder state
+ALTER TABLE outreach_mailbox_checkpoints ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages mailbox checkpoints"
+  ON outreach_mailbox_checkpoints FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
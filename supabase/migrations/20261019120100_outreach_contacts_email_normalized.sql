@@ -0,0 +1,13 @@
+-- Normalized contact email for per-sender lookups.
+-- The inbox forwarder resolves only the senders in each mail batch with
+-- `seed_contact_email_normalized IN (...)` instead of loading the whole
+-- table; the stored column makes that filter expressible through PostgREST
+-- and indexable.
+
+ALTER TABLE outreach_contacts
+  ADD COLUMN IF NOT EXISTS seed_contact_email_normalized TEXT
+  GENERATED ALWAYS AS (lower(btrim(seed_contact_email))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_outreach_contacts_email_normalized
+  ON outreach_contacts(seed_contact_email_normalized)
+  WHERE seed_contact_email_normalized IS NOT NULL;
@@ -0,0 +1,68 @@
+-- Shadow copy of the outreach tables for load tests.
+-- With OUTREACH_SHADOW=1 the outreach scripts read and write this schema
+-- instead of public (see scripts/outreach/shadow.py). Refresh it from the
+-- live tables before each shadow run:
+--
+--   SELECT outreach_shadow.refresh_from_public();
+--
+-- LIKE ... INCLUDING ALL keeps defaults, CHECK constraints, generated
+-- columns and indexes, but not foreign keys, so listings are not copied.
+-- The schema must also be listed in the API's exposed schemas.
+
+CREATE SCHEMA IF NOT EXISTS outreach_shadow;
+
+CREATE TABLE IF NOT EXISTS outreach_shadow.outreach_contacts
+  (LIKE public.outreach_contacts INCLUDING ALL);
+
+CREATE TABLE IF NOT EXISTS outreach_shadow.outreach_attempts
+  (LIKE public.outreach_attempts INCLUDING ALL);
+
+-- RLS: only service_role touches shadow data
+ALTER TABLE outreach_shadow.outreach_contacts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outreach_shadow.outreach_attempts ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages shadow contacts"
+  ON outreach_shadow.outreach_contacts FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+CREATE POLICY "Service role manages shadow attempts"
+  ON outreach_shadow.outreach_attempts FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+-- Replace the shadow rows with the current public rows. Generated columns
+-- are skipped; they are recomputed on insert. Returns the contacts copied.
+CREATE OR REPLACE FUNCTION outreach_shadow.refresh_from_public()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+DECLARE
+  cols   TEXT;
+  copied INTEGER;
+BEGIN
+  TRUNCATE outreach_shadow.outreach_attempts, outreach_shadow.outreach_contacts;
+
+  SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+    INTO cols
+    FROM information_schema.columns
+   WHERE table_schema = 'outreach_shadow'
+     AND table_name = 'outreach_contacts'
+     AND is_generated = 'NEVER';
+
+  EXECUTE format(
+    'INSERT INTO outreach_shadow.outreach_contacts (%s) SELECT %s FROM public.outreach_contacts',
+    cols, cols
+  );
+  GET DIAGNOSTICS copied = ROW_COUNT;
+  RETURN copied;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION outreach_shadow.refresh_from_public() FROM PUBLIC, anon, authenticated;
+
+GRANT USAGE ON SCHEMA outreach_shadow TO service_role;
+GRANT ALL ON ALL TABLES IN SCHEMA outreach_shadow TO service_role;
+GRANT EXECUTE ON FUNCTION outreach_shadow.refresh_from_public() TO service_role;
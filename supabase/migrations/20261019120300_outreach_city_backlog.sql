@@ -0,0 +1,44 @@
+-- Per-city outreach backlog for the multi-city runner.
+-- outreach_cities.py calls this to find the active cities (not_contacted
+-- rows whose location, if linked, is active) and how much work each has,
+-- without reading every row through PostgREST. The outreach_shadow copy
+-- reads the shadow tables so shadow runs see the same cities.
+
+CREATE OR REPLACE FUNCTION public.outreach_city_backlog()
+RETURNS TABLE (city TEXT, unclassified BIGINT, sendable BIGINT)
+LANGUAGE sql
+STABLE
+SET search_path = ''
+AS $$
+  SELECT c.city,
+         count(*) FILTER (WHERE c.contact_method IS NULL),
+         count(*) FILTER (WHERE c.contact_method IN ('email', 'contact_form'))
+    FROM public.outreach_contacts c
+    LEFT JOIN public.locations l ON l.id = c.location_id
+   WHERE c.status = 'not_contacted'
+     AND coalesce(l.is_active, true)
+   GROUP BY c.city
+   ORDER BY c.city;
+$$;
+
+CREATE OR REPLACE FUNCTION outreach_shadow.outreach_city_backlog()
+RETURNS TABLE (city TEXT, unclassified BIGINT, sendable BIGINT)
+LANGUAGE sql
+STABLE
+SET search_path = ''
+AS $$
+  SELECT c.city,
+         count(*) FILTER (WHERE c.contact_method IS NULL),
+         count(*) FILTER (WHERE c.contact_method IN ('email', 'contact_form'))
+    FROM outreach_shadow.outreach_contacts c
+    LEFT JOIN public.locations l ON l.id = c.location_id
+   WHERE c.status = 'not_contacted'
+     AND coalesce(l.is_active, true)
+   GROUP BY c.city
+   ORDER BY c.city;
+$$;
+
+REVOKE ALL ON FUNCTION public.outreach_city_backlog() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION outreach_shadow.outreach_city_backlog() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.outreach_city_backlog() TO service_role;
+GRANT EXECUTE ON FUNCTION outreach_shadow.outreach_city_backlog() TO service_role;
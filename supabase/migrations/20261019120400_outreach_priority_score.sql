@@ -0,0 +1,137 @@
+-- Send priority for classified contacts.
+-- The senders read not_contacted rows in priority_score order, so each
+-- day's limited sends go to the contacts most likely to be delivered.
+-- The score is 100 x method weight x delivery rate x freshness:
+--   method weight  email 1.0, contact_form 0.7, anything else 0
+--   delivery rate  share of contacts with the same classification_evidence
+--                  that were delivered (or replied/claimed), smoothed toward
+--                  the overall rate with 10 pseudo-attempts
+--   freshness      halves every 30 days since classified_at, floor 0.25
+-- The classifier calls outreach_refresh_priority_scores() after each run.
+
+ALTER TABLE outreach_contacts
+  ADD COLUMN IF NOT EXISTS priority_score REAL NOT NULL DEFAULT 0;
+
+ALTER TABLE outreach_shadow.outreach_contacts
+  ADD COLUMN IF NOT EXISTS priority_score REAL NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_outreach_contacts_send_priority
+  ON outreach_contacts(priority_score DESC)
+  WHERE status = 'not_contacted' AND contact_method IN ('email', 'contact_form');
+CREATE INDEX IF NOT EXISTS idx_outreach_contacts_city_send_priority
+  ON outreach_contacts(city, priority_score DESC)
+  WHERE status = 'not_contacted' AND contact_method IN ('email', 'contact_form');
+
+CREATE INDEX IF NOT EXISTS idx_shadow_contacts_send_priority
+  ON outreach_shadow.outreach_contacts(priority_score DESC)
+  WHERE status = 'not_contacted' AND contact_method IN ('email', 'contact_form');
+CREATE INDEX IF NOT EXISTS idx_shadow_contacts_city_send_priority
+  ON outreach_shadow.outreach_contacts(city, priority_score DESC)
+  WHERE status = 'not_contacted' AND contact_method IN ('email', 'contact_form');
+
+CREATE OR REPLACE FUNCTION public.outreach_priority_score(
+  method TEXT,
+  classified_at TIMESTAMPTZ,
+  delivered BIGINT,
+  attempted BIGINT,
+  overall_rate REAL
+)
+RETURNS REAL
+LANGUAGE sql
+STABLE
+SET search_path = ''
+AS $$
+  SELECT (
+    100
+    * CASE method WHEN 'email' THEN 1.0 WHEN 'contact_form' THEN 0.7 ELSE 0 END
+    * (coalesce(delivered, 0) + 10 * overall_rate) / (coalesce(attempted, 0) + 10)
+    * greatest(0.25, power(0.5, extract(epoch FROM now() - coalesce(classified_at, now())) / 86400 / 30))
+  )::REAL;
+$$;
+
+-- Rescore every not_contacted row; returns the number of rows changed.
+CREATE OR REPLACE FUNCTION public.outreach_refresh_priority_scores()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+  changed INTEGER;
+BEGIN
+  WITH outcomes AS (
+    SELECT classification_evidence AS evidence,
+           count(*) AS attempted,
+           count(*) FILTER (
+             WHERE status IN ('delivered_email', 'delivered_form', 'replied', 'claimed') OR claimed
+           ) AS delivered
+      FROM public.outreach_contacts
+     WHERE status <> 'not_contacted'
+       AND classification_evidence IS NOT NULL
+     GROUP BY classification_evidence
+  ), overall AS (
+    SELECT coalesce(sum(delivered)::REAL / nullif(sum(attempted), 0), 0.5)::REAL AS rate
+      FROM outcomes
+  ), scored AS (
+    SELECT c.id,
+           public.outreach_priority_score(c.contact_method, c.classified_at, o.delivered, o.attempted, overall.rate) AS score
+      FROM public.outreach_contacts c
+      CROSS JOIN overall
+      LEFT JOIN outcomes o ON o.evidence = c.classification_evidence
+     WHERE c.status = 'not_contacted'
+  )
+  UPDATE public.outreach_contacts c
+     SET priority_score = s.score
+    FROM scored s
+   WHERE c.id = s.id
+     AND c.priority_score IS DISTINCT FROM s.score;
+
+  GET DIAGNOSTICS changed = ROW_COUNT;
+  RETURN changed;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION outreach_shadow.outreach_refresh_priority_scores()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+  changed INTEGER;
+BEGIN
+  WITH outcomes AS (
+    SELECT classification_evidence AS evidence,
+           count(*) AS attempted,
+           count(*) FILTER (
+             WHERE status IN ('delivered_email', 'delivered_form', 'replied', 'claimed') OR claimed
+           ) AS delivered
+      FROM outreach_shadow.outreach_contacts
+     WHERE status <> 'not_contacted'
+       AND classification_evidence IS NOT NULL
+     GROUP BY classification_evidence
+  ), overall AS (
+    SELECT coalesce(sum(delivered)::REAL / nullif(sum(attempted), 0), 0.5)::REAL AS rate
+      FROM outcomes
+  ), scored AS (
+    SELECT c.id,
+           public.outreach_priority_score(c.contact_method, c.classified_at, o.delivered, o.attempted, overall.rate) AS score
+      FROM outreach_shadow.outreach_contacts c
+      CROSS JOIN overall
+      LEFT JOIN outcomes o ON o.evidence = c.classification_evidence
+     WHERE c.status = 'not_contacted'
+  )
+  UPDATE outreach_shadow.outreach_contacts c
+     SET priority_score = s.score
+    FROM scored s
+   WHERE c.id = s.id
+     AND c.priority_score IS DISTINCT FROM s.score;
+
+  GET DIAGNOSTICS changed = ROW_COUNT;
+  RETURN changed;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.outreach_refresh_priority_scores() FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION outreach_shadow.outreach_refresh_priority_scores() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.outreach_priority_score(TEXT, TIMESTAMPTZ, BIGINT, BIGINT, REAL) TO service_role;
+GRANT EXECUTE ON FUNCTION public.outreach_refresh_priority_scores() TO service_role;
+GRANT EXECUTE ON FUNCTION outreach_shadow.outreach_refresh_priority_scores() TO service_role;
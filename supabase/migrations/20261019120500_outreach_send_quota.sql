@@ -0,0 +1,184 @@
+-- Daily send quota shared by every outreach sender.
+-- daily_outreach_db.py / outreach_cities.py, followup_sequence.py and
+-- forward_inbox.py each reserve a slot here before sending through the SMTP
+-- account, then commit it once the message is accepted or release it if the
+-- send fails. Reruns and parallel jobs therefore share one count per
+-- account and UTC day instead of each enforcing its own limit.
+-- Reservations still open past expires_at (a crashed run) are counted as
+-- sent, since the message may have gone out.
+
+CREATE TABLE IF NOT EXISTS outreach_send_quota (
+  account     TEXT NOT NULL,               -- SMTP login the provider counts against
+  day         DATE NOT NULL,               -- UTC day
+  cap         INTEGER NOT NULL,            -- cap given by the latest reservation
+  reserved    INTEGER NOT NULL DEFAULT 0,  -- slots held by open reservations
+  committed   INTEGER NOT NULL DEFAULT 0,  -- messages sent (or presumed sent)
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (account, day)
+);
+
+CREATE TABLE IF NOT EXISTS outreach_send_reservations (
+  id          UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  account     TEXT NOT NULL,
+  day         DATE NOT NULL,
+  script      TEXT NOT NULL,
+  slots       INTEGER NOT NULL DEFAULT 1,
+  state       TEXT NOT NULL DEFAULT 'reserved' CHECK (state IN (
+                'reserved', 'committed', 'released', 'expired'
+              )),
+  expires_at  TIMESTAMPTZ NOT NULL,
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  settled_at  TIMESTAMPTZ,
+  FOREIGN KEY (account, day) REFERENCES outreach_send_quota(account, day) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_outreach_send_reservations_open
+  ON outreach_send_reservations(account, day, expires_at)
+  WHERE state = 'reserved';
+
+-- RLS: only service_role touches the ledger
+ALTER TABLE outreach_send_quota ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outreach_send_reservations ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages send quota"
+  ON outreach_send_quota FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+CREATE POLICY "Service role manages send reservations"
+  ON outreach_send_reservations FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+-- Reserve p_slots for today. Returns the reservation id, or NULL when the
+-- cap would be exceeded. p_force always reserves (inbox forwards are
+-- counted but never held back). All three functions lock the day's quota
+-- row first, so concurrent senders are serialized per account.
+CREATE OR REPLACE FUNCTION public.outreach_quota_reserve(
+  p_account TEXT,
+  p_cap INTEGER,
+  p_script TEXT,
+  p_slots INTEGER DEFAULT 1,
+  p_ttl_seconds INTEGER DEFAULT 900,
+  p_force BOOLEAN DEFAULT false
+)
+RETURNS UUID
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+  v_day     DATE := (now() AT TIME ZONE 'utc')::DATE;
+  v_quota   public.outreach_send_quota%ROWTYPE;
+  v_expired INTEGER;
+  v_id      UUID;
+BEGIN
+  INSERT INTO public.outreach_send_quota (account, day, cap)
+  VALUES (p_account, v_day, p_cap)
+  ON CONFLICT (account, day) DO NOTHING;
+
+  SELECT * INTO v_quota
+    FROM public.outreach_send_quota
+   WHERE account = p_account AND day = v_day
+     FOR UPDATE;
+
+  WITH gone AS (
+    UPDATE public.outreach_send_reservations
+       SET state = 'expired', settled_at = now()
+     WHERE account = p_account AND day = v_day
+       AND state = 'reserved' AND expires_at < now()
+    RETURNING slots
+  )
+  SELECT coalesce(sum(slots), 0) INTO v_expired FROM gone;
+
+  UPDATE public.outreach_send_quota
+     SET reserved = reserved - v_expired,
+         committed = committed + v_expired,
+         cap = p_cap,
+         updated_at = now()
+   WHERE account = p_account AND day = v_day;
+
+  IF NOT p_force AND v_quota.committed + v_quota.reserved + p_slots > p_cap THEN
+    RETURN NULL;
+  END IF;
+
+  INSERT INTO public.outreach_send_reservations (account, day, script, slots, expires_at)
+  VALUES (p_account, v_day, p_script, p_slots, now() + make_interval(secs => p_ttl_seconds))
+  RETURNING id INTO v_id;
+
+  UPDATE public.outreach_send_quota
+     SET reserved = reserved + p_slots
+   WHERE account = p_account AND day = v_day;
+
+  RETURN v_id;
+END;
+$$;
+
+-- Settle an open reservation as 'committed' or 'released'. Returns false if
+-- it was already settled (e.g. expired and counted as sent).
+CREATE OR REPLACE FUNCTION public.outreach_quota_settle(p_reservation UUID, p_state TEXT)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+  v_account TEXT;
+  v_day     DATE;
+  v_slots   INTEGER;
+BEGIN
+  IF p_state NOT IN ('committed', 'released') THEN
+    RAISE EXCEPTION 'invalid reservation state: %', p_state;
+  END IF;
+
+  SELECT account, day INTO v_account, v_day
+    FROM public.outreach_send_reservations
+   WHERE id = p_reservation;
+  IF NOT FOUND THEN
+    RETURN false;
+  END IF;
+
+  PERFORM 1
+     FROM public.outreach_send_quota
+    WHERE account = v_account AND day = v_day
+      FOR UPDATE;
+
+  UPDATE public.outreach_send_reservations
+     SET state = p_state, settled_at = now()
+   WHERE id = p_reservation AND state = 'reserved'
+  RETURNING slots INTO v_slots;
+  IF NOT FOUND THEN
+    RETURN false;
+  END IF;
+
+  UPDATE public.outreach_send_quota
+     SET reserved = reserved - v_slots,
+         committed = committed + CASE WHEN p_state = 'committed' THEN v_slots ELSE 0 END,
+         updated_at = now()
+   WHERE account = v_account AND day = v_day;
+  RETURN true;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.outreach_quota_commit(p_reservation UUID)
+RETURNS BOOLEAN
+LANGUAGE sql
+SET search_path = ''
+AS $$
+  SELECT public.outreach_quota_settle(p_reservation, 'committed');
+$$;
+
+CREATE OR REPLACE FUNCTION public.outreach_quota_release(p_reservation UUID)
+RETURNS BOOLEAN
+LANGUAGE sql
+SET search_path = ''
+AS $$
+  SELECT public.outreach_quota_settle(p_reservation, 'released');
+$$;
+
+REVOKE ALL ON FUNCTION public.outreach_quota_reserve(TEXT, INTEGER, TEXT, INTEGER, INTEGER, BOOLEAN) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.outreach_quota_settle(UUID, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.outreach_quota_commit(UUID) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.outreach_quota_release(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.outreach_quota_reserve(TEXT, INTEGER, TEXT, INTEGER, INTEGER, BOOLEAN) TO service_role;
+GRANT EXECUTE ON FUNCTION public.outreach_quota_settle(UUID, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.outreach_quota_commit(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION public.outreach_quota_release(UUID) TO service_role;
@@ -0,0 +1,36 @@
+-- Per-site cache of the contact form that works (scripts/outreach/form_cache.py).
+-- The classifier notes the page where it found a confirmable form; the
+-- senders verify the entry on every delivered submission. Later sends fetch
+-- that one page and submit with the stored schema instead of crawling the
+-- site and guessing the fields again.
+
+CREATE TABLE IF NOT EXISTS outreach_form_schemas (
+  site         TEXT PRIMARY KEY,             -- host without www., plus path for sites on a shared host
+  page_url     TEXT NOT NULL,                -- page the form is on
+  framework    TEXT NOT NULL,                -- cf7 / wpforms / gravity / generic
+  endpoint     TEXT NOT NULL,                -- where the submission is sent
+  method       TEXT NOT NULL DEFAULT 'post',
+  fields       JSONB NOT NULL DEFAULT '{}'::jsonb,  -- role (name, email, message, ...) -> field name
+  extra        JSONB NOT NULL DEFAULT '{}'::jsonb,  -- fixed values sent with every submission
+  verified_at  TIMESTAMPTZ,                  -- last delivered submission; NULL = classifier only
+  failures     INTEGER NOT NULL DEFAULT 0,   -- undelivered submissions since; ignored at 2
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS outreach_shadow.outreach_form_schemas
+  (LIKE public.outreach_form_schemas INCLUDING ALL);
+
+-- RLS: only service_role touches the cache
+ALTER TABLE outreach_form_schemas ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outreach_shadow.outreach_form_schemas ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages form schemas"
+  ON outreach_form_schemas FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+CREATE POLICY "Service role manages shadow form schemas"
+  ON outreach_shadow.outreach_form_schemas FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
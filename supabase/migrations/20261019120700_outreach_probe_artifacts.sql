@@ -0,0 +1,14 @@
+-- What the classifier found on each provider's site, in a form the senders
+-- can act on (build_delivery_queues_db.py probe_artifact()):
+--   {"email": "...", "page_url": "..."}          a mailto address and where it was
+--   {"page_url": "...", "form": {form schema}}    a confirmable form (see form_frameworks.py)
+-- The senders email the address, or fetch that one page and submit the
+-- form, instead of crawling the site again. An artifact older than
+-- OUTREACH_ARTIFACT_MAX_AGE_DAYS (by classified_at), or whose page no
+-- longer has the form, is ignored and the site is crawled as before.
+
+ALTER TABLE outreach_contacts
+  ADD COLUMN IF NOT EXISTS probe_artifact JSONB;
+
+ALTER TABLE outreach_shadow.outreach_contacts
+  ADD COLUMN IF NOT EXISTS probe_artifact JSONB;
@@ -0,0 +1,82 @@
+-- Reprobe schedule for contacts classified as 'none'.
+-- build_delivery_queues_db.py sets next_probe_at when a site gives no
+-- contact method, backing off exponentially with probe_failures (the misses
+-- in a row): from 6 hours up to 7 days for unreachable sites and 5xx
+-- answers, from 14 up to 90 days when the site has no address or form.
+-- Other outcomes clear it. The classifier (and outreach_cities.py) reads
+-- unclassified rows first, then due reprobes oldest first, so CLASSIFY_LIMIT
+-- is spent on rows that may have changed rather than on every 'none' row.
+
+ALTER TABLE outreach_contacts
+  ADD COLUMN IF NOT EXISTS next_probe_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS probe_failures INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE outreach_shadow.outreach_contacts
+  ADD COLUMN IF NOT EXISTS next_probe_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS probe_failures INTEGER NOT NULL DEFAULT 0;
+
+-- Rows already classified 'none' count as one miss.
+UPDATE outreach_contacts
+   SET probe_failures = 1,
+       next_probe_at = coalesce(classified_at, now()) + CASE
+         WHEN classification_evidence = 'site_unreachable'
+           OR classification_evidence ~ '^http_5[0-9][0-9]$' THEN interval '6 hours'
+         ELSE interval '14 days'
+       END
+ WHERE status = 'not_contacted'
+   AND contact_method = 'none'
+   AND next_probe_at IS NULL
+   AND (classification_evidence IN ('site_unreachable', 'form_or_email_not_found')
+        OR classification_evidence ~ '^http_5[0-9][0-9]$'
+        OR classification_evidence LIKE 'form_builder:%');
+
+-- The classifier's query: status = 'not_contacted' AND (contact_method IS
+-- NULL OR next_probe_at <= now()) ORDER BY next_probe_at NULLS FIRST.
+CREATE INDEX IF NOT EXISTS idx_outreach_contacts_probe_due
+  ON outreach_contacts(next_probe_at NULLS FIRST)
+  WHERE status = 'not_contacted' AND (contact_method IS NULL OR next_probe_at IS NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_outreach_contacts_city_probe_due
+  ON outreach_contacts(city, next_probe_at NULLS FIRST)
+  WHERE status = 'not_contacted' AND (contact_method IS NULL OR next_probe_at IS NOT NULL);
+
+CREATE INDEX IF NOT EXISTS idx_shadow_contacts_probe_due
+  ON outreach_shadow.outreach_contacts(next_probe_at NULLS FIRST)
+  WHERE status = 'not_contacted' AND (contact_method IS NULL OR next_probe_at IS NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_shadow_contacts_city_probe_due
+  ON outreach_shadow.outreach_contacts(city, next_probe_at NULLS FIRST)
+  WHERE status = 'not_contacted' AND (contact_method IS NULL OR next_probe_at IS NOT NULL);
+
+-- 'unclassified' in the multi-city backlog now includes due reprobes.
+CREATE OR REPLACE FUNCTION public.outreach_city_backlog()
+RETURNS TABLE (city TEXT, unclassified BIGINT, sendable BIGINT)
+LANGUAGE sql
+STABLE
+SET search_path = ''
+AS $$
+  SELECT c.city,
+         count(*) FILTER (WHERE c.contact_method IS NULL OR c.next_probe_at <= now()),
+         count(*) FILTER (WHERE c.contact_method IN ('email', 'contact_form'))
+    FROM public.outreach_contacts c
+    LEFT JOIN public.locations l ON l.id = c.location_id
+   WHERE c.status = 'not_contacted'
+     AND coalesce(l.is_active, true)
+   GROUP BY c.city
+   ORDER BY c.city;
+$$;
+
+CREATE OR REPLACE FUNCTION outreach_shadow.outreach_city_backlog()
+RETURNS TABLE (city TEXT, unclassified BIGINT, sendable BIGINT)
+LANGUAGE sql
+STABLE
+SET search_path = ''
+AS $$
+  SELECT c.city,
+         count(*) FILTER (WHERE c.contact_method IS NULL OR c.next_probe_at <= now()),
+         count(*) FILTER (WHERE c.contact_method IN ('email', 'contact_form'))
+    FROM outreach_shadow.outreach_contacts c
+    LEFT JOIN public.locations l ON l.id = c.location_id
+   WHERE c.status = 'not_contacted'
+     AND coalesce(l.is_active, true)
+   GROUP BY c.city
+   ORDER BY c.city;
+$$;
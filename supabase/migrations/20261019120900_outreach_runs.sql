@@ -0,0 +1,44 @@
+-- One row per outreach script run (scripts/outreach/run_log.py).
+-- build_delivery_queues_db.py, daily_outreach_db.py, outreach_cities.py,
+-- followup_sequence.py and forward_inbox.py write their counters here at
+-- the end of each run, so daily reporting reads a handful of rows instead
+-- of aggregating outreach_attempts and outreach_contacts.
+
+CREATE TABLE IF NOT EXISTS outreach_runs (
+  id           UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  script       TEXT NOT NULL,
+  started_at   TIMESTAMPTZ NOT NULL,
+  finished_at  TIMESTAMPTZ NOT NULL,
+  duration_ms  INTEGER NOT NULL,
+  candidates   INTEGER NOT NULL DEFAULT 0,           -- rows (or messages) the run handled
+  by_status    JSONB NOT NULL DEFAULT '{}'::jsonb,  -- outcome -> candidates
+  by_channel   JSONB NOT NULL DEFAULT '{}'::jsonb,  -- email / contact_form / dm / none -> candidates
+  by_city      JSONB NOT NULL DEFAULT '{}'::jsonb,  -- city -> candidates
+  totals       JSONB NOT NULL DEFAULT '{}'::jsonb,  -- the script's own counters (sent, forwarded, ...)
+  stages       JSONB NOT NULL DEFAULT '{}'::jsonb,  -- stage -> {count, p50_ms, p95_ms, max_ms}
+  errors       JSONB NOT NULL DEFAULT '{}'::jsonb,  -- error kind -> count
+  error_count  INTEGER NOT NULL DEFAULT 0,
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_outreach_runs_script_started
+  ON outreach_runs(script, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_outreach_runs_started
+  ON outreach_runs(started_at);
+
+CREATE TABLE IF NOT EXISTS outreach_shadow.outreach_runs
+  (LIKE public.outreach_runs INCLUDING ALL);
+
+-- RLS: only service_role touches the run log
+ALTER TABLE outreach_runs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outreach_shadow.outreach_runs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages outreach runs"
+  ON outreach_runs FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+CREATE POLICY "Service role manages shadow outreach runs"
+  ON outreach_shadow.outreach_runs FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
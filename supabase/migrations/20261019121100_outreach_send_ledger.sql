@@ -0,0 +1,92 @@
+-- Idempotency ledger for the messages sent to providers
+-- (scripts/outreach/send_ledger.py). daily_outreach_db.py /
+-- outreach_cities.py and followup_sequence.py claim a key per contact,
+-- sequence step and template version here before sending, store the
+-- outcome once the message is out and close the entry after writing
+-- outreach_contacts and outreach_attempts. A claimed or closed key is
+-- never sent again, so reruns and parallel senders cannot double-send.
+-- Entries still open past expires_at (a crashed run) are reconciled by the
+-- next run: 'settled' ones have their outcome written, 'reserved' ones are
+-- recorded as in doubt rather than resent. outreach_attempts.send_key
+-- carries the entry's key, so an attempt the crashed run already wrote is
+-- not written again.
+
+CREATE TABLE IF NOT EXISTS outreach_send_ledger (
+  key               TEXT PRIMARY KEY,   -- '<contact_id>:<step>:<template_version>'
+  contact_id        UUID NOT NULL REFERENCES outreach_contacts(id) ON DELETE CASCADE,
+  listing_id        UUID,
+  step              TEXT NOT NULL,      -- 'initial', 'day4', 'day10'
+  template_version  TEXT NOT NULL,
+  state             TEXT NOT NULL DEFAULT 'reserved' CHECK (state IN (
+                      'reserved', 'settled', 'recorded', 'released'
+                    )),
+  token             UUID NOT NULL,      -- the current claim; changes on every takeover
+  script            TEXT NOT NULL,      -- script holding the claim
+  status            TEXT,               -- outcome, once settled
+  evidence          TEXT,
+  delivery_url      TEXT,
+  expires_at        TIMESTAMPTZ NOT NULL,
+  created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_outreach_send_ledger_token
+  ON outreach_send_ledger(token);
+CREATE INDEX IF NOT EXISTS idx_outreach_send_ledger_open
+  ON outreach_send_ledger(step, expires_at)
+  WHERE state IN ('reserved', 'settled');
+CREATE INDEX IF NOT EXISTS idx_outreach_send_ledger_contact
+  ON outreach_send_ledger(contact_id);
+
+ALTER TABLE outreach_attempts
+  ADD COLUMN IF NOT EXISTS send_key TEXT UNIQUE;
+ALTER TABLE outreach_shadow.outreach_attempts
+  ADD COLUMN IF NOT EXISTS send_key TEXT UNIQUE;
+
+CREATE TABLE IF NOT EXISTS outreach_shadow.outreach_send_ledger
+  (LIKE public.outreach_send_ledger INCLUDING ALL);
+
+-- RLS: only service_role touches the ledger
+ALTER TABLE outreach_send_ledger ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outreach_shadow.outreach_send_ledger ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role manages send ledger"
+  ON outreach_send_ledger FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+CREATE POLICY "Service role manages shadow send ledger"
+  ON outreach_shadow.outreach_send_ledger FOR ALL
+  USING (auth.role() = 'service_role')
+  WITH CHECK (auth.role() = 'service_role');
+
+-- A refreshed shadow copy starts with an empty ledger, or each shadow run
+-- would skip every contact the previous one sent to.
+CREATE OR REPLACE FUNCTION outreach_shadow.refresh_from_public()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+DECLARE
+  cols   TEXT;
+  copied INTEGER;
+BEGIN
+  TRUNCATE outreach_shadow.outreach_send_ledger, outreach_shadow.outreach_attempts,
+           outreach_shadow.outreach_contacts;
+
+  SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+    INTO cols
+    FROM information_schema.columns
+   WHERE table_schema = 'outreach_shadow'
+     AND table_name = 'outreach_contacts'
+     AND is_generated = 'NEVER';
+
+  EXECUTE format(
+    'INSERT INTO outreach_shadow.outreach_contacts (%s) SELECT %s FROM public.outreach_contacts',
+    cols, cols
+  );
+  GET DIAGNOSTICS copied = ROW_COUNT;
+  RETURN copied;
+END;
+$$;